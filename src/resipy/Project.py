@@ -16,19 +16,21 @@ from subprocess import PIPE, call, Popen
 import psutil
 from copy import deepcopy
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 
-# used to download the binaries
-import requests
-import hashlib
+import hashlib, json
 
 import subprocess
 import numpy as np # import default 3rd party libaries (can be downloaded from conda repositry, incl with winpython)
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.tri as tri
-import matplotlib.patches as mpatches
-import matplotlib.path as mpath
-from scipy.spatial import cKDTree
+from resipy.lazy import lazyModule, lazyObject
+# plotting, scipy and requests (to download the binaries) are imported when first used
+requests = lazyModule('requests')
+plt = lazyModule('matplotlib.pyplot')
+tri = lazyModule('matplotlib.tri')
+mpatches = lazyModule('matplotlib.patches')
+mpath = lazyModule('matplotlib.path')
+cKDTree = lazyObject('scipy.spatial', 'cKDTree')
 
 OS = platform.system()
 sys.path.append(os.path.relpath('..'))
@@ -43,10 +45,20 @@ from resipy.protocol import (dpdp1, dpdp2, wenner_alpha, wenner_beta, wenner,
                           wenner_gamma, schlum1, schlum2, multigrad)
 from resipy.SelectPoints import SelectPoints
 from resipy.saveData import (write2Res2DInv, write2csv, writeSrv)
+from resipy.parsers import protocolParser
+from resipy.resultCache import ResultCache, fileSHA1
+from resipy.cluster import JobQueue
+from resipy.meshResults import MeshResults
+from resipy.projectFile import ProjectArchive, ProjectFile, isProjectV2
+from resipy.resultCube import ResultCube, roiMask
+import resipy.halfspace as halfspace
+from resipy.launcher import exeCommand, startWineServer, stopWineServer, getMacOSVersion
+from resipy import tracing, perfmodel, batchPlot
+from resipy.tracing import traced, annotate
+from resipy.resolution import (readJacobian, readRoughness, readWeights, diagonals,
+                               estimateDiagonals)
 
 apiPath = os.path.abspath(os.path.join(os.path.abspath(__file__), '../'))
-print('API path = ', apiPath)
-print('ResIPy version = ',str(ResIPy_version))
 
 warnings.simplefilter('default', category=DeprecationWarning) # this will show the deprecation warnings
 
@@ -71,7 +83,47 @@ def checkSHA1(fname):
             sha1.update(data)
     return sha1.hexdigest()
 
-def checkExe(dirname):
+def cachedSHA1(fname, manifest):
+    """Return the SHA1 of `fname`, reusing the value stored in `manifest`
+    (dict updated in place) if the size and modification time of the file
+    did not change.
+    """
+    stat = os.stat(fname)
+    key = os.path.basename(fname)
+    entry = manifest.get(key, {})
+    if entry.get('size') != stat.st_size or entry.get('mtime') != stat.st_mtime:
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': checkSHA1(fname)}
+        manifest[key] = entry
+    return entry['sha1']
+
+def checkExe(dirname=None, download=True, dump=print):
+    """Check that the executables are present and up to date, download them
+    if not. The SHA1 of the executables is cached in 'exeHashes.json' (keyed
+    on the size and modification time of the files) so they are only hashed
+    again when modified. It is not run at import nor when creating a
+    `Project`: call `resipy.checkExe()` (done by the GUI at startup and by
+    `python -m resipy check`) or set the environment variable
+    RESIPY_CHECKEXE=1 to run it with the first `Project` created.
+    
+    Parameters
+    ----------
+    dirname : str, optional
+        Directory of the executables. Default is the 'exe' directory of the
+        package.
+    download : bool, optional
+        If False, missing or outdated executables are only reported.
+    dump : function, optional
+        Function to print the messages.
+    
+    Returns
+    -------
+    status : dict
+        Executable name: True if present and up to date.
+    """
+    if dirname is None:
+        dirname = os.path.join(apiPath, 'exe')
+    dump('API path = {:s}'.format(apiPath))
+    dump('ResIPy version = {:s}'.format(str(ResIPy_version)))
     exes = ['cR2.exe','R3t.exe','cR3t.exe']#,'R2.exe','gmsh.exe']
     hashes = ['e35f0271439761726473fa2e696d63613226b2a5',
               '44e47d7d7e7bb8e8e26be83da56819abbbfb89bc',
@@ -79,30 +131,46 @@ def checkExe(dirname):
               # '4aad36d5333ddf163c46bab9d3c2a799aa48716e',
               # '91bd6e5fcb01a11d241456479c203624d0e681ed'
               ]
+    manifestFile = os.path.join(dirname, 'exeHashes.json')
+    manifest = {}
+    if os.path.exists(manifestFile):
+        try:
+            with open(manifestFile, 'r') as f:
+                manifest = json.load(f)
+        except ValueError: # corrupted manifest
+            manifest = {}
+    status = {}
     for i, exe in enumerate(exes):
         fname = os.path.join(dirname, exe)
-        download = False
+        ok = True
         if os.path.exists(fname) is not True:
-            download = True
-            print('{:s} not found, will download it...'.format(exe), end='', flush=True)
-        else: # check if the file is up to date
-            sha1 = checkSHA1(fname)
-            if sha1 != hashes[i]:
-                download = True
-                print('{:s} needs to be updated...'.format(exe), end='', flush=True)
-        if download:
-            response = requests.get("https://gitlab.com/hkex/resipy/-/raw/master/src/resipy/exe/" + exe)
-            with open(fname, 'wb') as f:
-                f.write(response.content)
-            print('done')
-        else:
-            print('{:s} found and up to date.'.format(exe))
+            ok = False
+            dump('{:s} not found'.format(exe))
+        elif cachedSHA1(fname, manifest) != hashes[i]: # check if the file is up to date
+            ok = False
+            dump('{:s} needs to be updated'.format(exe))
+        if ok is False and download:
+            # the below fails if no internet connection so let's put it in try/except
+            try:
+                dump('downloading {:s}...'.format(exe))
+                response = requests.get("https://gitlab.com/hkex/resipy/-/raw/master/src/resipy/exe/" + exe,
+                                        timeout=60)
+                response.raise_for_status()
+                with open(fname, 'wb') as f:
+                    f.write(response.content)
+                ok = cachedSHA1(fname, manifest) == hashes[i]
+                dump('done')
+            except Exception as e:
+                dump('could not download {:s}: {:s}'.format(exe, str(e)))
+        status[exe] = ok
+    try:
+        with open(manifestFile, 'w') as f:
+            json.dump(manifest, f)
+    except OSError: # read-only installation
+        pass
+    return status
 
-# the below failed if no internet connection so let's put it in try/except                
-try:
-    checkExe(os.path.join(apiPath, 'exe'))
-except Exception as e:
-    pass
+exeChecked = False # executables are checked once per process (if RESIPY_CHECKEXE is set)
 
 
 # little class for managing multiple processes (for parallel inversion)
@@ -119,6 +187,105 @@ class ProcsManagement(object): # little class to handle the kill
             p.terminate()
         print('all done')
         
+# thread pool shared by the asynchronous methods of all Project instances
+asyncExecutor = None
+def getAsyncExecutor():
+    """Return the thread pool used by `Project.invertAsync()`,
+    `Project.forwardAsync()` and `Project.computeModelErrorAsync()` (created
+    on first use).
+    """
+    global asyncExecutor
+    if asyncExecutor is None:
+        asyncExecutor = ThreadPoolExecutor(max_workers=psutil.cpu_count())
+    return asyncExecutor
+
+def readInvError(fname, typ):
+    """Read an f###_err.dat file produced by the R* codes.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the file.
+    typ : str
+        Type of the code (R2, cR2, R3t, cR3t).
+
+    Returns
+    -------
+    cols : list of str
+        Name of the columns.
+    err : numpy.array
+        2D array of float with the values.
+    """
+    if typ == 'cR2' or typ == 'R2':
+        df = pd.read_csv(fname, sep=r'\s+')
+        cols = [c for c in ['P+','P-','C+','C-','Normalised_Error',
+                            'Observed_Phase','Calculated_Phase'] if c in df.columns]
+        return cols, df[cols].values.astype(float)
+    cols = ['sa','P+','sb','P-','sm','C+','sn','C-', 'Normalised_Error']
+    icols = [0,1,2,3,4,5,6,7,8]
+    if typ == 'cR3t': # TODO cR3t header needs to be standardized
+        cols += ['Observed_Phase', 'Calculated_Phase']
+        icols += [11,12]
+    err = np.atleast_2d(np.genfromtxt(fname, skip_header=1))
+    return cols, err[:,icols]
+
+
+def quadIndex(labels, lines, elecs):
+    """Find the row of the (line, electrode) quadrupoles corresponding to
+    each quadrupole of electrode labels (e.g. '12' or '1 12'). Quadrupoles
+    are compared as integer keys.
+
+    Parameters
+    ----------
+    labels : numpy.array
+        (n x 4) array of str, labels of A, B, M, N electrodes.
+    lines, elecs : numpy.array
+        (m x 4) arrays of int, line and electrode numbers of A, B, M, N.
+
+    Returns
+    -------
+    index : numpy.array
+        Array of int of length n with the row in `lines`/`elecs` matching
+        each row of `labels` or -1 if not found.
+    """
+    # code of each electrode, labels are only parsed once per electrode
+    ulabels, inv = np.unique(labels.astype(str), return_inverse=True)
+    ucodes = np.zeros(len(ulabels), dtype=np.int64)
+    for i, label in enumerate(ulabels):
+        sp = label.split()
+        line = int(sp[0]) if len(sp) == 2 else 0
+        ucodes[i] = line*1000000 + int(sp[-1])
+    codes = ucodes[inv].reshape(labels.shape)
+    ecodes = lines.astype(np.int64)*1000000 + elecs
+    # dense electrode numbers so the quadrupole key fits in an int64
+    allCodes = np.unique(np.r_[codes.flatten(), ecodes.flatten()])
+    n = len(allCodes)
+    def key(c):
+        d = np.searchsorted(allCodes, c)
+        return ((d[:,0]*n + d[:,1])*n + d[:,2])*n + d[:,3]
+    index = pd.Index(key(ecodes))
+    if index.has_duplicates:
+        raise ValueError('duplicated quadrupoles')
+    return index.get_indexer(key(codes))
+
+
+def procTreeRSS(pid):
+    """Return the resident memory (bytes) of a process and its children
+    (on Linux/macOS the executable runs as a child of wine).
+    """
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+    except psutil.Error: # process already finished
+        return 0
+    rss = 0
+    for p in procs:
+        try:
+            rss += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
 #%% system check
 def getSysStat():
     """Return processor speed and usage, and free RAM and usage. 
@@ -147,16 +314,6 @@ def getSysStat():
     ram_usage = ram[2]
     return cpu_speed, cpu_usage, ram_avail, ram_usage 
 
-def getMacOSVersion():
-    OpSys=platform.system()    
-    if OpSys=='Darwin':
-        versionList = platform.mac_ver()[0].split('.')
-        macVersion = float(versionList[0] + '.' + versionList[1]) # not getting patch version so xx.xx only
-        if macVersion >= 10.15:
-            return True
-        else:
-            return False
-        
 def systemCheck(dump=print):
     """Performs a simple diagnostic of the system, no input commands needed. System
     info is printed to screen, number of CPUs, memory and OS. This check is 
@@ -275,7 +432,43 @@ a compatiblity layer between unix like OS systems (ie macOS and linux) and windo
 
 def pointer(x):
     pass
-sysinfo = systemCheck(dump=pointer)
+
+class SysInfo(dict):
+    """Dictionary returned by `systemCheck()`, filled on first access (the
+    wine check starts a process so it is not run at import).
+    """
+    def _check(self):
+        if dict.__len__(self) == 0:
+            self.update(systemCheck(dump=pointer))
+    def __getitem__(self, key):
+        self._check()
+        return dict.__getitem__(self, key)
+    def __iter__(self):
+        self._check()
+        return dict.__iter__(self)
+    def __len__(self):
+        self._check()
+        return dict.__len__(self)
+    def __contains__(self, key):
+        self._check()
+        return dict.__contains__(self, key)
+    def __repr__(self):
+        self._check()
+        return dict.__repr__(self)
+    def get(self, key, default=None):
+        self._check()
+        return dict.get(self, key, default)
+    def keys(self):
+        self._check()
+        return dict.keys(self)
+    def values(self):
+        self._check()
+        return dict.values(self)
+    def items(self):
+        self._check()
+        return dict.items(self)
+
+sysinfo = SysInfo()
 
 #%% useful functions
 class cd:
@@ -310,7 +503,11 @@ class Project(object): # Project master class instanciated by the GUI
         Automatically infered when creating the survey.
     """
     def __init__(self, dirname='', typ='R2'): # initiate R2 class
+        global exeChecked
         self.apiPath = os.path.dirname(os.path.abspath(__file__)) # directory of the code
+        if exeChecked is False and os.environ.get('RESIPY_CHECKEXE', '') not in ['', '0']:
+            checkExe(os.path.join(self.apiPath, 'exe'))
+            exeChecked = True
         if dirname == '':
             dirname = os.path.join(self.apiPath)
         else:
@@ -358,6 +555,12 @@ class Project(object): # Project master class instanciated by the GUI
         self.surfaceIdx = None # used to show plan view iterations of 3D inversions
         self.darkMode = False # If true, electrodes wil be plotted in white, else black
         self.iadvanced = True # If true, use the advanced mesh format for 3D mesh
+        self.cache = None # ResultCache object if outputs of runs are cached
+        self.parallelReport = None # concurrency and memory of the last parallel run
+        self.resultCube = None # ResultCube object with the values of all steps
+        self.clipVerts = None # (key, vertices) of the last clipping polygon (see `_clipVertices()`)
+        self.modErrMeshKey = None # (mesh parameters, electrodes) of self.modErrMesh (see `computeModelError()`)
+        self.recordRuns = False # if True, runs of the executable are added to the performance history (see `predictPerformance()`)
         
         
             
@@ -821,9 +1024,117 @@ class Project(object): # Project master class instanciated by the GUI
             print("Cannot set Survey title as input is not a string")
 
 
-    def saveProject(self, fname):
+    def _projectSettings(self):
+        """Return the flags and settings of the project (JSON serializable).
+        """
+        return {'surveysInfo': self.surveysInfo,
+                'topo': self.topo.to_dict(),
+                'typ': self.typ,
+                'err': self.err,
+                'iBorehole': self.iBorehole,
+                'iTimeLapse': self.iTimeLapse,
+                'iBatch': self.iBatch,
+                'sequence': self.sequence.tolist() if self.sequence is not None else None,
+                'resist0': list(self.resist0) if self.resist0 is not None else None,
+                'iForward': self.iForward,
+                'fmd': self.fmd,
+                'zlim': self.zlim,
+                'geom_input': self.geom_input, # need to make list of array?
+                'referenceMdl': self.referenceMdl,
+                'fwdErrModel': self.fwdErrModel,
+                'custSeq': self.custSeq,
+                'errTyp': self.errTyp,
+                'surfaceIdx': self.surfaceIdx.tolist() if self.surfaceIdx is not None else None
+               }
+    
+    
+    def _projectParams(self):
+        """Return the inversion parameters of the project (JSON serializable).
+        """
+        keys = ['num_regions', 'res0File', 'num_xz_poly', 'a_wgt', 'b_wgt',
+              'lineTitle', 'job_type', 'flux_type', 'singular_type',
+              'res_matrix', 'scale', 'regions', 'patch_x', 'patch_z',
+              'inverse_type', 'target_decrease', 'qual_ratio', 'data_type',
+              'reg_mode', 'tolerance', 'max_iter', 'error_mod', 'alpha_aniso',
+              'alpha_s', 'min_error', 'rho_min', 'rho_max', 'mesh_type']
+        sparams = {}
+        for key in keys:
+            if key in self.param.keys():
+                sparams[key] = self.param[key]
+        if 'node_elec' in self.param:
+            sparams['node_elec'] = [list(self.param['node_elec'][0]),
+                                    [int(a) for a in self.param['node_elec'][1]]]
+            # int64 not JSON serializable so we convert it to int (int32)
+        if 'xz_poly_table' in self.param:
+            sparams['xz_poly_table'] = self.param['xz_poly_table'].tolist()
+        if 'xy_poly_table' in self.param:
+            sparams['xy_poly_table'] = self.param['xy_poly_table'].tolist()
+        return sparams
+    
+    
+    def _setProjectSettings(self, settings):
+        """Restore the flags and settings returned by `_projectSettings()`.
+        """
+        self.surveysInfo = settings['surveysInfo']
+        self.topo = pd.DataFrame(settings['topo'])
+        self.typ = settings['typ']
+        self.err = settings['err']
+        self.iBorehole = settings['iBorehole']
+        self.iTimeLapse = settings['iTimeLapse']
+        self.iBatch = settings['iBatch']
+        self.sequence = np.array(settings['sequence']) if settings['sequence'] is not None else None
+        self.resist0 = settings['resist0']
+        self.iForward = settings['iForward']
+        self.fmd = settings['fmd']
+        self.zlim = settings['zlim']
+        try:
+            self.geom_input = settings['geom_input'] # might failed if numpy array inside
+        except:
+            print('could not import geom_input')
+        self.referenceMdl = settings['referenceMdl']
+        self.fwdErrModel = settings['fwdErrModel']
+        self.custSeq = settings['custSeq']
+        self.errTyp = settings['errTyp']
+        self.surfaceIdx = settings['surfaceIdx']
+    
+    
+    def _setProjectParams(self, sparams):
+        """Restore the parameters returned by `_projectParams()`.
+        """
+        if 'xz_poly_table' in sparams:
+            sparams['xz_poly_table'] = np.array(sparams['xz_poly_table'])
+        if 'xy_poly_table' in sparams:
+            sparams['xy_poly_table'] = np.array(sparams['xy_poly_table'])
+        sparams['mesh'] = self.mesh
+        if 'node_elec' in sparams:
+            sparams['node_elec'][0] = np.array(sparams['node_elec'][0])
+            sparams['node_elec'][1] = np.array(sparams['node_elec'][1]).astype(int)
+        self.param = sparams
+    
+    
+    @traced
+    def saveProject(self, fname, version=2):
         """Save the current project will all dataset in custom 
         ResIPy format (.resipy) for future importation.
+        
+        Parameters
+        ----------
+        fname : str
+            Path of the project file.
+        version : int, optional
+            Version of the file format. Version 2 (default) stores typed
+            arrays (survey columns, mesh topology shared by the results,
+            attributes of all steps) and a manifest in an uncompressed zip
+            which members are memory-mapped by `loadProject()`. Version 1
+            stores csv and vtk files (pseudo 3D projects are always saved
+            in version 1).
+
+        Notes
+        -----
+        A version 2 file is written next to `fname` then renamed. On Windows
+        this fails if `fname` is the file the results of this project were
+        loaded from (it is memory-mapped): save to another file, or use
+        `appendProject()` to add new surveys and results to it.
         """
         from zipfile import ZipFile, ZipInfo
         import json
@@ -831,6 +1142,10 @@ class Project(object): # Project master class instanciated by the GUI
         if fname[-7:] != '.resipy':
             fname = fname + '.resipy'
         
+        if version == 2 and self.pseudo3DSurvey is None:
+            self._saveProjectV2(fname)
+            return
+        
         # create save directory
         name = os.path.basename(fname)
         savedir = os.path.join(self.dirname, name)
@@ -869,49 +1184,12 @@ class Project(object): # Project master class instanciated by the GUI
                     name = proj.surveys[0].name
                     proj.mesh.vtk(os.path.join(savedir, '{}-ps3d.vtk'.format(name)))
         
-        settings = {'surveysInfo': self.surveysInfo,
-                    'topo': self.topo.to_dict(),
-                    'typ': self.typ,
-                    'err': self.err,
-                    'iBorehole': self.iBorehole,
-                    'iTimeLapse': self.iTimeLapse,
-                    'iBatch': self.iBatch,
-                    'sequence': self.sequence.tolist() if self.sequence is not None else None,
-                    'resist0': list(self.resist0) if self.resist0 is not None else None,
-                    'iForward': self.iForward,
-                    'fmd': self.fmd,
-                    'zlim': self.zlim,
-                    'geom_input': self.geom_input, # need to make list of array?
-                    'referenceMdl': self.referenceMdl,
-                    'fwdErrModel': self.fwdErrModel,
-                    'custSeq': self.custSeq,
-                    'errTyp': self.errTyp,
-                    'surfaceIdx': self.surfaceIdx.tolist() if self.surfaceIdx is not None else None
-                   }
         with open(os.path.join(savedir, 'settings.json'), 'w') as f:
-            f.write(json.dumps(settings))
+            f.write(json.dumps(self._projectSettings()))
         
         # param as numpy array
-        keys = ['num_regions', 'res0File', 'num_xz_poly', 'a_wgt', 'b_wgt',
-              'lineTitle', 'job_type', 'flux_type', 'singular_type',
-              'res_matrix', 'scale', 'regions', 'patch_x', 'patch_z',
-              'inverse_type', 'target_decrease', 'qual_ratio', 'data_type',
-              'reg_mode', 'tolerance', 'max_iter', 'error_mod', 'alpha_aniso',
-              'alpha_s', 'min_error', 'rho_min', 'rho_max', 'mesh_type']
-        sparams = {}
-        for key in keys:
-            if key in self.param.keys():
-                sparams[key] = self.param[key]
-        if 'node_elec' in self.param:
-            sparams['node_elec'] = [list(self.param['node_elec'][0]),
-                                    [int(a) for a in self.param['node_elec'][1]]]
-            # int64 not JSON serializable so we convert it to int (int32)
-        if 'xz_poly_table' in self.param:
-            sparams['xz_poly_table'] = self.param['xz_poly_table'].tolist()
-        if 'xy_poly_table' in self.param:
-            sparams['xy_poly_table'] = self.param['xy_poly_table'].tolist()
         with open(os.path.join(savedir, 'params.json'), 'w') as f:
-            f.write(json.dumps(sparams))
+            f.write(json.dumps(self._projectParams()))
         
         with open(os.path.join(savedir, 'invLog.log'), 'w') as f:
             f.write(self.invLog)
@@ -926,19 +1204,147 @@ class Project(object): # Project master class instanciated by the GUI
         shutil.rmtree(savedir)
         
         # TODO maybe add a self.uiParams = {} for UI specific parameters?
-     
-        
+    
+    
+    def _saveProjectV2(self, fname):
+        """Save the project in the version 2 format (see `saveProject()`).
+        """
+        archive = ProjectArchive(fname + '.tmp')
+        manifest = {'settings': self._projectSettings(),
+                    'params': self._projectParams(),
+                    'invLog': self.invLog,
+                    'fwdLog': self.fwdLog,
+                    'elec': archive.addFrames([self.elec]) if self.elec is not None else None,
+                    'surveys': {'names': [s.name for s in self.surveys],
+                                'df': archive.addFrames([s.df for s in self.surveys]),
+                                'elec': archive.addFrames([s.elec for s in self.surveys])},
+                    'bigSurvey': None,
+                    'mesh': archive.addMesh(self.mesh) if self.mesh is not None else None,
+                    'results': archive.addResults(self.meshResults)}
+        if (self.iBatch or self.iTimeLapse) and self.bigSurvey is not None:
+            manifest['bigSurvey'] = archive.addFrames([self.bigSurvey.df])
+        archive.close(manifest)
+        try:
+            os.replace(fname + '.tmp', fname) # fname might be memory-mapped by the results
+        except PermissionError: # Windows, fname is memory-mapped
+            os.remove(fname + '.tmp')
+            raise PermissionError('{:s} is in use (results loaded from it), save the '
+                                  'project to another file or use appendProject()'.format(fname))
+    
+    
+    def appendProject(self, fname):
+        """Add the surveys and results created since `fname` was saved
+        (version 2, see `saveProject()`), e.g. new time-lapse steps. Only
+        the new steps are written, at the end of the file, so the time
+        needed does not grow with the number of steps and the file can stay
+        memory-mapped by the results loaded from it. The settings are
+        updated; parameters and mesh are not.
+
+        Parameters
+        ----------
+        fname : str
+            Path of the project file. Its surveys must be the first surveys
+            of this project.
+        """
+        if fname[-7:] != '.resipy':
+            fname = fname + '.resipy'
+        if os.path.exists(fname) is False or isProjectV2(fname) is False:
+            raise ValueError('{:s} is not a version 2 project file, use saveProject()'.format(fname))
+        pf = ProjectFile(fname)
+        names = list(pf.manifest['surveys']['names'])
+        nsteps = len(pf.manifest['results']['steps'])
+        nlog = len(pf.manifest['invLog'])
+        for update in pf.updates:
+            names += update['surveys']['names']
+            nsteps += len(update['results']['steps'])
+            nlog = update['invLogFrom'] + len(update['invLog'])
+        pf.close()
+        if names != [s.name for s in self.surveys[:len(names)]] or nsteps > len(self.meshResults):
+            raise ValueError('{:s} is not a previous state of this project, use saveProject()'.format(fname))
+        surveys = self.surveys[len(names):]
+        if len(surveys) == 0 and nsteps == len(self.meshResults) and nlog == len(self.invLog):
+            return # nothing new
+        settings = self._projectSettings()
+        settings['surveysInfo'] = self.surveysInfo[len(names):] # only the new ones
+        archive = ProjectArchive(fname, append=True)
+        update = {'settings': settings,
+                  'surveys': {'names': [s.name for s in surveys],
+                              'df': archive.addFrames([s.df for s in surveys]),
+                              'elec': archive.addFrames([s.elec for s in surveys])},
+                  'results': archive.addResults([self.meshResults[i] for i in
+                                                 range(nsteps, len(self.meshResults))]),
+                  'invLogFrom': min(nlog, len(self.invLog)),
+                  'invLog': self.invLog[min(nlog, len(self.invLog)):]}
+        archive.closeUpdate(update)
+    
+    
+    def _loadProjectV2(self, fname):
+        """Load a project saved in the version 2 format. The surveys are
+        not filtered again and their reciprocal errors are not recomputed.
+        The result meshes are read from the file when accessed.
+        """
+        pf = ProjectFile(fname)
+        manifest = pf.manifest
+        
+        # surveys
+        names = manifest['surveys']['names']
+        dfs = pf.frames(manifest['surveys']['df'])
+        elecs = pf.frames(manifest['surveys']['elec'])
+        self.surveys = [Survey(df=df, elec=elec, name=name, filtDefault=False,
+                               compRecip=False) for df, elec, name in zip(dfs, elecs, names)]
+        if manifest['bigSurvey'] is not None:
+            df = pf.frames(manifest['bigSurvey'])[0]
+            self.bigSurvey = Survey(df=df, elec=self.surveys[0].elec,
+                                    filtDefault=False, compRecip=False)
+        if manifest['elec'] is not None:
+            self.elec = pf.frames(manifest['elec'])[0]
+        
+        # mesh, flags, parameters and results
+        self.mesh = pf.mesh(manifest['mesh']) if manifest['mesh'] is not None else None
+        self._setProjectSettings(manifest['settings'])
+        self._setProjectParams(manifest['params'])
+        self.meshResults = pf.results(manifest['results'])
+        self.invLog = manifest['invLog']
+        for update in pf.updates: # appended with appendProject()
+            names = update['surveys']['names']
+            if len(names) > 0:
+                dfs = pf.frames(update['surveys']['df'])
+                elecs = pf.frames(update['surveys']['elec'])
+                self.surveys += [Survey(df=df, elec=elec, name=name, filtDefault=False,
+                                        compRecip=False) for df, elec, name in zip(dfs, elecs, names)]
+            surveysInfo = self.surveysInfo + update['settings']['surveysInfo']
+            self._setProjectSettings(update['settings'])
+            self.surveysInfo = surveysInfo
+            pf.results(update['results'], out=self.meshResults)
+            self.invLog = self.invLog[:update['invLogFrom']] + update['invLog']
+        if self.iTimeLapse and len(self.meshResults) > 0:
+            self._addResultTransforms() # for the steps added with addTimeLapseStep()
+        if self.iForward and self.mesh is not None: # needed for inverting a fwd_only project after loading
+            fwdDir = os.path.join(self.dirname, 'fwd')
+            if os.path.exists(fwdDir) is False:
+                os.mkdir(fwdDir)
+            self.mesh.vtk(os.path.join(fwdDir, 'forward_model.vtk'))
+        self.fwdLog = manifest['fwdLog']
+        pf.close()
+    
+    
+    @traced
     def loadProject(self, fname):
         """Load data from project file.
         
         Parameters
         ----------
         fname : str
-            Path where the file will be saved.
+            Path where the file will be saved. Both versions of the format
+            (see `saveProject()`) are read.
         """
         from zipfile import ZipFile, ZipInfo
         import json
         
+        if isProjectV2(fname):
+            self._loadProjectV2(fname)
+            return
+        
         # create save directory
         name = os.path.basename(fname).replace('.resipy','')
         savedir = os.path.join(self.dirname, name)
@@ -1004,48 +1410,19 @@ class Project(object): # Project master class instanciated by the GUI
         # read flags and settings
         with open(os.path.join(savedir, 'settings.json'), 'r') as f:
             settings = json.load(f)
-        self.surveysInfo = settings['surveysInfo']
-        self.topo = pd.DataFrame(settings['topo'])
-        self.typ = settings['typ']
-        self.err = settings['err']
-        self.iBorehole = settings['iBorehole']
-        self.iTimeLapse = settings['iTimeLapse']
-        self.iBatch = settings['iBatch']
-        self.sequence = np.array(settings['sequence']) if settings['sequence'] is not None else None
-        self.resist0 = settings['resist0']
-        self.iForward = settings['iForward']
+        self._setProjectSettings(settings)
         if self.iForward:
             if os.path.exists(os.path.join(savedir, 'dfseq.csv')):
                 self.importSequence(os.path.join(savedir, 'dfseq.csv'))
             shutil.copytree(savedir, os.path.join(self.dirname, 'fwd'))
             shutil.move(os.path.join(self.dirname, 'fwd', 'mesh.vtk'),# needed for inverting a fwd_only project after loading
                         os.path.join(self.dirname, 'fwd', 'forward_model.vtk'))
-        self.fmd = settings['fmd']
-        self.zlim = settings['zlim']
         if self.iForward and self.mesh is not None:
             self.meshResults = [self.mesh] + self.meshResults
-        try:
-            self.geom_input = settings['geom_input'] # might failed if numpy array inside
-        except:
-            print('could not import geom_input')
-        self.referenceMdl = settings['referenceMdl']
-        self.fwdErrModel = settings['fwdErrModel']
-        self.custSeq = settings['custSeq']
-        self.errTyp = settings['errTyp']
-        self.surfaceIdx = settings['surfaceIdx']
             
         # read parameters
         with open(os.path.join(savedir, 'params.json'), 'r') as f:
-            sparams = json.load(f)
-        if 'xz_poly_table' in sparams:
-            sparams['xz_poly_table'] = np.array(sparams['xz_poly_table'])
-        if 'xy_poly_table' in sparams:
-            sparams['xy_poly_table'] = np.array(sparams['xy_poly_table'])
-        sparams['mesh'] = self.mesh
-        if 'node_elec' in sparams:
-            sparams['node_elec'][0] = np.array(sparams['node_elec'][0])
-            sparams['node_elec'][1] = np.array(sparams['node_elec'][1]).astype(int)
-        self.param = sparams
+            self._setProjectParams(json.load(f))
         
         # pseudo 3D - must be here to take params from self
         fpseudo3D = os.path.join(savedir, 'pseudo3DSurvey')
@@ -1078,6 +1455,7 @@ class Project(object): # Project master class instanciated by the GUI
             with open(os.path.join(savedir, 'fwdLog.log'), 'r') as f:
                 self.fwdLog = f.read()
 
+    @traced
     def createSurvey(self, fname='', ftype='Syscal', info={}, spacing=None, 
                      parser=None, debug=True, **kwargs):
         """Read electrodes and quadrupoles data and return 
@@ -1103,6 +1481,7 @@ class Project(object): # Project master class instanciated by the GUI
         """
         self.surveys.append(Survey(fname, ftype, spacing=spacing, parser=parser, debug=debug, **kwargs))
         self.surveysInfo.append(info)
+        annotate(rows=self.surveys[-1].df.shape[0], ftype=ftype)
         self.setBorehole(self.iBorehole)
 
         # if all survey have magErr and phiErr then put self.err = True
@@ -1137,6 +1516,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.surveys[0].addData(**kwargs)
 
 
+    @traced
     def createBatchSurvey(self, dirname, ftype='Syscal', info={}, spacing=None,
                           parser=None, isurveys=[], dump=None, debug=False):
         """Read multiples files from a folders (sorted by alphabetical order).
@@ -1170,6 +1550,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.setBorehole(self.iBorehole)
 
 
+    @traced
     def createTimeLapseSurvey(self, dirname, ftype='Syscal', info={},
                               spacing=None, parser=None, isurveys=[],
                               dump=None, debug=False):
@@ -1251,6 +1632,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.bigSurvey.ndata = df.shape[0]
 
 
+    @traced
     def create3DSurvey(self, fname, lineSpacing=1, zigzag=False, ftype='Syscal',
                        name=None, parser=None):
         """Create a 3D survey based on 2D regularly spaced surveys.
@@ -1325,6 +1707,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.setBorehole(self.iBorehole)
 
 
+    @traced
     def createPseudo3DSurvey(self, dirname, lineSpacing=1, ftype='Syscal', parser=None, **kwargs):
         """Create a pseudo 3D survey based on 2D surveys. Multiple 2D Projects to be turned into a single pseudo 3D survey.
             THIS WILL NEED CORRECT ELECTRODE LAYOUT - DONE IN self._updatePseudo3DSurvey()
@@ -1731,6 +2114,7 @@ class Project(object): # Project master class instanciated by the GUI
         return targetProjParams
     
     
+    @traced
     def invertPseudo3D(self, invLog=None, runParallel=False, **kwargs):
         """Run pseudo3D inversions.
         
@@ -1789,22 +2173,7 @@ class Project(object): # Project master class instanciated by the GUI
                 if ncores > ncoresAvailable:
                     raise ValueError('Number of cores larger than available')
     
-            if OS == 'Windows':
-                cmd = [exePath]
-            elif OS == 'Darwin':
-                winetxt = 'wine'
-                if getMacOSVersion():
-                    winetxt = 'wine64'
-                winePath = []
-                wine_path = Popen(['which', winetxt], stdout=PIPE, shell=False, universal_newlines=True)
-                for stdout_line in iter(wine_path.stdout.readline, ''):
-                    winePath.append(stdout_line)
-                if winePath != []:
-                    cmd = ['%s' % (winePath[0].strip('\n')), exePath]
-                else:
-                    cmd = [wPath + winetxt, exePath]
-            else:
-                cmd = ['wine',exePath]
+            cmd = exeCommand(exePath)
     
             if OS == 'Windows':
                 startupinfo = subprocess.STARTUPINFO()
@@ -1943,6 +2312,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.surveys[index].showPseudoIP(vmin=vmin, vmax=vmax, ax=ax, **kwargs)
 
 
+    @traced
     def matchSurveys(self):
         """Will trim all surveys to get them ready for difference inversion
         where all datasets must have the same number of quadrupoles.
@@ -2045,6 +2415,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].filterManual(ax=ax, darkMode=self.darkMode, **kwargs)
 
 
+    @traced
     def filterDummy(self, index=-1):
         """Remove measurements where abs(a-b) != abs(m-n) (likely to be dummy
         measurements added for speed).
@@ -2090,6 +2461,7 @@ class Project(object): # Project master class instanciated by the GUI
         ax.set_title(ax.get_title().split('\n')[0])
 
 
+    @traced
     def fitErrorLin(self, index=-1, ax=None):
         """Fit a linear relationship to the resistivity data.
 
@@ -2121,6 +2493,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].fitErrorLin(ax=ax)
 
 
+    @traced
     def fitErrorPwl(self, index=-1, ax=None):
         """Fit an power law to the resistivity data.
 
@@ -2152,6 +2525,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].fitErrorPwl(ax=ax)
 
 
+    @traced
     def fitErrorLME(self, index=-1, ax=None, rpath=None, iplot=True):
         """Fit a linear mixed effect (LME) model by having the electrodes as
         as grouping variables.
@@ -2205,6 +2579,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].showErrorIP(ax=ax)
 
 
+    @traced
     def fitErrorPwlIP(self, index=-1, ax=None):
         """Plot the reciprocal phase errors with a power-law fit.
 
@@ -2236,6 +2611,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].fitErrorPwlIP(ax=ax)
 
 
+    @traced
     def fitErrorParabolaIP(self, index=-1, ax=None):
         """Plot the reciprocal phase errors with a parabola fit.
 
@@ -2317,6 +2693,7 @@ class Project(object): # Project master class instanciated by the GUI
         return totalRemoved
 
 
+    @traced
     def filterRangeIP(self, index=-1, phimin=None, phimax=None):
         """Filter IP data according to a specified range.
 
@@ -2337,6 +2714,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].filterRangeIP(phimin, phimax)
 
 
+    @traced
     def filterRecipIP(self, index=0):
         """Remove reciprocal for IP data ONLY. Additional arguments to be
         passed to :func: `~resipy.Survey.filterRecipIP`.
@@ -2352,6 +2730,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].filterRecipIP()
 
 
+    @traced
     def filterNested(self, index=-1):
         """Removes nested measurements:
         Where M or N are in between A and B.
@@ -2377,6 +2756,7 @@ class Project(object): # Project master class instanciated by the GUI
             s.addFilteredIP()
 
 
+    @traced
     def filterDCA(self, index=-1, dump=None):
         """Execute DCA filtering. Decay Curve Analysis (DCA) based on.
         Flores Orozco, A., Gallistl, J., Bücker, M., & Williams, K. H. (2017).,
@@ -2398,6 +2778,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.surveys[index].filterDCA(dump=dump)
 
 
+    @traced
     def filterElec(self, elec=[], index=-1):
         """Filter out measurements associated with specific electrodes.
 
@@ -2419,6 +2800,7 @@ class Project(object): # Project master class instanciated by the GUI
         return numRemoved
                 
 
+    @traced
     def filterRecip(self, percent=20, index=-1):
         """Filter on reciprocal errors.
 
@@ -2441,6 +2823,7 @@ class Project(object): # Project master class instanciated by the GUI
         return numRemoved
     
     
+    @traced
     def filterStack(self, percent=2, index=-1):
         """Filter on stacking (dev) errors.
 
@@ -2463,6 +2846,7 @@ class Project(object): # Project master class instanciated by the GUI
         return numRemoved
 
 
+    @traced
     def filterUnpaired(self, index=-1):
         """Remove quadrupoles that don't have reciprocals. This might
         remove dummy measurements added for sequence optimization.
@@ -2491,6 +2875,7 @@ class Project(object): # Project master class instanciated by the GUI
             s.filterNegative()
             
     
+    @traced
     def filterAppResist(self, index=-1, vmin=None, vmax=None):
         """Filter measurements by apparent resistivity for surface surveys 
         
@@ -2514,6 +2899,7 @@ class Project(object): # Project master class instanciated by the GUI
         return numRemoved
 
 
+    @traced
     def filterTransferRes(self, index=-1, vmin=None, vmax=None):
         """Filter measurements by transfer resistance. 
         
@@ -2571,6 +2957,7 @@ class Project(object): # Project master class instanciated by the GUI
         # print('Fine Mesh Depth (relative to the surface): {:.2f} m'.format(self.fmd))
 
 
+    @traced
     def createMesh(self, typ='default', buried=None, surface=None, cl_factor=2,
                    cl=-1, dump=None, res0=100, show_output=False, fmd=None,
                    remote=None, refine=0, **kwargs):
@@ -2830,6 +3217,7 @@ class Project(object): # Project master class instanciated by the GUI
                 
             self.zlim = [zlimBot, zlimTop]
         self._computePolyTable()
+        annotate(cells=self.mesh.numel, typ=typ)
         print('done ({:d} elements)'.format(self.mesh.df.shape[0]))
         
         
@@ -2879,6 +3267,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.zlim = [zlimMin, zlimMax]
         
 
+    @traced
     def importMesh(self, file_path, mesh_type=None, node_pos=None, elec=None,
                    order_nodes=True, res0=100):
         """Import mesh from .vtk / .msh / .dat, rather than having ResIPy
@@ -3032,6 +3421,7 @@ class Project(object): # Project master class instanciated by the GUI
         self.mesh = self.mesh.refine()
 
 
+    @traced
     def write2in(self, param={}):
         """Create configuration file for inversion. Write mesh.dat and res0.dat.
 
@@ -3147,6 +3537,7 @@ class Project(object): # Project master class instanciated by the GUI
             self.mesh.df['phase0'] = list(phase0)
             
 
+    @traced
     def write2protocol(self, err=None, errTot=False, fm0=None, **kwargs):
         """Write a protocol.dat file for the inversion code.
 
@@ -3290,8 +3681,10 @@ class Project(object): # Project master class instanciated by the GUI
         else:
             self.surveys[0].write2protocol(os.path.join(self.dirname, 'protocol.dat'),
                         err=err, ip=ipBool, errTot=errTot, threed=threed)
+        annotate(rows=int(np.sum([s.df.shape[0] for s in self.surveys])))
 
 
+    @traced
     def runR2(self, dirname='', dump=None):
         """Run the executable in charge of the inversion.
 
@@ -3310,49 +3703,130 @@ class Project(object): # Project master class instanciated by the GUI
         exeName = self.typ + '.exe'
         if dirname == '':
             dirname = self.dirname
+        annotate(exe=exeName, dirname=dirname)
 
         # get R2.exe path
-        with cd(dirname):
-            exePath = os.path.join(self.apiPath, 'exe', exeName)
-    
+        # the executable runs in dirname (cwd of the process) so that several
+        # projects can run at the same time in one Python process
+        dirname = os.path.abspath(dirname)
+        exePath = os.path.join(self.apiPath, 'exe', exeName)
+        
+        # check if the same run has already been done
+        if self.cache is not None:
+            key = self.cache.key(dirname, exePath)
+            if self.cache.get(key, dirname) is not None:
+                dump('Outputs retrieved from cache ({:s})\n'.format(key))
+                outFile = os.path.join(dirname, self.typ + '.out')
+                if os.path.exists(outFile): # replay the log for the UI
+                    with open(outFile, 'r') as f:
+                        for line in f:
+                            dump(line)
+                return
+            before = dict([(f, os.path.getmtime(os.path.join(dirname, f))) for f in os.listdir(dirname)
+                           if os.path.isfile(os.path.join(dirname, f))])
+
+        cmd = exeCommand(exePath)
+
+        if OS == 'Windows':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        peak = [0] # peak resident memory of the process tree
+        def sampleRSS(proc): # independent of the output of the executable
+            while proc.poll() is None:
+                peak[0] = max(peak[0], procTreeRSS(proc.pid))
+                time.sleep(0.2)
+
+        def execute(cmd):
             if OS == 'Windows':
-                cmd = [exePath]
-            elif OS == 'Darwin':
-                winetxt = 'wine'
-                if getMacOSVersion():
-                    winetxt = 'wine64'
-                winePath = []
-                wine_path = Popen(['which', winetxt], stdout=PIPE, shell=False, universal_newlines=True)#.communicate()[0]
-                for stdout_line in iter(wine_path.stdout.readline, ''):
-                    winePath.append(stdout_line)
-                if winePath != []:
-                    cmd = ['%s' % (winePath[0].strip('\n')), exePath]
-                else:
-                    cmd = [wPath + winetxt, exePath]
+                self.proc = subprocess.Popen(cmd, stdout=PIPE, shell=False, universal_newlines=True,
+                                             startupinfo=startupinfo, cwd=dirname)
             else:
-                cmd = ['wine',exePath]
-    
-            if OS == 'Windows':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    
-            def execute(cmd):
-                if OS == 'Windows':
-                    self.proc = subprocess.Popen(cmd, stdout=PIPE, shell=False, universal_newlines=True, startupinfo=startupinfo)
-                else:
-                    self.proc = subprocess.Popen(cmd, stdout=PIPE, shell=False, universal_newlines=True)
-                for stdout_line in iter(self.proc.stdout.readline, ""):
-                    yield stdout_line
-                self.proc.stdout.close()
-                return_code = self.proc.wait()
-                if return_code:
-                    print('error on return_code')
-            for text in execute(cmd):
-                dump(text)
+                self.proc = subprocess.Popen(cmd, stdout=PIPE, shell=False, universal_newlines=True,
+                                             cwd=dirname)
+            sampler = Thread(target=sampleRSS, args=(self.proc,), daemon=True)
+            sampler.start()
+            for stdout_line in iter(self.proc.stdout.readline, ""):
+                yield stdout_line
+            self.proc.stdout.close()
+            return_code = self.proc.wait()
+            sampler.join()
+            if return_code:
+                print('error on return_code')
+        t0 = time.time()
+        for text in execute(cmd):
+            dump(text)
+        
+        # history of the runs for the performance model
+        if self.proc.returncode == 0 and self.recordRuns:
+            self._recordRun(dirname, time.time() - t0, peak[0]/1e9)
+
+        # store all new or modified files in the cache
+        if self.cache is not None and self.proc.returncode == 0:
+            outputs = [f for f in os.listdir(dirname) if os.path.isfile(os.path.join(dirname, f))
+                       and (f not in before or os.path.getmtime(os.path.join(dirname, f)) != before[f])]
+            self.cache.put(key, dirname, outputs)
+
+
+    def setCache(self, dirname=None, maxSize=1000):
+        """Enable the cache of the executable outputs. Outputs of runs with
+        identical inputs (mesh, protocol, .in file, starting model and
+        executable) are then retrieved from the cache instead of running the
+        executable again. The cache can be shared between projects.
+
+        Parameters
+        ----------
+        dirname : str, optional
+            Directory of the cache. Default is `~/.resipy/cache`.
+        maxSize : float, optional
+            Maximum size of the cache in Mb. Least recently used outputs
+            are removed first once the size is exceeded.
+        """
+        self.cache = ResultCache(dirname=dirname, maxSize=maxSize)
+
+
+    def clearCache(self):
+        """Remove all outputs stored in the cache.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+
+
+    def setWineServer(self, persistent=True, delay=600):
+        """Keep a wineserver alive between the runs of the executables
+        (Linux and macOS only). Each run then skips the start of wine's server
+        which is significant for many small inversions.
+
+        Parameters
+        ----------
+        persistent : bool, optional
+            If `True`, start a persistent wineserver, if `False` stop it.
+        delay : int, optional
+            Number of seconds the server stays alive after the last run. If
+            None, it stays alive until stopped.
+        """
+        if persistent:
+            if startWineServer(delay=delay) is False:
+                print('No persistent wineserver could be started.')
+        else:
+            stopWineServer()
+
+
+    @traced
+    def _surveyElecNodes(self, survey):
+        """Mesh nodes of the electrodes of `survey` as written in the .in
+        file (1-based), when the electrodes move between surveys.
+        """
+        elec = survey.elec[['x','y','z']].values
+        e_nodes = self.mesh.moveElecNodes(elec[:,0], elec[:,1], elec[:,2])
+        if int(self.mesh.cell_type[0])==8 or int(self.mesh.cell_type[0])==9:#elements are quads
+            return self.mesh.quadMeshNp() # so find x column indexes instead. Wont support change in electrode elevation
+        return e_nodes + 1 # WE MUST ADD ONE due indexing differences between python and fortran
 
 
     def runParallel(self, dirname=None, dump=None, iMoveElec=False,
-                    ncores=None, rmDirTree=True):
+                    ncores=None, rmDirTree=True, callback=None,
+                    backend='local', queueDir=None):
         """Run several instances of R2 in parallel according to the number of
         cores available.
 
@@ -3368,13 +3842,34 @@ class Project(object): # Project master class instanciated by the GUI
             `Survey` object.
         ncores : int, optional
             Number or cores to use. If None, the maximum number of cores
-            available will be used.
+            available will be used. The number of inversions running at the
+            same time is also limited by the memory available and the memory
+            needed per inversion (see `Project._estimateMemory()`). The chosen
+            concurrency and the peak memory used by each inversion are
+            stored in `Project.parallelReport`.
         rmDirTree: bool, optional
             Remove excess directories and files created during parallel.
             Default is True.
+        callback : function, optional
+            Function called with the index of the survey as soon as its
+            inversion is finished and its outputs (f001_res.vtk, ...) are
+            available in the working directory.
+        backend : str, optional
+            'local' (default) runs the inversions on this machine. 'cluster'
+            pushes each inversion as a self-contained job in `queueDir` from
+            which worker processes, possibly on other machines, pick them up.
+            Workers are started with `python -m resipy.cluster queueDir` (or
+            `resipy.cluster.startLocalWorkers()`). See `resipy.cluster`.
+        queueDir : str, optional
+            Path of the job queue for `backend='cluster'`. Must be on a
+            filesystem shared by the workers.
         """
         if dirname is None:
             dirname = self.dirname
+        if backend not in ['local', 'cluster']:
+            raise ValueError('backend must be either "local" or "cluster"')
+        if backend == 'cluster' and queueDir is None:
+            raise ValueError('queueDir must be specified for backend="cluster"')
             
         if dump is None:
             def dump(x):
@@ -3417,12 +3912,7 @@ class Project(object): # Project master class instanciated by the GUI
             dump('Electrodes position will be updated for each survey\n')
             for s in self.surveys:
                 # print(s.name, '...', end='')
-                elec = s.elec[['x','y','z']].values
-                e_nodes = self.mesh.moveElecNodes(elec[:,0], elec[:,1], elec[:,2])
-                self.param['node_elec'][1] = e_nodes + 1 # WE MUST ADD ONE due indexing differences between python and fortran
-                if int(self.mesh.cell_type[0])==8 or int(self.mesh.cell_type[0])==9:#elements are quads
-                    colx = self.mesh.quadMeshNp() # so find x column indexes instead. Wont support change in electrode elevation
-                    self.param['node_elec'][1] = colx
+                self.param['node_elec'][1] = self._surveyElecNodes(s)
                 self.param['inverse_type'] = 1 # regularise against a background model
                 #self.param['reg_mode'] = 1
                 write2in(self.param, self.dirname, self.typ)
@@ -3431,13 +3921,27 @@ class Project(object): # Project master class instanciated by the GUI
                 # print('done')
 
         # create workers directory
-        ncoresAvailable = systemCheck()['core_count']
-        if ncores is None: # and self.ncores is None:
-            ncores = ncoresAvailable
-        else:
-            if ncores > ncoresAvailable:
-                raise ValueError('Number of cores larger than available')
-        dump('Using %i logical processors'%ncores)
+        if backend == 'local':
+            ncoresAvailable = systemCheck()['core_count']
+            if ncores is None: # and self.ncores is None:
+                ncores = ncoresAvailable
+            else:
+                if ncores > ncoresAvailable:
+                    raise ValueError('Number of cores larger than available')
+            dump('Using %i logical processors'%ncores)
+
+            # the number of concurrent runs is also limited by the RAM
+            jobMem = self._estimateMemory(dump=lambda x: None)*1e9 # bytes
+            availMem = psutil.virtual_memory().available
+            nmem = ncores if jobMem == 0 else max(1, int(availMem//jobMem))
+            if nmem < ncores:
+                dump(' but only {:d} concurrent inversions fit in the available'
+                     ' memory ({:.2f} Gb each, {:.2f} Gb available)'.format(
+                         nmem, jobMem/1e9, availMem/1e9) + '\n')
+            self.parallelReport = {'ncores': ncores,
+                                   'concurrency': min(ncores, nmem),
+                                   'jobMemory': jobMem/1e9,
+                                   'peakRSS': {}}
 
 
         def prepare(wd, fname):
@@ -3458,22 +3962,7 @@ class Project(object): # Project master class instanciated by the GUI
                                         self.typ + '_' + name + '.in')
                 shutil.copy(r2inFile, os.path.join(wd, self.typ + '.in'))
 
-        if OS == 'Windows':
-            cmd = [exePath]
-        elif OS == 'Darwin':
-            winetxt = 'wine'
-            if getMacOSVersion():
-                winetxt = 'wine64'
-            winePath = []
-            wine_path = Popen(['which', winetxt], stdout=PIPE, shell=False, universal_newlines=True)#.communicate()[0]
-            for stdout_line in iter(wine_path.stdout.readline, ''):
-                winePath.append(stdout_line)
-            if winePath != []:
-                cmd = ['%s' % (winePath[0].strip('\n')), exePath]
-            else:
-                cmd = [wPath + winetxt, exePath]
-        else:
-            cmd = ['wine',exePath]
+        cmd = exeCommand(exePath)
 
         if OS == 'Windows':
             startupinfo = subprocess.STARTUPINFO()
@@ -3527,10 +4016,59 @@ class Project(object): # Project master class instanciated by the GUI
         def done(p):
             return p.poll() is not None
 
+        # get the files as it was a sequential inversion
+        # TODO should now be consistent
+        # if self.typ=='R3t' or self.typ=='cR3t':
+            # toRename = ['.dat', '.vtk', '.err', '.sen', '_diffres.dat']
+        # else:
+        toRename = ['_res.dat', '_res.vtk', '_err.dat', '_sen.dat', '_diffres.dat']
+        finished = []
+        def finish(i):
+            # retrieve the outputs of a finished inversion so they are
+            # available before the other inversions are done
+            finished.append(i)
+            try:
+                retrieve(wds2[i], files[i])
+            except Exception as e:
+                print('Error retrieving for ', wds2[i], ':', e)
+                pass
+            for ext in toRename:
+                originalFile = os.path.join(dirname,  surveys[i].name + ext)
+                newFile = os.path.join(dirname, 'f' + str(i+1).zfill(3) + ext)
+                if os.path.exists(originalFile):
+                    shutil.move(originalFile, newFile)
+            if callback is not None and self.irunParallel2:
+                callback(i)
+
+        def memoryAvailable():
+            # memory still to be claimed by the running jobs is reserved
+            reserved = sum([max(jobMem - rss[p], 0) for p in self.procs])
+            return psutil.virtual_memory().available - reserved >= jobMem
+
         c = 0
+        procIndex = {} # index of the survey inverted by each process
+        rss = {} # peak resident memory of each process
         dump('\r{:.0f}/{:.0f} inversions completed'.format(c, len(wds2)))
-        while self.irunParallel2:
+        if backend == 'cluster':
+            queue = JobQueue(queueDir)
+            jobIds = [queue.submit(wd, exeName) for wd in wds2]
+            dump('\n{:d} jobs submitted to {:s}\n'.format(len(jobIds), queue.dirname))
+            while self.irunParallel2 and len(finished) < len(wds2):
+                queue.requeueStale() # jobs of dead workers
+                for i, jobId in enumerate(jobIds):
+                    if i not in finished and queue.status(jobId) in ['done', 'failed']:
+                        queue.fetch(jobId, wds2[i])
+                        c = c+1
+                        finish(i)
+                        dump('\r{:.0f}/{:.0f} inversions completed'.format(c, len(wds2)))
+                time.sleep(0.2)
+            for jobId in jobIds: # killed before the end
+                queue.cancel(jobId)
+            dump('\n')
+        while self.irunParallel2 and backend == 'local':
             while wds and len(self.procs) < ncores:
+                if len(self.procs) > 0 and not memoryAvailable():
+                    break # wait for a job to finish
                 wd = wds.pop()
 #                print('task', wd)
                 if OS == 'Windows':
@@ -3538,46 +4076,45 @@ class Project(object): # Project master class instanciated by the GUI
                 else:
                     p = Popen(cmd, cwd=wd, stdout=PIPE, shell=False, universal_newlines=True)
                 self.procs.append(p)
+                procIndex[p] = wds2.index(wd)
+                rss[p] = 0
 #                t = Thread(target=dumpOutput, args=(p.stdout,))
 #                t.daemon = True # thread dies with the program
 #                t.start()
 #                ts.append(t)
 
+            for p in self.procs:
+                rss[p] = max(rss[p], procTreeRSS(p.pid))
             for p in self.procs:
                 if done(p):
                     self.procs.remove(p)
                     c = c+1
+                    name = surveys[procIndex[p]].name
+                    self.parallelReport['peakRSS'][name] = rss[p]/1e9
+                    finish(procIndex[p])
                     # TODO get RMS and iteration number here ?
                     dump('\r{:.0f}/{:.0f} inversions completed'.format(c, len(wds2)))
 
             if not self.procs and not wds:
                 dump('\n')
+                if len(rss) > 0:
+                    dump('Concurrency: {:d} inversions, peak memory per inversion: '
+                         '{:.3f} Gb (estimated {:.3f} Gb)\n'.format(
+                             self.parallelReport['concurrency'],
+                             max(rss.values())/1e9, jobMem/1e9))
                 break
             else:
                 time.sleep(0.05)
+        
+        for i in range(len(wds2)): # killed inversions
+            if i not in finished:
+                finish(i)
 
-        for wd, f in zip(wds2, files):
-            try:
-                retrieve(wd, f)
-            except Exception as e:
-                print('Error retrieving for ', wd, ':', e)
-                pass
-
-
-        # get the files as it was a sequential inversion
-        # TODO should now be consistent
-        # if self.typ=='R3t' or self.typ=='cR3t':
-            # toRename = ['.dat', '.vtk', '.err', '.sen', '_diffres.dat']
-        # else:
-        toRename = ['_res.dat', '_res.vtk', '_err.dat', '_sen.dat', '_diffres.dat']
         r2outText = ''
         for i, s in enumerate(surveys):
-            for ext in toRename:
-                originalFile = os.path.join(dirname,  s.name + ext)
-                newFile = os.path.join(dirname, 'f' + str(i+1).zfill(3) + ext)
-                if os.path.exists(originalFile):
-                    shutil.move(originalFile, newFile)
             r2outFile = os.path.join(dirname, self.typ + '_' + s.name + '.out')
+            if os.path.exists(r2outFile) is False: # cancelled job
+                continue
             with open(r2outFile, 'r') as f:
                 r2outText = r2outText + f.read()
             os.remove(r2outFile)
@@ -3603,9 +4140,11 @@ class Project(object): # Project master class instanciated by the GUI
 
 
 
+    @traced
     def invert(self, param={}, iplot=False, dump=None, modErr=False,
                parallel=False, iMoveElec=False, ncores=None,
-               rmDirTree=True, modelDOI=False):
+               rmDirTree=True, modelDOI=False, callback=None, backend='local',
+               queueDir=None):
         """Invert the data, first generate R2.in file, then run
         inversion using appropriate wrapper, then return results.
 
@@ -3638,7 +4177,18 @@ class Project(object): # Project master class instanciated by the GUI
         modelDOI : bool, optional
             If `True`, the Depth of Investigation will be model by reinverting
             the data on with an initial res0 different of an order of magnitude.
-            Note that this option is only available for *single* survey.
+            If `parallel==True`, the DOI is computed for each survey (all
+            inversions running in parallel), otherwise only for the first
+            survey.
+        callback : function, optional
+            If `parallel==True`, function called with the index of each
+            survey as soon as its inversion is finished. See
+            `Project.runParallel()`.
+        backend : str, optional
+            If `parallel==True`, 'local' or 'cluster'. See
+            `Project.runParallel()`.
+        queueDir : str, optional
+            Path of the shared job queue if `backend=='cluster'`.
         """
         if dump is None:
             def dump(x):
@@ -3650,6 +4200,7 @@ class Project(object): # Project master class instanciated by the GUI
         # create mesh if not already done
         if 'mesh' not in self.param:
             self.createMesh()
+        annotate(surveys=len(self.surveys), cells=self.mesh.numel)
             
         # clean previous iterations
         for f in os.listdir(self.dirname):
@@ -3658,7 +4209,8 @@ class Project(object): # Project master class instanciated by the GUI
             
         # run Oldenburg and Li DOI estimation
         if modelDOI is True:
-            sensScaled = self.modelDOI(dump=dump)
+            sensScaled = self.modelDOI(dump=dump, allSurveys=parallel, ncores=ncores,
+                                       iMoveElec=iMoveElec)
 
         # compute modelling error if selected
         if modErr is True and self.fwdErrModel is False: #check no error model exists
@@ -3701,13 +4253,16 @@ class Project(object): # Project master class instanciated by the GUI
                 fm0 = self.surveys[0].df['resist'].values.copy()
                 self.sequence = None
                 self.surveys = surveysBackup
+                self.surveys[0].df['fm0'] = fm0 # for the steps added later
                 self.write2protocol(errTot=errTot, fm0=fm0) # rewrite them with d-d0+f(m0)
         elif self.iTimeLapse == True and self.referenceMdl==True:
             print('Note: Skipping reference inversion, as reference model has already been assigned')
 
         dump('\n--------------------- MAIN INVERSION ------------------\n')
         if parallel is True and (self.iTimeLapse is True or self.iBatch is True):
-            self.runParallel(dump=dump, iMoveElec=iMoveElec, ncores=ncores, rmDirTree=rmDirTree)
+            self.runParallel(dump=dump, iMoveElec=iMoveElec, ncores=ncores,
+                             rmDirTree=rmDirTree, callback=callback,
+                             backend=backend, queueDir=queueDir)
         else:
             self.runR2(dump=dump)
             
@@ -3716,9 +4271,6 @@ class Project(object): # Project master class instanciated by the GUI
             # created by R2 but before it is populated (when killing the run)
             self.getInvError()
             self.getResults()
-            if modelDOI is True:
-                for m in self.meshResults:
-                    m.df['doiSens'] = sensScaled
             
             # read final R2.out
             with open(os.path.join(self.dirname, self.typ + '.out'),'r') as f:
@@ -3729,6 +4281,18 @@ class Project(object): # Project master class instanciated by the GUI
             print('Error: ', e)
             return
 
+        if modelDOI is True:
+            if parallel and len(sensScaled) != len(self.meshResults):
+                raise ValueError('DOI computed for {:d} surveys but {:d} results found'.format(
+                    len(sensScaled), len(self.meshResults)))
+            def addDOI(m, i): # one DOI per survey if computed in parallel
+                m.df['doiSens'] = sensScaled[i] if parallel else sensScaled
+            if isinstance(self.meshResults, MeshResults):
+                self.meshResults.addTransform(addDOI)
+            else:
+                for i, m in enumerate(self.meshResults):
+                    addDOI(m, i)
+
         if iplot is True:
             if self.iForward:
                 self.showResults(index=1)
@@ -3738,10 +4302,352 @@ class Project(object): # Project master class instanciated by the GUI
                 
 
 
-    def modelDOI(self, dump=None):
+    def invertAsync(self, progress=None, executor=None, **kwargs):
+        """Run `Project.invert()` in a background thread and return
+        immediately so that several projects can be inverted from the same
+        Python process.
+
+        Parameters
+        ----------
+        progress : function, optional
+            Function called as `progress(event, value)` with the events:
+                - 'start' : the inversion starts (value is None)
+                - 'output' : value is a line of the output of the inversion code
+                - 'survey' : value is the index of the survey which inversion
+                  is finished (only for parallel batch/time-lapse inversion),
+                  its results can already be read from the working directory
+                - 'done' : value is `Project.meshResults`
+        executor : concurrent.futures.Executor, optional
+            Executor to which the inversion is submitted. By default a thread
+            pool shared by all projects is used.
+        **kwargs : optional
+            Keyword arguments passed to `Project.invert()`. If `dump` is
+            not provided, the output is not printed.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future which result is `Project.meshResults`. Use
+            `asyncio.wrap_future(future)` to await it in a coroutine.
+        """
+        if progress is None:
+            def progress(event, value):
+                pass
+        if executor is None:
+            executor = getAsyncExecutor()
+        dump = kwargs.pop('dump', None)
+        def dumpProgress(x):
+            if dump is not None:
+                dump(x)
+            progress('output', x)
+        def callback(i):
+            progress('survey', i)
+        def run():
+            progress('start', None)
+            self.invert(dump=dumpProgress, callback=callback, **kwargs)
+            progress('done', self.meshResults)
+            return self.meshResults
+        return executor.submit(run)
+
+
+    @traced
+    def addTimeLapseStep(self, fnames, ftype='Syscal', parser=None, spacing=None,
+                         ncores=None, dump=None):
+        """Import new surveys in an inverted time-lapse project and only
+        invert them (incremental time-lapse). Each survey is inverted against
+        the inverted reference survey with the existing mesh and .in file,
+        its results are appended to `R2.meshResults`. This gives the same
+        results as inverting all the surveys again except that, with
+        reg_mode == 2, each new survey keeps all the quadrupoles it shares
+        with the reference survey (not only the ones common to all surveys).
+
+        Parameters
+        ----------
+        fnames : str or list of str
+            File(s) to be parsed (inverted in this order).
+        ftype : str, optional
+            Type of file to be parsed (see `R2.createSurvey()`).
+        parser : function, optional
+            A parser function to be passed to `Survey` constructor.
+        spacing : float, optional
+            Electrode spacing to be passed to the parser function.
+        ncores : int, optional
+            Number of surveys inverted at the same time if several files are
+            given. Default is all cores.
+        dump : function, optional
+            Function to print the progress.
+
+        Returns
+        -------
+        indexes : list of int
+            Index of the new surveys in `R2.surveys` (and `R2.meshResults`).
+        """
+        if dump is None:
+            def dump(x):
+                print(x, end='')
+        if self.iTimeLapse is False or len(self.surveys) == 0:
+            raise ValueError('Only for time-lapse projects, use `R2.createTimeLapseSurvey()` first.')
+        if isinstance(fnames, str):
+            fnames = [fnames]
+        threed = self.typ[-1] == 't'
+        regMode = self.param.get('reg_mode', 2)
+
+        # the reference survey must already be inverted
+        if len(self.meshResults) == 0 and os.path.exists(os.path.join(self.dirname, 'ref', 'f001_res.vtk')):
+            self.getResults()
+        if len(self.meshResults) == 0:
+            raise ValueError('Invert the time-lapse surveys first with `R2.invert()`.')
+        if isinstance(self.meshResults, MeshResults) is False: # e.g. project saved in v1
+            meshResults = MeshResults()
+            meshResults.extend(self.meshResults)
+            self.meshResults = meshResults
+            self._addResultTransforms()
+        if os.path.exists(os.path.join(self.dirname, self.typ + '.in')) is False:
+            self.write2in() # e.g. loaded project
+        startRes = os.path.join(self.dirname, 'Start_res.dat')
+        if os.path.exists(os.path.join(self.dirname, 'ref', 'f001_res.dat')):
+            shutil.copy(os.path.join(self.dirname, 'ref', 'f001_res.dat'), startRes)
+        else: # from the loaded results
+            res_names = np.array(['Resistivity','Resistivity(Ohm-m)','Resistivity(ohm.m)'])
+            res_name = res_names[np.in1d(res_names, list(self.meshResults[0].df.keys()))][0]
+            self.meshResults[0].writeAttr(res_name, startRes)
+        if threed and regMode == 2 and 'fm0' not in self.surveys[0].df.columns:
+            raise ValueError('f(m0) of the reference survey is missing, invert all the surveys again.')
+
+        # import the surveys and write one protocol.dat per survey
+        df0 = self.surveys[0].df[['a','b','m','n','resist','recipMean']
+                                 + (['fm0'] if threed and regMode == 2 else [])]
+        df0 = df0.rename(columns={'resist':'resist0', 'recipMean':'recipMean0'})
+        indexes = []
+        wds = []
+        nsurveys = len(self.surveys)
+        nresults = len(self.meshResults)
+        try:
+            for fname in fnames:
+                self.createSurvey(fname, ftype=ftype, parser=parser, spacing=spacing, debug=False)
+                s = self.surveys[-1]
+                j = len(self.surveys) - 1
+                if hasattr(self, 'iTimeLapseReciprocal'):
+                    self.iTimeLapseReciprocal = np.r_[self.iTimeLapseReciprocal,
+                                                      all(s.df['irecip'].values == 0)]
+                if self.err is True and self.errTyp == 'global' and ('resError' not in s.df.columns
+                        or np.sum(np.isnan(s.df['resError'])) != 0):
+                    if self.bigSurvey.errorModel is None:
+                        self.bigSurvey.fitErrorPwl() # default fit
+                    s.df['resError'] = self.bigSurvey.errorModel(s.df)
+                s.df = s.df.drop(columns=['resist0', 'recipMean0', 'fm0'], errors='ignore')
+                s.df = pd.merge(s.df, df0, on=['a','b','m','n'], how='left')
+                isubset = None
+                fm0 = None
+                if regMode == 2: # quadrupoles in common with the reference
+                    isubset = ~np.isnan(s.df['recipMean0'].values)
+                    if threed:
+                        fm0 = s.df['fm0'].values[isubset]
+                protocol = s.write2protocol('', err=self.err, errTot='modErr' in s.df.columns,
+                                            res0=regMode != 1, ip=False, isubset=isubset,
+                                            threed=threed, fm0=fm0)
+                wd = os.path.join(self.dirname, 'step{:03d}'.format(j))
+                if os.path.exists(wd):
+                    shutil.rmtree(wd)
+                os.mkdir(wd)
+                for f in ['mesh.dat', 'mesh3d.dat', self.typ + '.in', 'Start_res.dat']:
+                    if os.path.exists(os.path.join(self.dirname, f)):
+                        shutil.copy(os.path.join(self.dirname, f), os.path.join(wd, f))
+                with open(os.path.join(wd, 'protocol.dat'), 'w') as f:
+                    f.write(str(protocol.shape[0]) + '\n')
+                    f.write(protocol.to_csv(sep='\t', header=False, index=False, line_terminator='\n'))
+                indexes.append(j)
+                wds.append(wd)
+                dump('{:s}: {:d} quadrupoles\n'.format(s.name, protocol.shape[0]))
+
+            # invert them and append their results
+            if len(wds) == 1:
+                self.runR2(wds[0], dump=dump)
+            else:
+                self._runDirs(wds, ncores=ncores, dump=dump)
+            toMove = ['f001_res.dat', 'f001_res.vtk', 'f001_err.dat', 'f001_sen.dat',
+                      'f001_diffres.dat']
+            for j, wd in zip(indexes, wds):
+                for f in toMove:
+                    if os.path.exists(os.path.join(wd, f)):
+                        shutil.move(os.path.join(wd, f), os.path.join(
+                            self.dirname, f.replace('f001', 'f{:03d}'.format(j))))
+                outFile = os.path.join(wd, self.typ + '.out')
+                if os.path.exists(outFile):
+                    with open(outFile, 'r') as f:
+                        self.invLog += f.read() + '\n'
+                shutil.rmtree(wd)
+                fname = os.path.join(self.dirname, 'f{:03d}_res.vtk'.format(j))
+                elec = self.surveys[j].elec
+                try: # ImportError if missing, empty or truncated
+                    if os.path.exists(fname) is False:
+                        raise ImportError('no result file')
+                    self.meshResults.appendLazy(fname, self.surveys[j].name,
+                                                elec[['x','y','z']].values,
+                                                elec['remote'].values)
+                except ImportError: # see getResults()
+                    dump('Inversion of {:s} failed, the reference model is used.\n'.format(self.surveys[j].name))
+                    self.meshResults.append(self.meshResults[0])
+        except Exception: # keep the surveys consistent with the results
+            self.surveys = self.surveys[:nsurveys]
+            self.surveysInfo = self.surveysInfo[:nsurveys]
+            if hasattr(self, 'iTimeLapseReciprocal'):
+                self.iTimeLapseReciprocal = self.iTimeLapseReciprocal[:nsurveys]
+            while len(self.meshResults) > nresults:
+                del self.meshResults[-1]
+            for j in range(nsurveys, nsurveys + len(fnames)):
+                wd = os.path.join(self.dirname, 'step{:03d}'.format(j))
+                if os.path.exists(wd):
+                    shutil.rmtree(wd)
+                for f in glob.glob(os.path.join(self.dirname, 'f{:03d}_*'.format(j))):
+                    os.remove(f)
+            raise
+        return indexes
+
+
+    def watchFolder(self, dirname, ftype='Syscal', pattern='*', parser=None,
+                    spacing=None, poll=5, ncores=1, timeout=None, maxFiles=None,
+                    callback=None, projectFile=None, dump=None):
+        """Watch a folder where a monitoring system drops new files and
+        invert each new file as a time-lapse step of this project (see
+        `R2.addTimeLapseStep()`) until `timeout` or `maxFiles`. The reference
+        survey must already be inverted. Files whose name matches a survey of
+        the project are skipped so the service can be restarted.
+
+        A file is inverted once it is complete (same size between two scans,
+        or closed after writing if `inotify_simple` is installed). At most
+        `ncores` files are inverted at the same time so that the time between
+        the arrival of a file and its model is at most about `poll` plus
+        the time of one inversion, as long as files do not arrive faster
+        than `ncores` per inversion time.
+
+        Parameters
+        ----------
+        dirname : str
+            Folder to watch.
+        ftype : str, optional
+            Type of file to be parsed (see `R2.createSurvey()`).
+        pattern : str, optional
+            Only files matching this pattern are imported (e.g. '*.csv').
+        parser : function, optional
+            A parser function to be passed to `Survey` constructor.
+        spacing : float, optional
+            Electrode spacing to be passed to the parser function.
+        poll : float, optional
+            Time in seconds between two scans of the folder.
+        ncores : int, optional
+            Maximum number of files inverted at the same time.
+        timeout : float, optional
+            Stop watching after `timeout` seconds. Default is to run until
+            interrupted (Ctrl+C).
+        maxFiles : int, optional
+            Stop after `maxFiles` files are inverted.
+        callback : function, optional
+            Called as `callback(index, info)` after each model is available
+            with `index` of the step in `R2.meshResults` and `info` the
+            dictionary added to `R2.watchLog`.
+        projectFile : str, optional
+            If provided, the new steps are appended to this project file
+            after each inversion (see `R2.appendProject()`). It is first
+            saved in full if it doesn't exist or doesn't hold a previous state
+            of this project.
+        dump : function, optional
+            Function to print the progress.
+
+        Returns
+        -------
+        log : list of dict
+            File name, survey index, arrival ('detected'), 'latency' (s) and
+            'status' of each file (also in `R2.watchLog`).
+        """
+        if dump is None:
+            def dump(x):
+                print(x, end='')
+        from resipy.watch import FolderWatcher
+        names = [s.name for s in self.surveys]
+        def ignore(path):
+            return os.path.basename(os.path.splitext(path)[0]) in names
+        watcher = FolderWatcher(dirname, pattern=pattern, poll=poll, ignore=ignore)
+        if hasattr(self, 'watchLog') is False:
+            self.watchLog = []
+        log = []
+        t0 = time.time()
+        dump('Watching {:s} ({:s})\n'.format(watcher.dirname, 'inotify' if
+             watcher.inotify is not None else 'polling every {:.1f}s'.format(poll)))
+        queue = []
+        if projectFile is not None:
+            if projectFile[-7:] != '.resipy':
+                projectFile = projectFile + '.resipy'
+            try:
+                self.appendProject(projectFile) # e.g. service restarted
+            except ValueError:
+                self.saveProject(projectFile)
+        try:
+            while True:
+                queue += watcher.scan()
+                while len(queue) > 0:
+                    if maxFiles is not None:
+                        queue = queue[:maxFiles - len(log)]
+                    batch = queue[:max(1, ncores)]
+                    queue = queue[len(batch):]
+                    try:
+                        status = 'ok'
+                        indexes = self.addTimeLapseStep([f for f, _ in batch], ftype=ftype,
+                                                        parser=parser, spacing=spacing,
+                                                        ncores=ncores, dump=lambda x: None)
+                    except Exception as e:
+                        status = '{:s}: {:s}'.format(type(e).__name__, str(e))
+                        indexes = [None]*len(batch)
+                    if projectFile is not None and status == 'ok':
+                        self.appendProject(projectFile)
+                    for (f, tdetect), index in zip(batch, indexes):
+                        info = {'file': f, 'index': index, 'status': status,
+                                'detected': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(tdetect)),
+                                'latency': time.time() - tdetect}
+                        log.append(info)
+                        self.watchLog.append(info)
+                        dump('{:s}: {:s} (model available {:.1f}s after arrival)\n'.format(
+                            os.path.basename(f), status, info['latency']))
+                        if callback is not None:
+                            callback(index, info)
+                if maxFiles is not None and len(log) >= maxFiles:
+                    break
+                if timeout is not None and time.time() - t0 >= timeout:
+                    break
+                watcher.wait(None if timeout is None else timeout - (time.time() - t0))
+        except KeyboardInterrupt:
+            dump('Watch interrupted\n')
+        finally:
+            watcher.close()
+        return log
+
+
+    @traced
+    def modelDOI(self, dump=None, allSurveys=False, ncores=None, iMoveElec=False):
         """Will rerun the inversion with a background constrain (alpha_s) with
         the normal background and then a background 10 times more resistive.
         From the two different inversion a senstivity limit will be computed.
+        Both inversions run at the same time in separate directories.
+        
+        Parameters
+        ----------
+        dump : function, optional
+            Function to print the output.
+        allSurveys : bool, optional
+            If `True`, the DOI is computed for each survey (batch or
+            time-lapse), otherwise only for the first one.
+        ncores : int, optional
+            Number of inversions run at the same time. Default is the number
+            of cores available.
+        iMoveElec : bool, optional
+            If `True` and `allSurveys` is `True`, the electrodes are placed at
+            the positions of each survey (see `R2.runParallel()`).
+        
+        Returns
+        -------
+        sensScaled : numpy.array or list of numpy.array
+            Scaled sensitivity for the first survey or, if `allSurveys` is
+            `True`, list of scaled sensitivity for each survey.
         """
         if dump is None:
             def dump(x):
@@ -3750,75 +4656,224 @@ class Project(object): # Project master class instanciated by the GUI
         # backup for normal inversion (0 : original, 1 : normal background, 2: background *10)
         res0 = np.array(self.mesh.df['res0'])
         param0 = self.param.copy()
-        self.param['reg_mode'] = 1 # we need constrain to background
         typ0 = self.typ
-        if self.typ[0] == 'c':
-            self.typ = self.typ[1:]
         iTimeLapse0 = self.iTimeLapse
-        self.iTimeLapse = False
         surveys0 = self.surveys.copy()
-        self.surveys = [surveys0[0]] # just use first survey
-        self.write2in()
-        self.write2protocol()
-        
-        # build the cropping polygon
-        if self.param['num_xz_poly'] != 0:
-            path = mpath.Path(self.param['xz_poly_table'])
-            iselect = path.contains_points(np.c_[self.mesh.elmCentre[:,0], self.mesh.elmCentre[:,2]])
-        else:
-            iselect = np.ones(len(self.mesh.elmCentre[:,0]), dtype=bool)
+        eNodes0 = self.mesh.eNodes
+        doidir = os.path.join(self.dirname, 'doi')
+        try:
+            self.param['reg_mode'] = 1 # we need constrain to background
+            if self.typ[0] == 'c':
+                self.typ = self.typ[1:]
+            self.iTimeLapse = False
+            self.surveys = [surveys0[0]] # just use first survey
+            self.write2in()
             
-        # clean function
-        def cleandir():
-            dirname = self.dirname
-            os.remove(os.path.join(dirname, 'res0.dat'))
-            for f in os.listdir(dirname):
-                if f[:3] == 'f00':
-                    os.remove(os.path.join(dirname, f))
-        
-        # run first background constrained inversion
-        dump('===== modelDOI: Running background constrained inversion with initial resistivity =====\n')
-        res1 = res0
-        self.mesh.df['res0b'] = res1
-        self.mesh.writeAttr('res0b', os.path.join(self.dirname,'res0.dat'))
-        self.runR2(dump=dump) # re-run inversion
-        self.getResults()
-        mesh1 = self.meshResults[0]
-        cleandir()
-        
-        # run second background constrained inversion
-        dump('===== modelDOI: Running background constrained inversion with initial resistivity * 10 =====\n')
-        res2 = res0 * 10
-        self.mesh.df['res0b'] = list(res2)
-        self.mesh.writeAttr('res0b', os.path.join(self.dirname,'res0.dat'))
-        self.runR2(dump=dump) # re-run inversion
-        self.getResults()
-        mesh2 = self.meshResults[0]
-        cleandir()
-        os.remove(os.path.join(self.dirname, 'R2.in'))
-        
-        # sensitivity = difference between final inversion / difference init values
-        res_names = np.array(['Resistivity','Resistivity(Ohm-m)','Resistivity(ohm.m)'])
-        res_name = res_names[np.in1d(res_names, list(self.meshResults[0].df.keys()))][0]
-        invValues1 = np.array(mesh1.df[res_name])
-        invValues2 = np.array(mesh2.df[res_name])
-        sens = (invValues1 - invValues2)/(res1[iselect]-res2[iselect])
-        sensScaled = np.abs(sens)
-#        mesh0.df['doiSens'] = sensScaled # add attribute to original mesh
-        self.doiComputed = True
-        
-        # restore
-        self.meshResults = []
-        self.param = param0
-        self.typ = typ0
-        self.surveys = surveys0
-        self.iTimeLapse = iTimeLapse0
-        # .in and protocol will be written again in R2.invert()
-        
-        return sensScaled
+            # build the cropping polygon
+            if self.param['num_xz_poly'] != 0:
+                path = mpath.Path(self.param['xz_poly_table'])
+                iselect = path.contains_points(np.c_[self.mesh.elmCentre[:,0], self.mesh.elmCentre[:,2]])
+            else:
+                iselect = np.ones(len(self.mesh.elmCentre[:,0]), dtype=bool)
+                
+            # one directory per survey and per background (sharing the same mesh)
+            res1 = res0
+            res2 = res0 * 10
+            if os.path.exists(doidir):
+                shutil.rmtree(doidir)
+            wds = []
+            for i, survey in enumerate(surveys0 if allSurveys else surveys0[:1]):
+                self.surveys = [survey]
+                self.write2protocol()
+                if iMoveElec is True and allSurveys is True:
+                    self.param['node_elec'] = [self.param['node_elec'][0],
+                                               self._surveyElecNodes(survey)]
+                    self.write2in()
+                for j, res in enumerate([res1, res2]):
+                    wd = os.path.join(doidir, '{:d}_{:d}'.format(i, j))
+                    os.makedirs(wd)
+                    for f in ['mesh.dat', 'mesh3d.dat', self.typ + '.in', 'protocol.dat']:
+                        if os.path.exists(os.path.join(self.dirname, f)):
+                            shutil.copy(os.path.join(self.dirname, f), os.path.join(wd, f))
+                    self.mesh.df['res0b'] = list(res)
+                    self.mesh.writeAttr('res0b', os.path.join(wd, 'res0.dat'))
+                    wds.append(wd)
+            os.remove(os.path.join(self.dirname, self.typ + '.in'))
+
+            # run all background constrained inversions at the same time
+            dump('===== modelDOI: Running {:d} background constrained inversions '
+                 '(initial resistivity and initial resistivity * 10) =====\n'.format(len(wds)))
+            self._runDirs(wds, ncores=ncores, dump=dump)
+            
+            # sensitivity = difference between final inversion / difference init values
+            res_names = np.array(['Resistivity','Resistivity(Ohm-m)','Resistivity(ohm.m)'])
+            sensScaled = []
+            for i in range(len(wds)//2):
+                mesh1 = mt.vtk_import(os.path.join(wds[2*i], 'f001_res.vtk'), order_nodes=False)
+                mesh2 = mt.vtk_import(os.path.join(wds[2*i+1], 'f001_res.vtk'), order_nodes=False)
+                res_name = res_names[np.in1d(res_names, list(mesh1.df.keys()))][0]
+                invValues1 = np.array(mesh1.df[res_name])
+                invValues2 = np.array(mesh2.df[res_name])
+                sens = (invValues1 - invValues2)/(res1[iselect]-res2[iselect])
+                sensScaled.append(np.abs(sens))
+#            mesh0.df['doiSens'] = sensScaled # add attribute to original mesh
+            self.doiComputed = True
+        finally: # restore, also if an inversion failed
+            if os.path.exists(doidir):
+                shutil.rmtree(doidir)
+            self.mesh.eNodes = eNodes0
+            self.meshResults = []
+            self.param = param0
+            self.typ = typ0
+            self.surveys = surveys0
+            self.iTimeLapse = iTimeLapse0
+            # .in and protocol will be written again in R2.invert()
+        
+        return sensScaled if allSurveys else sensScaled[0]
+
+
+    @traced
+    def _runDirs(self, wds, ncores=None, dump=None, raiseError=True):
+        """Run the executable in several prepared directories at the same
+        time (at most `ncores`).
+
+        Returns
+        -------
+        failed : list of str
+            Directories where the run failed or was killed (only if
+            `raiseError` is False, otherwise a RuntimeError is raised).
+        """
+        if dump is None:
+            def dump(x):
+                print(x, end='')
+        if ncores is None:
+            ncores = systemCheck(dump=lambda x: None)['core_count']
+        cmd = exeCommand(os.path.join(self.apiPath, 'exe', self.typ + '.exe'))
+        kwargs = {}
+        if OS == 'Windows':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs['startupinfo'] = startupinfo
+        self.irunParallel2 = True
+        self.procs = []
+        self.proc = ProcsManagement(self)
+        todo = list(wds)
+        procDir = {} # directory of each process
+        failed = []
+        done = []
+        c = 0
+        while self.irunParallel2:
+            while todo and len(self.procs) < ncores:
+                wd = todo.pop(0)
+                p = Popen(cmd, cwd=wd, stdout=subprocess.DEVNULL, shell=False, **kwargs)
+                self.procs.append(p)
+                procDir[p] = wd
+            for p in list(self.procs):
+                if p.poll() is not None:
+                    self.procs.remove(p)
+                    if p.returncode != 0:
+                        failed.append('{:s} (return code {:d})'.format(procDir[p], p.returncode))
+                    else:
+                        done.append(procDir[p])
+                    c = c + 1
+                    dump('\r{:d}/{:d} inversions completed'.format(c, len(wds)))
+            if not self.procs and not todo:
+                dump('\n')
+                break
+            time.sleep(0.05)
+        for p in self.procs: # killed, wait for them to release their files
+            p.wait()
+        if raiseError is False:
+            return [wd for wd in wds if wd not in done]
+        if len(failed) > 0:
+            raise RuntimeError('Inversion failed in ' + ', '.join(failed))
+        if c < len(wds):
+            raise RuntimeError('Inversions killed before the end ({:d}/{:d} completed)'.format(c, len(wds)))
+
+
+    def computeHalfSpaceSens(self, index=0, mesh=None, density=True):
+        """Compute the cumulative sensitivity of the quadrupoles of a survey
+        for a homogeneous half-space (analytic kernels, no inversion needed).
+        The log10 of the sensitivity is added as 'HalfSpaceSens(log10)' to
+        the mesh and can be used as a fast DOI estimate (see `doiHalfSpace`
+        and `cropAttr` in `R2.showResults()`).
+
+        Parameters
+        ----------
+        index : int, optional
+            Index of the survey which quadrupoles are used.
+        mesh : Mesh, optional
+            Mesh on which the sensitivity is computed. Default is `R2.mesh`.
+        density : bool, optional
+            If True (default), the sensitivity per unit area (volume in 3D)
+            is returned, otherwise it is integrated over each cell.
+
+        Returns
+        -------
+        sens : array of float
+            log10 of the cumulative sensitivity of each cell.
+        """
+        if mesh is None:
+            mesh = self.mesh
+        if mesh is None:
+            raise ValueError('Create a mesh first with `R2.createMesh()`.')
+        df = self.surveys[index].df
+        labels = self.elec['label'].values
+        ielec = pd.Series(np.arange(len(labels)), index=labels)
+        quads = np.c_[[ielec.reindex(df[c].astype(str)).values for c in ['a','b','m','n']]].T
+        quads = quads[~np.isnan(quads).any(axis=1)].astype(int)
+        elec = self.elec[['x','y','z']].values
+        iremote = self.elec['remote'].values
+        if (self.topo.shape[0] == 0) & all(self.elec['buried']): # whole space
+            surface = None
+        else:
+            isurf = ~iremote & ~self.elec['buried'].values
+            surface = np.max(elec[isurf if np.sum(isurf) > 0 else ~iremote, 2])
+        volumes = None if density else halfspace.cellVolumes(mesh)
+        sens = halfspace.cumulativeSensitivity(elec, quads, mesh.elmCentre, volumes,
+            ndims=mesh.ndims, surface=surface, iremote=iremote)
+        with np.errstate(divide='ignore'):
+            sens = np.log10(sens)
+        mesh.addAttribute(sens, 'HalfSpaceSens(log10)')
+        return sens
+
+
+    def _clipVertices(self, cropMaxDepth=False, doiLine=None):
+        """Vertices (x, z) of the polygon used to clip the 2D sections: mesh
+        bounds and surface, cropped below the fine mesh depth (or `doiLine`)
+        if `cropMaxDepth` is True (see `_clipContour()`).
+        """
+        # the polygon only depends on the mesh, reused when switching results
+        key = (id(self.mesh.node), self.mesh.node.shape, bool(cropMaxDepth), self.fmd)
+        if doiLine is None and getattr(self, 'clipVerts', None) is not None \
+            and self.clipVerts[0] == key:
+            return self.clipVerts[1]
+        node_x = self.mesh.node[:,0]
+        node_z = self.mesh.node[:,2]
+        xmin = np.min(node_x)
+        xmax = np.max(node_x)
+        zmin = np.min(node_z)
+        zmax = np.max(node_z)
         
-    
-    def _clipContour(self, ax, collections, cropMaxDepth=False, clipCorners=False):
+        (xsurf, zsurf) = self.mesh.extractSurface()
+        if cropMaxDepth and doiLine is not None:
+            xfmd, zfmd = doiLine[0][::-1], doiLine[1][::-1]
+            verts = np.c_[np.r_[xmin, xmin, xsurf, xmax, xmax, xfmd, xmin],
+                          np.r_[zmin, zmax, zsurf, zmax, zmin, zfmd, zmin]]
+        elif cropMaxDepth and self.fmd is not None:
+            xfmd, zfmd = xsurf[::-1], zsurf[::-1] - self.fmd
+            verts = np.c_[np.r_[xmin, xmin, xsurf, xmax, xmax, xfmd, xmin],
+                          np.r_[zmin, zmax, zsurf, zmax, zmin, zfmd, zmin]]
+        else:
+            verts = np.c_[np.r_[xmin, xmin, xsurf, xmax, xmax, xmin],
+                          np.r_[zmin, zmax, zsurf, zmax, zmin, zmin]]
+        if doiLine is None:
+            self.clipVerts = (key, verts)
+        return verts
+
+
+    def _clipContour(self, ax, collections, cropMaxDepth=False, clipCorners=False,
+                     doiLine=None):
         """Clip contours using mesh bound and surface if available.
         
         Parameters
@@ -3829,6 +4884,9 @@ class Project(object): # Project master class instanciated by the GUI
             Matplotlib collection.
         cropMaxDepth : bool, optional
             If 'True', area below fmd will be cropped out.
+        doiLine : tuple of array, optional
+            (x, z) of the depth of investigation. If given (and cropMaxDepth
+            is True), the area below it is cropped out instead of below fmd.
         clipCorners : bool, optional
             If 'True', triangles from bottom corners will be cropped (only if the whole mesh is not shown).
         """
@@ -3838,29 +4896,16 @@ class Project(object): # Project master class instanciated by the GUI
             poly_codes = [mpath.Path.MOVETO] + (len(verts) - 2) * [mpath.Path.LINETO] + [mpath.Path.CLOSEPOLY]
             path = mpath.Path(verts, poly_codes)
             patch = mpatches.PathPatch(path, facecolor='none', edgecolor='none')
-            ax.add_patch(patch) # need to add so it knows the transform
+            patch.set_transform(ax.transData) # not added to the axis so patches don't pile up when replotting
             for col in collections:
                 col.set_clip_path(patch)
         
         # mask outer region
-        node_x = self.mesh.node[:,0]
-        node_z = self.mesh.node[:,2]
-        xmin = np.min(node_x)
-        xmax = np.max(node_x)
-        zmin = np.min(node_z)
-        zmax = np.max(node_z)
-        
-        (xsurf, zsurf) = self.mesh.extractSurface()
-        if cropMaxDepth and self.fmd is not None:
-            xfmd, zfmd = xsurf[::-1], zsurf[::-1] - self.fmd
-            verts = np.c_[np.r_[xmin, xmin, xsurf, xmax, xmax, xfmd, xmin],
-                          np.r_[zmin, zmax, zsurf, zmax, zmin, zfmd, zmin]]
-        else:
-            verts = np.c_[np.r_[xmin, xmin, xsurf, xmax, xmax, xmin],
-                          np.r_[zmin, zmax, zsurf, zmax, zmin, zmin]]
-        patcher(verts)
+        patcher(self._clipVertices(cropMaxDepth=cropMaxDepth, doiLine=doiLine))
 
         if clipCorners and self.param['num_xz_poly'] != 0: # not clipping the corners of a mesh outside of the survey area!
+            zmin = np.min(self.mesh.node[:,2])
+            (xsurf, zsurf) = self.mesh.extractSurface()
             elec_x = self.mesh.elec[:,0]
             elec_z = self.mesh.elec[:,2]
             elec_xmin = np.min(elec_x)
@@ -3901,9 +4946,11 @@ class Project(object): # Project master class instanciated by the GUI
             self.trapeziod = None # make sure trapeziod mask is clear
      
 
+    @traced
     def showResults(self, index=0, ax=None, edge_color='none', attr='',
                     sens=True, color_map='viridis', zlim=None, clabel=None,
-                    doi=False, doiSens=False, contour=False, cropMaxDepth=True,
+                    doi=False, doiSens=False, doiHalfSpace=False, cropAttr=None,
+                    contour=False, cropMaxDepth=True,
                     clipContour=True, clipCorners=False, use_pyvista=True, background_color=(0.8,0.8,0.8),
                     pvslices=([],[],[]), pvthreshold=None, pvgrid=True,
                     pvcontour=[], pvdelaunay3d=False, **kwargs):
@@ -3935,6 +4982,15 @@ class Project(object): # Project master class instanciated by the GUI
         doiSens : bool, optional
             If True, it will draw a dashed line corresponding to 0.001 of the maximum
             of the log10 sensitivity.
+        doiHalfSpace : bool, optional
+            If True, it will draw a dash-dot line corresponding to 0.001 of the
+            maximum of the half-space sensitivity of the quadrupoles (see
+            `R2.computeHalfSpaceSens()`, computed if needed).
+        cropAttr : str, optional
+            Name of a log10 sensitivity attribute (e.g. 'Sensitivity(log10)' or
+            'HalfSpaceSens(log10)'). If specified (and cropMaxDepth is True),
+            the section is cropped below the depth where the attribute drops
+            under 0.001 of its maximum instead of below the fine mesh depth.
         contour : bool, optional
             If True, contours will be plotted.
         cropMaxDepth : bool, optional
@@ -4007,18 +5063,30 @@ class Project(object): # Project master class instanciated by the GUI
                         linestyle = '--'
                     else:
                         doiSens = False
+                halfSpaceKey = 'HalfSpaceSens(log10)'
+                if (doiHalfSpace is True or cropAttr == halfSpaceKey) and halfSpaceKey not in mesh.df.keys():
+                    self.computeHalfSpaceSens(index=max(0, min(index, len(self.surveys)-1)), mesh=mesh)
+                if doiHalfSpace is True: # DOI based on analytic sensitivity
+                    z = np.array(mesh.df[halfSpaceKey])
+                    levels = [np.nanmax(z[np.isfinite(z)]) - 3]
+                    linestyle = '-.'
+                line = None
+                if cropAttr is not None:
+                    zc = np.array(mesh.df[cropAttr])
+                    line = halfspace.doiLine(mesh.elmCentre, zc, np.nanmax(zc[np.isfinite(zc)]) - 3)
                 if (clipContour) & (self.topo.shape[0] == 0) & (all(self.elec['buried'])):
                     # it's a whole space mesh, clipContour is not needed for that but contour can be drawn
                     cropMaxDepth = False
-                if doi is True or doiSens is True:
+                if doi is True or doiSens is True or doiHalfSpace is True:
                     xc, yc = mesh.elmCentre[:,0], mesh.elmCentre[:,2]
                     triang = tri.Triangulation(xc, yc)
                     cont = mesh.ax.tricontour(triang, z, levels=levels, colors='k', linestyles=linestyle)
                     if clipContour:
                         self._clipContour(mesh.ax, cont.collections, clipCorners=clipCorners)
-                colls = mesh.cax.collections if contour == True else [mesh.cax]
+                colls = mesh.cax.collections if contour == True and kwargs.get('raster', False) is False else [mesh.cax]
                 if clipContour:
-                    self._clipContour(mesh.ax, colls, cropMaxDepth=cropMaxDepth, clipCorners=clipCorners)
+                    self._clipContour(mesh.ax, colls, cropMaxDepth=cropMaxDepth,
+                                      clipCorners=clipCorners, doiLine=line)
             elif self.typ[-1] == '2' and index == -1: # 3D grid of 2D surveys (pseudo 3D)
                 self.showPseudo3DResults(ax=ax, edge_color=edge_color,
                     attr=attr, color_map=color_map, clabel=clabel, returnMesh=True,
@@ -4042,21 +5110,27 @@ class Project(object): # Project master class instanciated by the GUI
 
 
 
-    def getResults(self, dirname=None):
+    @traced
+    def getResults(self, dirname=None, ncores=None):
         """Collect inverted results after running the inversion and adding
-        them to `R2.meshResults` list.
+        them to `R2.meshResults` list. Steps are only read from their
+        f###_res.vtk when accessed and share the topology of the first one
+        (see `resipy.meshResults.MeshResults`).
         
         Parameters
         ----------
         dirname : str, optional
             If specified, dirname will be used as the working directory (this
             is needed for R2.loadResults()). Default is self.dirname.
+        ncores : int, optional
+            If specified, the first steps (as many as kept in memory) are
+            parsed in advance with `ncores` threads.
         """
         if dirname is None:
             dirname = self.dirname
         idone = 0
         ifailed = 0
-        self.meshResults = [] # make sure we empty the list first
+        self.meshResults = MeshResults() # make sure we empty the list first
         if self.iTimeLapse == True:
             fname = os.path.join(dirname, 'ref', 'f001_res.vtk')
             mesh0 = mt.vtk_import(fname, order_nodes=False)
@@ -4083,13 +5157,12 @@ class Project(object): # Project master class instanciated by the GUI
             fname = os.path.join(dirname, 'f' + str(i+1).zfill(3) + '_res.vtk')
             if os.path.exists(fname):
                 try:
-                    mesh = mt.vtk_import(fname, order_nodes=False)
-                    mesh.mesh_title = self.surveys[j].name
-                    elec = self.surveys[j].elec.copy()
-                    mesh.setElec(elec['x'].values, elec['y'].values, elec['z'].values)
-                    mesh.iremote = elec['remote'].values
-                    self.meshResults.append(mesh) # this will be very memory intensive to put all meshes into a list for long time lapse surveys
-                    #TODO : Rethink storage of timelapse results 
+                    # the step is only read when accessed (shared topology),
+                    # empty or truncated files are detected by appendLazy()
+                    elec = self.surveys[j].elec
+                    self.meshResults.appendLazy(fname, self.surveys[j].name,
+                                                elec[['x','y','z']].values,
+                                                elec['remote'].values)
                     idone += 1
                 except Exception:
                     ifailed += 1
@@ -4105,14 +5178,27 @@ class Project(object): # Project master class instanciated by the GUI
                 #break
         print('')
 
-        # compute conductivity in mS/m
+        self._addResultTransforms()
+        annotate(steps=len(self.meshResults))
+        if ncores is not None and ncores > 1:
+            self.meshResults.prefetch(ncores=ncores)
+
+
+    def _addResultTransforms(self):
+        """Add the attributes computed from the results (conductivity,
+        chargeability and difference for time-lapse) when a step is loaded.
+        """
+        # compute conductivity in mS/m (each time a step is loaded)
         res_names = np.array(['Resistivity','Resistivity(Ohm-m)','Resistivity(ohm.m)', 'Magnitude(ohm.m)'])
-        for mesh in self.meshResults:
+        def conductivity(mesh, i):
             res_name = res_names[np.in1d(res_names, list(mesh.df.keys()))][0]
             mesh.df['Conductivity(mS/m)'] = 1000/np.array(mesh.df[res_name])
+        self.meshResults.addTransform(conductivity)
         if self.typ[0] == 'c' and self.surveys[0].kFactor != 1: # if kFactor is 1 then probably phase is provided and we shouldn't estimate chargeability
-            for mesh in self.meshResults:
-                mesh.df['Chargeability(mV/V)'] = np.array(mesh.df['Phase(mrad)'])/-self.surveys[0].kFactor
+            kFactor = self.surveys[0].kFactor
+            def chargeability(mesh, i):
+                mesh.df['Chargeability(mV/V)'] = np.array(mesh.df['Phase(mrad)'])/-kFactor
+            self.meshResults.addTransform(chargeability)
         # compute difference in percent in case of reg_mode == 1
         if (self.iTimeLapse is True):# and (self.param['reg_mode'] == 1):
             # even with reg_mode == 2 when the inversion converged by overshooting
@@ -4401,6 +5487,167 @@ class Project(object): # Project master class instanciated by the GUI
         self.mesh.df['res0'] = np.ones(self.mesh.numel)*100 # set back as default
 
 
+    def _getRoi(self, mesh):
+        """Return a boolean array which is True for the cells of `mesh`
+        inside the region of interest of the inversion (`xz_poly_table` in
+        2D, `xy_poly_table` and zmin/zmax in 3D).
+        """
+        if (self.typ == 'R3t') or (self.typ == 'cR3t'):
+            if self.param.get('num_xy_poly', 0) > 0:
+                return roiMask(mesh, self.param['xy_poly_table'],
+                               (self.param['zmin'], self.param['zmax']))
+        elif self.param.get('num_xz_poly', 0) > 0:
+            return roiMask(mesh, self.param['xz_poly_table'])
+        return np.ones(mesh.numel, dtype=bool)
+
+
+    def getResultCube(self, attr=None, dirname=None, ncores=None):
+        """Gather the inverted values of all surveys in a result cube
+        (n_steps x n_cells float32 arrays) sharing the first mesh of
+        `meshResults`. Differences and temporal statistics can then be
+        computed in one go (see `resipy.resultCube.ResultCube`). Steps
+        cropped to the region of interest by the executable (time-lapse
+        steps with `xz_poly_table`) are placed in the cells of the ROI of the
+        first mesh, the other cells are NaN.
+
+        Parameters
+        ----------
+        attr : str or list of str, optional
+            Attribute(s) to put in the cube. Default is all attributes of the
+            first mesh except the mesh ones (coordinates, param, ...).
+        dirname : str, optional
+            If specified, the cube is made of memory-mapped .npy files in
+            this directory instead of arrays in memory.
+        ncores : int, optional
+            Number of threads used to read the result files.
+
+        Returns
+        -------
+        cube : ResultCube
+            Also stored in `Project.resultCube`.
+        """
+        if len(self.meshResults) == 0:
+            self.getResults()
+        mesh = self.meshResults[0]
+        if attr is None:
+            attr = [a for a in mesh.df.columns if a not in
+                    ['param', 'elm_id', 'region', 'cellType', 'X', 'Y', 'Z']]
+        elif isinstance(attr, str):
+            attr = [attr]
+        lazy = isinstance(self.meshResults, MeshResults)
+        if lazy: # no need to decode the meshes
+            names = self.meshResults.titles()
+        else:
+            names = [m.mesh_title for m in self.meshResults]
+        cube = ResultCube(mesh, names, dirname)
+        for a in attr:
+            cube.allocate(a)
+        roi = self._getRoi(mesh)
+        nroi = np.sum(roi)
+        def put(a, i, values):
+            values = np.asarray(values)
+            if len(values) == mesh.numel:
+                cube.data[a][i,:] = values
+            elif len(values) == nroi: # step cropped to the ROI
+                cube.data[a][i,roi] = values
+            else:
+                raise ValueError('Step {:d} has {:d} cells, expected {:d} or {:d} '
+                                 '(cropped to the ROI)'.format(i, len(values), mesh.numel, nroi))
+        nsteps = len(self.meshResults)
+        chunk = 4*ncores if ncores is not None else nsteps # bounded memory
+        for start in range(0, nsteps, chunk):
+            indices = np.arange(start, min(nsteps, start + chunk))
+            if lazy:
+                attrs = self.meshResults.readAttributes(indices, ncores)
+            else:
+                attrs = [self.meshResults[i].df for i in indices]
+            for i, values in zip(indices, attrs):
+                for a in attr:
+                    try:
+                        if a in values:
+                            put(a, i, values[a])
+                        elif lazy: # computed attribute (e.g. conductivity)
+                            put(a, i, self.meshResults.getAttribute(i, a))
+                    except KeyError: # attribute missing for this step (NaN)
+                        pass
+        cube.roi = roi
+        self.resultCube = cube
+        return cube
+
+
+    @traced
+    def computeResolution(self, index=0, method='exact', mmap=False, blockSize=256,
+                          nprobe=32, tol=1e-4):
+        """Compute the diagonals of the model covariance and resolution
+        matrices from the Jacobian and roughness matrix written by the
+        inversion (f###_J.dat, f###_R.dat, see `parallelRm()`). They are added
+        as 'Covariance' and 'Resolution' attributes of `R2.mesh` and of the
+        corresponding mesh of `R2.meshResults`.
+
+        Parameters
+        ----------
+        index : int, optional
+            Index of the survey.
+        method : str, optional
+            'exact' (see `parallelRm()`) or 'stochastic' for an estimate
+            with random probe vectors suited to very large 3D models (see
+            `stochasticRm()`).
+        mmap : bool, optional
+            If True, the Jacobian is memory-mapped instead of kept in memory.
+        blockSize : int, optional
+            Number of rows or columns processed at once ('exact' only).
+        nprobe : int, optional
+            Number of probe vectors ('stochastic' only). The error decreases
+            as 1/sqrt(nprobe) and the time increases linearly.
+        tol : float, optional
+            Tolerance of the iterative solves ('stochastic' only).
+
+        Returns
+        -------
+        covar, remat : numpy.array
+            Diagonals of the covariance and resolution matrices (one value
+            per parameter).
+        """
+        if method == 'exact':
+            covar, remat = parallelRm(self.dirname, index=index + 1, mmap=mmap,
+                                      blockSize=blockSize)
+        elif method == 'stochastic':
+            covar, remat = stochasticRm(self.dirname, index=index + 1, nprobe=nprobe,
+                                        tol=tol, mmap=mmap)
+        else:
+            raise ValueError('Unknown method {:s}, use "exact" or "stochastic".'.format(method))
+        self._addParamAttribute(index, covar, 'Covariance')
+        self._addParamAttribute(index, remat, 'Resolution')
+        return covar, remat
+
+
+    def _addParamAttribute(self, index, values, name):
+        """Add values defined per inversion parameter as an attribute of
+        `R2.mesh` and of the result mesh of survey `index` (matched on the
+        cell centres as result meshes can be cropped).
+        """
+        param = np.array(self.mesh.df['param']).astype(int) if 'param' in self.mesh.df.columns \
+            else 1 + np.arange(self.mesh.numel)
+        cells = np.full(self.mesh.numel, np.nan)
+        ie = (param > 0) & (param <= len(values))
+        cells[ie] = values[param[ie] - 1]
+        self.mesh.addAttribute(cells, name)
+        if len(self.meshResults) == 0:
+            return
+        titles = [m.mesh_title for m in self.meshResults] if isinstance(self.meshResults, list) \
+            else self.meshResults.titles()
+        ires = titles.index(self.surveys[index].name) if self.surveys[index].name in titles \
+            else min(index, len(titles) - 1)
+        tree = cKDTree(self.mesh.elmCentre)
+        def addValues(m, i):
+            if i == ires:
+                m.df[name] = cells[tree.query(m.elmCentre)[1]]
+        if isinstance(self.meshResults, MeshResults):
+            self.meshResults.addTransform(addValues)
+        else:
+            addValues(self.meshResults[ires], ires)
+
+
     def computeAttribute(self, formula, name, dump=None):
         """Compute a new attribute for each meshResults.
         
@@ -4923,6 +6170,7 @@ class Project(object): # Project master class instanciated by the GUI
             fname = fname[:-4] + str(i) + fname[-4:] # to iterate file numbers in case of timelapse survey
 
 
+    @traced
     def forward(self, noise=0.0, noiseIP=0.0, iplot=False, dump=None):
         """Operates forward modelling.
 
@@ -4965,44 +6213,105 @@ class Project(object): # Project master class instanciated by the GUI
         else:
             self.mesh.writeAttr('res0', os.path.join(fwdDir,'resistivity.dat'))
 
-        # write mesh.dat (no ordering of elements needed in forward mode)
-        if (self.typ == 'R2') | (self.typ == 'cR2'):
-            self.mesh.dat(os.path.join(fwdDir, 'mesh.dat'))
-        else:
-            self.mesh.datAdv(os.path.join(fwdDir, 'mesh3d.dat'), iadvanced=self.iadvanced)
-            
-        # write the forward .in file
-        if self.custSeq is True: # only in case of 3D custom sequence
-            # replacing labels with <1 elec_num> for simplicity - ignoring the initial self.elec['label'] values
-            ones = np.ones_like(self.elec['x'].values.astype(str))
-            newLabels = np.char.add(np.char.replace(ones, '1', '1 '), np.arange(1, len(ones)+1).astype(str))
-            self.elec['label'] = newLabels
-            self.param['node_elec'][0] = newLabels
-            
-        dump('Writing .in file and mesh.dat... ')
-        fparam = self.param.copy()
-        fparam['job_type'] = 0
-        fparam['num_regions'] = 0
-        fparam['res0File'] = 'resistivity.dat' # just starting resistivity
-        
-        write2in(fparam, fwdDir, typ=self.typ)
-        dump('done\n')
+        self._writeForwardInputs(fwdDir, dump=dump)
 
-        # write the protocol.dat (that contains the sequence)
-        if self.sequence is None:
-            dump('Creating sequence... ')
-            self.createSequence()
-            dump('done\n')
-        dump('Writing protocol.dat... ')
-        seq = self.sequence
+        # fun the inversion
+        dump('Running forward model... ')
+        self.runR2(fwdDir, dump=dump) # this will copy the R2.exe inside as well
+        self.iForward = True
 
-        # let's check if IP that we have a positive geometric factor
-        if self.typ[0] == 'c': # NOTE this doesn't work for borehole
-            lookupDict = dict(zip(self.elec['label'], np.arange(self.elec.shape[0])))
-            seqdf = pd.DataFrame(seq).rename(columns = {0:'a', 1:'b', 2:'m', 3:'n'})
-            array = seqdf[['a','b','m','n']].astype(str).replace(lookupDict).values.astype(int)
-            elec = self.elec[['x','y','z']].values.copy()
-            
+        # create a protocol.dat file (overwrite the method)
+        def addnoise(x, level=0.05):
+            return x + np.random.randn(1)*x*level
+
+        def addnoiseIP(x, level=2):
+            return x + np.random.randn(1)*level
+
+        addnoise = np.vectorize(addnoise)
+        addnoiseIP = np.vectorize(addnoiseIP)
+        self.noise = noise # percentage noise e.g. 5 -> 5% noise
+        self.noiseIP = noiseIP #absolute noise in mrad, following convention of cR2
+        
+        fmd = self.fmd#.copy()
+        elec = self.elec.copy()
+        if self.typ[-1]=='t' and not self.hasElecString():
+            #need to add elec strings to labels if in 3D
+            for i in range(elec.shape[0]):
+                elec.loc[i,'label'] = '1 ' + elec['label'][i]
+            
+        self.surveys = [] # need to flush it (so no timeLapse forward)
+        if self.typ[0] == 'c':
+            self.createSurvey(os.path.join(fwdDir, self.typ + '_forward.dat'), 
+                              ftype='forwardProtocolIP',
+                              compRecip=False) # dont compute reciprocals as that will be done after adding noise (see lines below)
+        else:
+            self.createSurvey(os.path.join(fwdDir, self.typ + '_forward.dat'), 
+                              ftype='forwardProtocolDC',
+                              compRecip=False)
+            
+        # NOTE the 'ip' columns here is in PHASE not in chargeability
+        self.surveys[0].kFactor = 1 # kFactor by default is = 1 now, though wouldn't hurt to have this here!
+        self.surveys[0].df['resist'] = addnoise(self.surveys[0].df['resist'].values, self.noise/100)
+        self.surveys[0].df['ip'] = addnoiseIP(self.surveys[0].df['ip'].values, self.noiseIP)
+        self.surveys[0].computeReciprocal() # to recreate the other columns
+        self.setElec(elec) # using R2.createSurvey() overwrite self.elec so we need to set it back
+        # self.fmd = fmd      
+
+        # recompute doi (don't actually otherwise zlim is jumping)
+        # self.computeFineMeshDepth()
+        # self.zlim[0] = np.min(elec['z']) - self.fmd
+        if iplot is True:
+            self.showPseudo()
+        dump('Forward modelling done.')
+
+
+    def _writeForwardInputs(self, fwdDir, dump=None):
+        """Write the mesh, .in file and protocol.dat of a forward model in
+        `fwdDir` (the starting resistivity file 'resistivity.dat' is not
+        written).
+        """
+        if dump is None:
+            def dump(x):
+                print(x, end='')
+
+        # write mesh.dat (no ordering of elements needed in forward mode)
+        if (self.typ == 'R2') | (self.typ == 'cR2'):
+            self.mesh.dat(os.path.join(fwdDir, 'mesh.dat'))
+        else:
+            self.mesh.datAdv(os.path.join(fwdDir, 'mesh3d.dat'), iadvanced=self.iadvanced)
+            
+        # write the forward .in file
+        if self.custSeq is True: # only in case of 3D custom sequence
+            # replacing labels with <1 elec_num> for simplicity - ignoring the initial self.elec['label'] values
+            ones = np.ones_like(self.elec['x'].values.astype(str))
+            newLabels = np.char.add(np.char.replace(ones, '1', '1 '), np.arange(1, len(ones)+1).astype(str))
+            self.elec['label'] = newLabels
+            self.param['node_elec'][0] = newLabels
+            
+        dump('Writing .in file and mesh.dat... ')
+        fparam = self.param.copy()
+        fparam['job_type'] = 0
+        fparam['num_regions'] = 0
+        fparam['res0File'] = 'resistivity.dat' # just starting resistivity
+        
+        write2in(fparam, fwdDir, typ=self.typ)
+        dump('done\n')
+
+        # write the protocol.dat (that contains the sequence)
+        if self.sequence is None:
+            dump('Creating sequence... ')
+            self.createSequence()
+            dump('done\n')
+        dump('Writing protocol.dat... ')
+        seq = self.sequence
+
+        # let's check if IP that we have a positive geometric factor
+        if self.typ[0] == 'c': # NOTE this doesn't work for borehole
+            lookupDict = dict(zip(self.elec['label'], np.arange(self.elec.shape[0])))
+            seqdf = pd.DataFrame(seq).rename(columns = {0:'a', 1:'b', 2:'m', 3:'n'})
+            array = seqdf[['a','b','m','n']].astype(str).replace(lookupDict).values.astype(int)
+            elec = self.elec[['x','y','z']].values.copy()
+            
             aposx = elec[:,0][array[:,0]]
             aposy = elec[:,1][array[:,0]]
             aposz = elec[:,2][array[:,0]]
@@ -5047,54 +6356,179 @@ class Project(object): # Project master class instanciated by the GUI
             protocol.to_csv(f, sep='\t', header=False, index=False, line_terminator='\n')
         dump('done\n')
 
-        # fun the inversion
-        dump('Running forward model... ')
-        self.runR2(fwdDir, dump=dump) # this will copy the R2.exe inside as well
-        self.iForward = True
 
-        # create a protocol.dat file (overwrite the method)
-        def addnoise(x, level=0.05):
-            return x + np.random.randn(1)*x*level
+    @traced
+    def forwardBatch(self, models, phases=None, ncores=None, outFile=None, dump=None):
+        """Compute the forward responses of many models on the same mesh and
+        sequence (e.g. for Monte Carlo or synthetic studies). The mesh, .in
+        file and protocol.dat are written once and shared by all runs which
+        are distributed over `ncores` processes.
 
-        def addnoiseIP(x, level=2):
-            return x + np.random.randn(1)*level
+        Parameters
+        ----------
+        models : array of float
+            Resistivity models (n_models x n_cells) in Ohm.m.
+        phases : array of float, optional
+            Phase models in mrad (n_models x n_cells), only for cR2/cR3t.
+            Default is the 'phase0' attribute of the mesh for all models.
+        ncores : int, optional
+            Number of forward models run at the same time. Default is the
+            number of cores.
+        outFile : str, optional
+            If specified, the responses are written to this memory-mapped .npy
+            file as soon as they are computed (and the phases to the same
+            name ending with '-ip.npy'). The file is removed if an error
+            stops the batch.
+        dump : function, optional
+            Function to print information messages.
 
-        addnoise = np.vectorize(addnoise)
-        addnoiseIP = np.vectorize(addnoiseIP)
-        self.noise = noise # percentage noise e.g. 5 -> 5% noise
-        self.noiseIP = noiseIP #absolute noise in mrad, following convention of cR2
-        
-        fmd = self.fmd#.copy()
-        elec = self.elec.copy()
-        if self.typ[-1]=='t' and not self.hasElecString():
-            #need to add elec strings to labels if in 3D
-            for i in range(elec.shape[0]):
-                elec.loc[i,'label'] = '1 ' + elec['label'][i]
-            
-        self.surveys = [] # need to flush it (so no timeLapse forward)
-        if self.typ[0] == 'c':
-            self.createSurvey(os.path.join(fwdDir, self.typ + '_forward.dat'), 
-                              ftype='forwardProtocolIP',
-                              compRecip=False) # dont compute reciprocals as that will be done after adding noise (see lines below)
-        else:
-            self.createSurvey(os.path.join(fwdDir, self.typ + '_forward.dat'), 
-                              ftype='forwardProtocolDC',
-                              compRecip=False)
-            
-        # NOTE the 'ip' columns here is in PHASE not in chargeability
-        self.surveys[0].kFactor = 1 # kFactor by default is = 1 now, though wouldn't hurt to have this here!
-        self.surveys[0].df['resist'] = addnoise(self.surveys[0].df['resist'].values, self.noise/100)
-        self.surveys[0].df['ip'] = addnoiseIP(self.surveys[0].df['ip'].values, self.noiseIP)
-        self.surveys[0].computeReciprocal() # to recreate the other columns
-        self.setElec(elec) # using R2.createSurvey() overwrite self.elec so we need to set it back
-        # self.fmd = fmd      
+        Returns
+        -------
+        resist : array of float
+            Transfer resistances (n_models x n_quads) in the order of
+            `R2.sequence`. NaN for failed runs (and for the models not
+            computed if the batch is killed).
+        phase : array of float
+            Phases (n_models x n_quads), only returned for cR2/cR3t.
+        """
+        if dump is None:
+            def dump(x):
+                print(x, end='')
+        if ncores is None:
+            ncores = systemCheck(dump=lambda x: None)['core_count']
+        models = np.atleast_2d(models)
+        if models.shape[1] != self.mesh.numel:
+            raise ValueError('Models must have {:d} values (number of cells).'.format(self.mesh.numel))
+        ip = self.typ[0] == 'c'
+        if ip:
+            if phases is None:
+                phases = np.tile(self.mesh.df['phase0'].values, (models.shape[0], 1))
+            phases = np.atleast_2d(phases)
+
+        # inputs shared by all runs
+        batchDir = os.path.join(self.dirname, 'fwdbatch')
+        if os.path.exists(batchDir):
+            shutil.rmtree(batchDir)
+        shape = (models.shape[0], len(self.sequence))
+        outFiles = [] if outFile is None else [outFile]
+        if ip and outFile is not None:
+            outFiles.append(outFile.replace('.npy', '') + '-ip.npy')
+        def allocate(fname):
+            if fname is None:
+                return np.full(shape, np.nan)
+            out = np.lib.format.open_memmap(fname, mode='w+', dtype=float, shape=shape)
+            out[:] = np.nan
+            return out
+        resist = None
+        phase = None
+        ok = False
+        nfailed = 0
+        try:
+            templateDir = os.path.join(batchDir, 'template')
+            os.makedirs(templateDir)
+            self._writeForwardInputs(templateDir, dump=lambda x: None)
+            inputs = os.listdir(templateDir)
+            resist = allocate(outFile)
+            phase = allocate(outFiles[-1] if outFile is not None else None) if ip else None
+
+            centroids = self.mesh.elmCentre
+            centroids = centroids[:,[0,2]] if self.typ[-1] != 't' else centroids
+            chunk = 4*ncores # number of run directories existing at the same time
+            for i0 in range(0, models.shape[0], chunk):
+                wds = []
+                for i in range(i0, min(i0 + chunk, models.shape[0])):
+                    wd = os.path.join(batchDir, str(i))
+                    os.mkdir(wd)
+                    for f in inputs:
+                        try: # hard link instead of copying the mesh for each run
+                            os.link(os.path.join(templateDir, f), os.path.join(wd, f))
+                        except OSError:
+                            shutil.copy(os.path.join(templateDir, f), os.path.join(wd, f))
+                    r = models[i]
+                    if ip:
+                        p = phases[i]
+                        x = np.c_[centroids, r, p, np.log10(r),
+                                  np.log10(np.cos(-p/1000)/np.log10(r)),
+                                  np.log10(np.sin(-p/1000)/np.log10(r))]
+                    else:
+                        x = np.c_[centroids, r, np.log10(r)]
+                    np.savetxt(os.path.join(wd, 'resistivity.dat'), x, fmt='%.5e')
+                    wds.append(wd)
+                failed = self._runDirs(wds, ncores=ncores, dump=lambda x: None,
+                                       raiseError=False)
+                nfailed += len(failed)
+                for i, wd in zip(range(i0, i0 + len(wds)), wds):
+                    fname = os.path.join(wd, self.typ + '_forward.dat')
+                    if wd not in failed and os.path.exists(fname):
+                        try:
+                            _, df = protocolParser(fname, ip=ip, fwd=True)
+                            resist[i,:] = df['resist'].values
+                            if ip:
+                                phase[i,:] = df['ip'].values
+                        except Exception: # incomplete output, row left to NaN
+                            nfailed += 1
+                    shutil.rmtree(wd)
+                dump('\r{:d}/{:d} forward models computed'.format(i0 + len(wds), models.shape[0]))
+                if self.irunParallel2 is False: # killed, the other rows are NaN
+                    dump('\nKilled, {:d} models not started'.format(models.shape[0] - i0 - len(wds)))
+                    break
+            dump('\n')
+            if nfailed > 0:
+                dump('{:d} forward models failed (NaN responses)\n'.format(nfailed))
+            ok = True
+        finally:
+            if os.path.exists(batchDir):
+                shutil.rmtree(batchDir, ignore_errors=True)
+            for out in [resist, phase]:
+                if isinstance(out, np.memmap):
+                    out.flush()
+            if ok is False: # no partial output file left behind
+                del resist, phase
+                for f in outFiles:
+                    if os.path.exists(f):
+                        os.remove(f)
+        return (resist, phase) if ip else resist
+
+
+    def forwardAsync(self, progress=None, executor=None, **kwargs):
+        """Run `Project.forward()` in a background thread and return
+        immediately.
 
-        # recompute doi (don't actually otherwise zlim is jumping)
-        # self.computeFineMeshDepth()
-        # self.zlim[0] = np.min(elec['z']) - self.fmd
-        if iplot is True:
-            self.showPseudo()
-        dump('Forward modelling done.')
+        Parameters
+        ----------
+        progress : function, optional
+            Function called as `progress(event, value)` with the events
+            'start', 'output' (value is a line of output) and 'done' (value is
+            the forward `Survey`).
+        executor : concurrent.futures.Executor, optional
+            Executor to which the forward model is submitted. By default a
+            thread pool shared by all projects is used.
+        **kwargs : optional
+            Keyword arguments passed to `Project.forward()`. If `dump` is
+            not provided, the output is not printed.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future which result is the `Survey` object of the forward model.
+            Use `asyncio.wrap_future(future)` to await it in a coroutine.
+        """
+        if progress is None:
+            def progress(event, value):
+                pass
+        if executor is None:
+            executor = getAsyncExecutor()
+        dump = kwargs.pop('dump', None)
+        def dumpProgress(x):
+            if dump is not None:
+                dump(x)
+            progress('output', x)
+        def run():
+            progress('start', None)
+            self.forward(dump=dumpProgress, **kwargs)
+            progress('done', self.surveys[0])
+            return self.surveys[0]
+        return executor.submit(run)
 
 
     def createModelErrorMesh(self, **kwargs):
@@ -5102,6 +6536,8 @@ class Project(object): # Project master class instanciated by the GUI
 
         Same arguments as `R2.createMesh()`.
         """
+        self.modErrMeshKey = None # unknown parameters, set by computeModelError()
+        
         # backup
         elecZ = self.elec['z'].values.copy()
         mesh = self.mesh.copy() if self.mesh is not None else None
@@ -5162,9 +6598,51 @@ class Project(object): # Project master class instanciated by the GUI
             s.addPerError(percent)
             
 
+    @traced
+    def computeModelErrorAsync(self, progress=None, executor=None, **kwargs):
+        """Run `Project.computeModelError()` in a background thread and return
+        immediately.
+
+        Parameters
+        ----------
+        progress : function, optional
+            Function called as `progress(event, value)` with the events
+            'start' and 'done' (value is the list of surveys, the modelling
+            error is in their 'modErr' column).
+        executor : concurrent.futures.Executor, optional
+            Executor to which the forward model is submitted. By default a
+            thread pool shared by all projects is used.
+        **kwargs : optional
+            Keyword arguments passed to `Project.computeModelError()`.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future which result is the list of `Survey` objects.
+        """
+        if progress is None:
+            def progress(event, value):
+                pass
+        if executor is None:
+            executor = getAsyncExecutor()
+        def run():
+            progress('start', None)
+            self.computeModelError(**kwargs)
+            progress('done', self.surveys)
+            return self.surveys
+        return executor.submit(run)
+
+
     def computeModelError(self, rmTree=True):
         """Compute modelling error associated with the mesh.
         This is computed on a flat triangular or tetrahedral mesh.
+        The modelling error of each quadrupole is cached in the 'modErr'
+        directory of the working directory, keyed on the mesh and electrode
+        geometry, so that a forward run is only needed for the quadrupoles
+        which have not been computed yet on the same mesh. The working
+        directory is cleared by `setwd()` (and so when a new `Project` uses
+        it), and the flat mesh is not saved with the project: the cache only
+        lasts as long as the project in this session.
 
         Parameters
         ----------
@@ -5174,13 +6652,17 @@ class Project(object): # Project master class instanciated by the GUI
         """
         node_elec = None # we need this as the node_elec with topo and without might be different
         if all(self.elec['z'].values == 0) is False: # so we have topography
-            print('New mesh created with flat topo...', end='')
             meshParams = self.meshParams.copy()
             if '3' in self.typ:#change interp method 
                 meshParams['interp_method'] = None # dont do any interpolation 
             if 'geom_input' in meshParams: # dont use geometry from here because it'll likley be incompatible on the flat mesh
                 meshParams['geom_input'] = {}
-            self.createModelErrorMesh(**meshParams)
+            meshKey = (repr(sorted(meshParams.items())),
+                       self.elec[['x','y','z']].values.tobytes())
+            if self.modErrMeshKey != meshKey:
+                print('New mesh created with flat topo...', end='')
+                self.createModelErrorMesh(**meshParams)
+                self.modErrMeshKey = meshKey
             node_elec = self.modErrMeshNE
             mesh = self.modErrMesh # create flat mesh
         else:
@@ -5223,60 +6705,83 @@ class Project(object): # Project master class instanciated by the GUI
             fparam['node_elec'] = node_elec
         fparam['num_regions'] = 0
         fparam['res0File'] = 'resistivity.dat'
-        
-        write2in(fparam, fwdDir, typ=self.typ)
 
-        # write the protocol.dat based on measured sequence
-        seq = self.surveys[0].df[['a','b','m','n']].values
-        if len(self.surveys) > 0: # multiple survey here
-            seq = []
-            for s in self.surveys:
-                seq.append(s.df[['a','b','m','n']].values)
-            seq = np.vstack(seq).astype(str)
-            seq = np.unique(seq, axis=0)
-        protocol = pd.DataFrame(np.c_[1+np.arange(seq.shape[0]),seq],
-                                columns=['index','a','b','m','n'])
-        if (self.typ == 'R3t') | (self.typ == 'cR3t'): # it's a 3D survey
-            if len(protocol['a'].values[0].split()) == 1: # we don't have string number
-                for c in ['a','b','m','n']: 
-                    protocol.loc[:, c] = '1 ' + protocol[c]
-            # protocol.insert(1, 'sa', 1)
-            # protocol.insert(3, 'sb', 1)
-            # protocol.insert(5, 'sm', 1)
-            # protocol.insert(7, 'sn', 1)
-        outputname = os.path.join(fwdDir, 'protocol.dat')
-        with open(outputname, 'w') as f:
-            f.write(str(len(protocol)) + '\n')
-        with open(outputname, 'a') as f:
-            protocol.to_csv(f, sep='\t', header=False, index=False, line_terminator='\n')
+        # modelling errors already computed with the same mesh and electrodes
+        sha1 = fileSHA1(file_path)
+        sha1.update(self.typ.encode())
+        sha1.update(repr([list(np.asarray(a).astype(str)) for a in fparam['node_elec']]).encode())
+        sha1.update(self.elec[['x','y','z']].values.tobytes())
+        cacheFile = os.path.join(self.dirname, 'modErr', sha1.hexdigest() + '.csv')
+        if os.path.exists(cacheFile):
+            dfcache = pd.read_csv(cacheFile, dtype={'a':str, 'b':str, 'm':str, 'n':str})
+        else:
+            dfcache = pd.DataFrame(columns=['a','b','m','n','modErr'])
 
-        # run the inversion
-        self.runR2(fwdDir) # this will copy the R2.exe inside as well
-
-        # get error model
-        # if (self.typ == 'R3t') | (self.typ == 'cR3t'):
-        #     try:
-            # x = np.genfromtxt(os.path.join(fwdDir, self.typ + '_forward.dat'), skip_header=0)
-        #     except:#try just reading in the last 2 columns instead
-        #         fh = open(os.path.join(fwdDir, self.typ + '.fwd'))
-        #         no_meas = len(protocol)
-        #         trans_res = [0]*no_meas
-        #         app_res = [0]*no_meas
-        #         for i in range(no_meas):
-        #             line = fh.readline().split()
-        #             trans_res[i] = float(line[-2])
-        #             app_res[i] = float(line[-1])
-        #         x = np.array((trans_res,app_res)).T
-        #         fh.close()
+        # sequence of the quadrupoles not in the cache
+        seq = []
+        for s in self.surveys:
+            seq.append(s.df[['a','b','m','n']].values)
+        seq = np.vstack(seq).astype(str)
+        seq = np.unique(seq, axis=0)
+        dfseq = pd.DataFrame(seq, columns=['a','b','m','n'])
+        dfseq = pd.merge(dfseq, dfcache, on=['a','b','m','n'], how='left')
+        seq = dfseq[dfseq['modErr'].isna()][['a','b','m','n']].values
+        
+        if seq.shape[0] > 0:
+            write2in(fparam, fwdDir, typ=self.typ)
+            
+            # write the protocol.dat based on measured sequence
+            protocol = pd.DataFrame(np.c_[1+np.arange(seq.shape[0]),seq],
+                                    columns=['index','a','b','m','n'])
+            if (self.typ == 'R3t') | (self.typ == 'cR3t'): # it's a 3D survey
+                if len(protocol['a'].values[0].split()) == 1: # we don't have string number
+                    for c in ['a','b','m','n']: 
+                        protocol.loc[:, c] = '1 ' + protocol[c]
+                # protocol.insert(1, 'sa', 1)
+                # protocol.insert(3, 'sb', 1)
+                # protocol.insert(5, 'sm', 1)
+                # protocol.insert(7, 'sn', 1)
+            outputname = os.path.join(fwdDir, 'protocol.dat')
+            with open(outputname, 'w') as f:
+                f.write(str(len(protocol)) + '\n')
+            with open(outputname, 'a') as f:
+                protocol.to_csv(f, sep='\t', header=False, index=False, line_terminator='\n')
+    
+            # run the inversion
+            self.runR2(fwdDir) # this will copy the R2.exe inside as well
+    
+            # get error model
+            # if (self.typ == 'R3t') | (self.typ == 'cR3t'):
+            #     try:
+                # x = np.genfromtxt(os.path.join(fwdDir, self.typ + '_forward.dat'), skip_header=0)
+            #     except:#try just reading in the last 2 columns instead
+            #         fh = open(os.path.join(fwdDir, self.typ + '.fwd'))
+            #         no_meas = len(protocol)
+            #         trans_res = [0]*no_meas
+            #         app_res = [0]*no_meas
+            #         for i in range(no_meas):
+            #             line = fh.readline().split()
+            #             trans_res[i] = float(line[-2])
+            #             app_res[i] = float(line[-1])
+            #         x = np.array((trans_res,app_res)).T
+            #         fh.close()
+    
+            # else:
+            x = np.genfromtxt(os.path.join(fwdDir, self.typ + '_forward.dat'), skip_header=1)
+            modErr = np.abs(100-x.reshape(seq.shape[0], -1)[:,-1])/100
+            dfnew = pd.DataFrame(seq, columns=['a','b','m','n'])
+            dfnew['modErr'] = modErr
+            dfcache = pd.concat([dfcache, dfnew], ignore_index=True)
+            if os.path.exists(os.path.dirname(cacheFile)) is False:
+                os.mkdir(os.path.dirname(cacheFile))
+            dfcache.to_csv(cacheFile, index=False)
+        else:
+            print('Modelling errors retrieved from cache')
 
-        # else:
-        x = np.genfromtxt(os.path.join(fwdDir, self.typ + '_forward.dat'), skip_header=1)
-        modErr = np.abs(100-x[:,-1])/100
-        dferr = pd.DataFrame(seq, columns=['a','b','m','n'])
-        dferr['modErr'] = modErr
+        dferr = dfcache
         for s in self.surveys:
             if 'modErr' in s.df:
-                s.df.drop('modErr', axis=1)
+                s.df = s.df.drop('modErr', axis=1)
             s.df = pd.merge(s.df, dferr, on=['a','b','m','n'], how='inner')
 
         if rmTree:# eventually delete the directory to spare space
@@ -5362,108 +6867,204 @@ class Project(object): # Project master class instanciated by the GUI
 
 
 
-    def saveInvPlots(self, outputdir=None, **kwargs):
+    def saveInvPlots(self, outputdir=None, ncores=None, fmt='png', movie=None,
+                     fps=5, dpi=100, figsize=None, dump=None, **kwargs):
         """Save all plots to output (or working directory). Parameters
         are passed to the `showResults()` method.
+        
+        For 2D results, the mesh is drawn once and only its colours change
+        from one result to the next (see `resipy.batchPlot`). The frames are
+        rendered offscreen, possibly by several processes. Options of
+        `showResults()` which can't be drawn this way (e.g. contour, doi)
+        fall back to calling `showResults()` for each result.
 
         Parameters
         ----------
         outputdir : str, optional
             Path of the output directory. Default is the working directory.
+        ncores : int, optional
+            Number of processes rendering the frames.
+        fmt : str, optional
+            Format of the frames ('png', 'svg', 'jpg', ...).
+        movie : str, optional
+            If specified, name of a movie (e.g. 'timelapse.mp4') made from the
+            frames with ffmpeg (which must be installed).
+        fps : float, optional
+            Frames per second of the movie.
+        dpi : int, optional
+            Resolution of the frames.
+        figsize : tuple of float, optional
+            Size of the figure in inches.
+        dump : function, optional
+            Function to print the progress.
+
+        Returns
+        -------
+        fnames : list of str
+            Path of the frames.
         """
         if outputdir is None:
             outputdir = self.dirname
+        if dump is None:
+            def dump(x):
+                print(x, end='')
         if len(self.meshResults) == 0:
             self.getResults()
-        for i in range(len(self.meshResults)):
-            fig, ax = plt.subplots()
-            self.showResults(index=i, ax=ax, **kwargs)
-            fname = self.meshResults[i].mesh_title
-            fig.savefig(os.path.join(outputdir, fname + '.png'))
+        n = len(self.meshResults)
+        titles = self.meshResults.titles() if isinstance(self.meshResults, MeshResults) \
+            else [m.mesh_title for m in self.meshResults]
+        fnames = [os.path.join(outputdir, '{:s}.{:s}'.format(t, fmt)) for t in titles]
+        if movie is not None and fmt == 'svg':
+            raise ValueError('Frames must be raster images (e.g. fmt="png") to make a movie.')
+
+        # options that the batch renderer supports
+        options = ['attr', 'color_map', 'vmin', 'vmax', 'edge_color', 'sens', 'zlim',
+                   'xlim', 'clabel', 'cropMaxDepth', 'clipContour', 'aspect']
+        batch = (self.typ[-1] == '2' and self.pseudo3DSurvey is None and
+                 all([k in options for k in kwargs]))
+        if batch is False:
+            for i in range(n):
+                fig, ax = plt.subplots(figsize=figsize)
+                self.showResults(index=i, ax=ax, **kwargs)
+                fig.savefig(fnames[i], dpi=dpi)
+                plt.close(fig)
+                dump('\r{:d}/{:d} figures saved'.format(i+1, n))
+            dump('\n')
+        else:
+            t0 = time.time()
+            mesh0 = self.meshResults[0]
+            attr = kwargs.get('attr', '')
+            if attr == '':
+                attr = 'Resistivity(log10)' if self.typ[0] != 'c' else 'Sigma_real(log10)'
+            if attr not in mesh0.df.columns:
+                attr = mesh0.df.columns[3]
+                print('Attribute not found, revert to {:s}'.format(attr))
+            edge_color = kwargs.get('edge_color', 'none')
+            if edge_color is None or edge_color in ['none', 'None']:
+                edge_color = 'face'
+            clip = None
+            if kwargs.get('clipContour', True):
+                cropMaxDepth = kwargs.get('cropMaxDepth', True)
+                if (self.topo.shape[0] == 0) & (all(self.elec['buried'])): # whole space
+                    cropMaxDepth = False
+                clip = self._clipVertices(cropMaxDepth=cropMaxDepth)
+            def surfaceElec(mesh):
+                if mesh.elec is None:
+                    return None
+                return mesh.elec[~mesh.iremote] if mesh.iremote is not None else mesh.elec
+            xlim = kwargs.get('xlim', None)
+            if xlim is None:
+                elec = surfaceElec(mesh0)
+                elec = mesh0.node if elec is None else elec
+                xlim = [np.min(elec[:,0]), np.max(elec[:,0])]
+            zlim = kwargs.get('zlim', None)
+            if zlim is None:
+                zlim = self.zlim
+            sens = kwargs.get('sens', True) and 'Sensitivity(log10)' in mesh0.df.columns
+            geometry = {'coordinates': mesh0.node[:,[0,2]][mesh0.connection],
+                        'xlim': xlim, 'zlim': zlim, 'clip': clip, 'sens': sens,
+                        'color_map': kwargs.get('color_map', 'viridis'),
+                        'edge_color': edge_color, 'clabel': kwargs.get('clabel', None) or attr,
+                        'figsize': figsize, 'dpi': dpi, 'aspect': kwargs.get('aspect', 'equal'),
+                        'darkMode': self.darkMode}
+            numel = mesh0.numel
+            other = [] # results with a different mesh
+
+            def tasks(): # read the results by chunks (in parallel) as they are rendered
+                chunk = self.meshResults.maxCache if isinstance(self.meshResults, MeshResults) else n
+                for i0 in range(0, n, max(chunk, 1)):
+                    indices = range(i0, min(i0 + chunk, n))
+                    if isinstance(self.meshResults, MeshResults):
+                        self.meshResults.prefetch(indices, ncores=ncores)
+                    for i in indices:
+                        mesh = self.meshResults[i]
+                        if mesh.numel != numel or attr not in mesh.df.columns:
+                            other.append(i)
+                            continue
+                        elec = surfaceElec(mesh)
+                        yield {'fname': fnames[i], 'title': titles[i],
+                               'values': np.array(mesh.df[attr]),
+                               'vmin': kwargs.get('vmin', None), 'vmax': kwargs.get('vmax', None),
+                               'weights': np.array(mesh.df['Sensitivity(log10)'])
+                               if sens and 'Sensitivity(log10)' in mesh.df.columns else None,
+                               'elec': None if elec is None else elec[:,[0,2]]}
+
+            batchPlot.renderFrames(geometry, tasks(), ncores=ncores,
+                dump=lambda c: dump('\r{:d}/{:d} figures saved'.format(c, n)))
+            for i in other:
+                fig, ax = plt.subplots(figsize=figsize)
+                self.showResults(index=i, ax=ax, **kwargs)
+                fig.savefig(fnames[i], dpi=dpi)
+                plt.close(fig)
+            dump('\n{:d} figures saved in {:.2f}s\n'.format(n, time.time() - t0))
+        if movie is not None:
+            batchPlot.makeMovie(fnames, os.path.join(outputdir, movie), fps=fps)
+            dump('Movie saved as {:s}\n'.format(os.path.join(outputdir, movie)))
+        return fnames
         
     
-    def getInvError(self):
+    @traced
+    def getInvError(self, ncores=None):
+        """Read the inversion errors (f###_err.dat) and add them to the
+        dataframe of each survey ('resInvError' and 'phaseInvMisfit'
+        columns).
+
+        Parameters
+        ----------
+        ncores : int, optional
+            If specified, the error files are parsed with `ncores` threads
+            (the parsing is mostly reading the files and in pandas C code).
+        """
         a = 1 if self.iTimeLapse else 0
+        fnames = []
+        if self.iTimeLapse:
+            fnames.append(os.path.join(self.dirname, 'ref/f001_err.dat'))
+        for i in range(len(self.surveys)-a):
+            fnames.append(os.path.join(self.dirname, 'f{:03.0f}_err.dat'.format(i+1)))
+        fnames = [f for f in fnames if os.path.exists(f)]
         try:
-            if self.typ == 'cR2' or self.typ == 'R2':
-                dfs = []
-                if self.iTimeLapse:
-                    fname = os.path.join(self.dirname, 'ref/f001_err.dat')
-                    if os.path.exists(fname):                    
-                        df = pd.read_csv(fname, delim_whitespace=True)
-                        dfs.append(df)
-                for i in range(len(self.surveys)-a):
-                    fname = os.path.join(self.dirname, 'f{:03.0f}_err.dat'.format(i+1))
-                    if os.path.exists(fname):
-                        df = pd.read_csv(fname, delim_whitespace=True)
-                        dfs.append(df)
-            elif self.typ == 'R3t':
-                dfs = []
-                if self.iTimeLapse:
-                    fname = os.path.join(self.dirname, 'ref/f001_err.dat')
-                    if os.path.exists(fname):
-                        err = np.genfromtxt(fname, skip_header=1)
-                        df = pd.DataFrame(err[:,[0,1,2,3,4,5,6,7,8]],
-                                          columns=['sa','P+','sb','P-','sm','C+','sn','C-', 'Normalised_Error'])
-                        dfs.append(df)
-                for i in range(len(self.surveys)-a):
-                    fname = os.path.join(self.dirname, 'f{:03.0f}_err.dat'.format(i+1))
-                    if os.path.exists(fname):
-                        err = np.genfromtxt(fname, skip_header=1)
-                        df = pd.DataFrame(err[:,[0,1,2,3,4,5,6,7,8]],
-                                          columns=['sa','P+','sb','P-','sm','C+','sn','C-', 'Normalised_Error'])
-                        dfs.append(df);
-            else: # TODO cR3t header needs to be standardized
-                dfs = []
-                if self.iTimeLapse:
-                    fname = os.path.join(self.dirname, 'ref/f001_err.dat')
-                    if os.path.exists(fname):
-                        err = np.genfromtxt(fname, skip_header=1)
-                        df = pd.DataFrame(err[:,[0,1,2,3,4,5,6,7,8,11,12]],
-                                          columns=['sa','P+','sb','P-','sm','C+','sn','C-', 'Normalised_Error', 'Observed_Phase', 'Calculated_Phase'])
-                        dfs.append(df)
-                for i in range(len(self.surveys)-a):
-                    fname = os.path.join(self.dirname, 'f{:03.0f}_err.dat'.format(i+1))
-                    if os.path.exists(fname):
-                        err = np.genfromtxt(fname, skip_header=1)
-                        df = pd.DataFrame(err[:,[0,1,2,3,4,5,6,7,8,11,12]],
-                                          columns=['sa','P+','sb','P-','sm','C+','sn','C-', 'Normalised_Error', 'Observed_Phase', 'Calculated_Phase'])
-                        dfs.append(df)
-                        
-            dfs2 = []
-            check = True # check if first value of survey frames are in line number and electrode fmt 
-            if len(self.surveys[0].df['a'][0].split()) == 1:
-                check = False 
-            for df in dfs:
-                df = df.astype({'P+':int, 'P-':int, 'C+':int, 'C-':int})
-                if check and (self.typ == 'R3t' or self.typ == 'cR3t'):
-                    df = df.astype({'sa':int, 'sb':int, 'sm':int, 'sn':int})
-                    df['P+'] = df['sa'].astype(str) + ' ' + df['P+'].astype(str)
-                    df['P-'] = df['sb'].astype(str) + ' ' + df['P-'].astype(str)
-                    df['C+'] = df['sm'].astype(str) + ' ' + df['C+'].astype(str)
-                    df['C-'] = df['sn'].astype(str) + ' ' + df['C-'].astype(str)
-                else:
-                    df = df.astype({'P+':str, 'P-':str, 'C+':str, 'C-':str})
-                dfs2.append(df)
-            dfs = dfs2
+            if ncores is not None and ncores > 1 and len(fnames) > 1:
+                with ThreadPoolExecutor(max_workers=ncores) as executor:
+                    errs = list(executor.map(readInvError, fnames, [self.typ]*len(fnames)))
+            else:
+                errs = [readInvError(f, self.typ) for f in fnames]
         except Exception as e:
             return # this code is error prone (mainly to empty dataframe error)
         # merge the columns to each survey dataframe
-        if  np.sum([df.shape[0] > 0 for df in dfs]) != len(self.surveys):
+        if np.sum([err.shape[0] > 0 for _, err in errs]) != len(self.surveys):
             print('error in reading error files (do not exists or empty')
             return # this check the number of dfs AND the fact that they are not empty
-        for s, df in zip(self.surveys, dfs):
-            df = df.rename(columns=dict(zip(['P+','P-','C+','C-', 'Normalised_Error'], ['a','b','m','n', 'resInvError'])))
-            cols = ['a','b','m','n','resInvError']
-            
+        check = True # check if first value of survey frames are in line number and electrode fmt 
+        if len(self.surveys[0].df['a'][0].split()) == 1:
+            check = False
+        useLine = check and (self.typ == 'R3t' or self.typ == 'cR3t')
+        for s, (cols, err) in zip(self.surveys, errs):
+            icol = dict(zip(cols, np.arange(len(cols))))
+            values = {'resInvError': err[:,icol['Normalised_Error']]}
             if (self.typ == 'cR2') | (self.typ == 'cR3t'):
-                df['phaseInvMisfit'] = np.abs(df['Observed_Phase'] - df['Calculated_Phase'])
-                cols += ['phaseInvMisfit']
-            if 'resInvError' in s.df.columns:
-                s.df = s.df.drop('resInvError', axis=1)
-            if 'phaseInvMisfit' in s.df.columns:
-                s.df = s.df.drop('phaseInvMisfit', axis=1)
-            s.df = pd.merge(s.df, df[cols], on=['a','b','m','n'], how='left')
+                values['phaseInvMisfit'] = np.abs(err[:,icol['Observed_Phase']]
+                                                  - err[:,icol['Calculated_Phase']])
+            for col in values:
+                if col in s.df.columns:
+                    s.df = s.df.drop(col, axis=1)
+            elecs = err[:,[icol[c] for c in ['P+','P-','C+','C-']]].astype(int)
+            if useLine:
+                lines = err[:,[icol[c] for c in ['sa','sb','sm','sn']]].astype(int)
+            else:
+                lines = np.zeros_like(elecs)
+            try: # merge on integer quadrupole keys
+                ikeep = quadIndex(s.df[['a','b','m','n']].values, lines, elecs)
+                found = ikeep >= 0
+                for col in values:
+                    s.df[col] = np.nan
+                    s.df.loc[found, col] = values[col][ikeep[found]]
+            except ValueError: # duplicated quadrupoles or non integer labels
+                df = pd.DataFrame(dict([(c, values[c]) for c in values]))
+                for j, c in enumerate(['a','b','m','n']):
+                    df[c] = elecs[:,j].astype(str)
+                    if useLine:
+                        df[c] = lines[:,j].astype(str) + ' ' + df[c]
+                s.df = pd.merge(s.df, df, on=['a','b','m','n'], how='left')
             s.dfInvErrOutputOrigin = s.df.copy() # for being able to reset post processing filters
 
                     
@@ -5858,6 +7459,7 @@ class Project(object): # Project master class instanciated by the GUI
     #         self.meshResults[i].computeReciprocal(res_name,'Conductivity(S/m)')
 
 
+    @traced
     def computeDiff(self):
         """Compute the absolute and the relative difference in resistivity
         between inverted surveys.
@@ -5869,43 +7471,26 @@ class Project(object): # Project master class instanciated by the GUI
 
         # create an index for the values inside of the zone of interest
         # needed as the reference survey is not cropped by default
-        inside = np.ones(self.meshResults[0].numel, dtype=bool)
-        if (self.typ == 'R3t') or (self.typ == 'cR3t'):
-            pname = 'num_xy_poly'
-            tableName = 'xy_poly_table'
-        else:
-            pname = 'num_xz_poly'
-            tableName = 'xz_poly_table'
-        if self.param[pname] > 0:
-            meshx = np.array(self.meshResults[0].elmCentre[:,0])
-            meshy = np.array(self.meshResults[0].elmCentre[:,1])
-            meshz = np.array(self.meshResults[0].elmCentre[:,2])
-            # poly = (self.param['xz_poly_table'][:,0],
-                    # self.param['xz_poly_table'][:,1])
-            path = mpath.Path(self.param[tableName])
-
-            if self.typ[-2]=='3':
-                # inside1 = iip.isinpolygon(meshx, meshy, poly)
-                inside1 = path.contains_points(np.c_[meshx, meshy])
-                inside2 = (meshz > self.param['zmin']) & (meshz < self.param['zmax'])
-                inside = inside1 & inside2
-            else:
-                # inside = iip.isinpolygon(meshx, meshz, poly)
-                inside = path.contains_points(np.c_[meshx, meshz])
+        inside = self._getRoi(self.meshResults[0])
                 
         # compute absolute and relative difference in resistivity
         res_names = np.array(['Resistivity','Resistivity(Ohm-m)','Resistivity(ohm.m)'])
         res_name = res_names[np.in1d(res_names, list(self.meshResults[0].df.keys()))][0]
         res0 = np.array(self.meshResults[0].df[res_name])[inside]
-        for i in range(1, len(self.meshResults)):
-            if 'difference(percent)' not in self.meshResults[i].df.columns:
+        def difference(mesh, i):
+            if i > 0 and 'difference(percent)' not in mesh.df.columns:
                 try:
-                    res = np.array(self.meshResults[i].df[res_name])
-                    self.meshResults[i].addAttribute(res - res0, 'diff(Resistivity)')
-                    self.meshResults[i].addAttribute((res-res0)/res0*100, 'difference(percent)')
+                    res = np.array(mesh.df[res_name])
+                    mesh.addAttribute(res - res0, 'diff(Resistivity)')
+                    mesh.addAttribute((res-res0)/res0*100, 'difference(percent)')
                 except Exception as e:
                     print('error in computing difference:', e)
                     pass
+        if isinstance(self.meshResults, MeshResults): # computed when loaded
+            self.meshResults.addTransform(difference)
+        else:
+            for i in range(1, len(self.meshResults)):
+                difference(self.meshResults[i], i)
         
         # num_attr = len(self.meshResults[0].df)
         # num_elm = self.meshResults[0].numel
@@ -5947,6 +7532,7 @@ class Project(object): # Project master class instanciated by the GUI
 
 
 
+    @traced
     def saveVtks(self, dirname=None):
         """Save vtk files of inversion results to a specified directory.
 
@@ -6008,6 +7594,27 @@ class Project(object): # Project master class instanciated by the GUI
         [print(key) for i,key in enumerate(self.param)]
 
 
+    @property
+    def timings(self):
+        """Summary table of the traced stages of this project (see
+        `resipy.tracing`; tracing must be enabled with `tracing.enable()` or
+        the RESIPY_TRACE environment variable).
+        """
+        return tracing.summary(owner=self)
+
+
+    def saveTrace(self, fname):
+        """Save the traced stages of this project as a Chrome trace-event
+        JSON file (open it in chrome://tracing or https://ui.perfetto.dev).
+
+        Parameters
+        ----------
+        fname : str
+            Path of the .json file.
+        """
+        tracing.exportChromeTrace(fname, owner=self)
+
+
     def filterZeroMeasSurveys(self):
         """Filter out badly behaved surveys, where after all other QC no measurements
         are actually left."""
@@ -6043,69 +7650,14 @@ class Project(object): # Project master class instanciated by the GUI
             Memory needed for problem in gigabytes 
 
         """
-        #NB: using variable names from Andy's codes 
         if self.mesh is None:
             dump('A mesh is required before a memory usage estimate can be made')
             return 0
         if len(self.surveys) == 0:
             dump('A survey needs to imported before a memory usage estimate can be made')
             return 0
-        else: # number of measurements computation 
-            nmeas = []
-            for s in self.surveys:
-                df = s.df 
-                ie = df['irecip'].values >= 0 # count the number of measurements actually put to file 
-                nmeas.append(sum(ie))
-            num_ind_meas = np.mean(nmeas) # number of measurements 
-            mnum_ind_meas = num_ind_meas # maximum number of measurements
-                    
-        #nsize A estimation - describes number of connected nodes 
-        kxf = self.mesh.connection.flatten() # flattened connection matrix
-        uni_node, counts = np.unique(kxf,return_counts=True)
-        nsizeA = (np.sum(counts) - self.mesh.numel) # an estimate only of NsizeA
-        
-        #other mesh parameters 
-        numnp = self.mesh.numnp
-        numel = self.mesh.numel
-        npere = self.mesh.type2VertsNo()
-        if 'param' in self.mesh.df.keys():
-            num_param = len(np.unique(self.mesh.df['param'].values))
-        else:
-            num_param = self.mesh.numel
-        nfaces = self.mesh.type2FaceNo()
-        
-        #electrodes 
-        num_electrodes = len(self.elec)
-        
-        # this refers to the roughness matrix in 2D problems
-        if 'inverse_type' in self.param and self.param['inverse_type'] == 2:
-            numRterm = 13 
-        else:
-            numRterm = 5 
-        
-        if self.typ == 'R3t' or self.typ =='cR3t': # do 3D calculation 
-            memDP=numnp*(8+num_electrodes)+nsizeA+numel+num_ind_meas * 2
-            memR=0
-            memI=numnp*2+(npere+2)*numel+numnp+1+nsizeA+num_electrodes*3+num_ind_meas*12
-            memL=numel*2
-              
-            if inverse: 
-                memDP=memDP+num_param*9+num_ind_meas*(num_param+6) 
-                memR=memR+(num_param*nfaces)
-                memI=memI+num_param*nfaces    
-        else: # do 2D calculation
-            memDP=(numnp)*(5+num_electrodes)+nsizeA+numel+mnum_ind_meas*3+num_ind_meas       
-            memR=0
-            memI=nsizeA+numel*6+numnp*4+mnum_ind_meas*8
-            memL=numel+numnp
-
-            if inverse:
-                memDP=memDP+numel+num_param*10+num_ind_meas*(num_param+7) 
-                memR=memR+num_param*numRterm
-                memI=memI+num_param*numRterm
-                memL=memL+num_ind_meas
-        
-        Gb=(memL + memI*4 + memR*4 + memDP*8)/1.0e9
+        size = self._problemSize()
+        Gb, mem = perfmodel.staticMemory(size, inverse=inverse)
         dump('ResIPy Estimated RAM usage = %f Gb'%Gb)
         
         avialMemory = getSysStat()[2]
@@ -6114,19 +7666,12 @@ class Project(object): # Project master class instanciated by the GUI
                  '*** Make a coarser mesh ***')
         
         if debug: #print everything out 
-            print('numnp = %i'%numnp)
-            print('numel = %i'%numel)
-            print('nsizA = %i'%nsizeA)
-            print('num_param = %i'%num_param)
-            print('num_electrodes = %i'%num_electrodes)
-            print('num_ind_meas = %i'%num_ind_meas)
-            print('npere = %i'%npere)
-            print('nfaces = %i'%nfaces)
+            for key in ['numnp', 'numel', 'nsizeA', 'num_param', 'num_electrodes',
+                        'num_meas', 'npere', 'nfaces']:
+                print('%s = %i'%(key, size[key]))
             print('inverse = %s'%str(inverse))
-            print('memDP = %i'%memDP)
-            print('memR = %i'%memR)
-            print('memI = %i'%memI)
-            print('memL = %i'%memL)
+            for key in ['memDP', 'memR', 'memI', 'memL']:
+                print('%s = %i'%(key, mem[key]))
             
         return Gb
     
@@ -6169,8 +7714,143 @@ class Project(object): # Project master class instanciated by the GUI
         if Gb >= avialMemory:
             dump('*** It is likely that more RAM is required for inversion! ***\n'
                  '*** Make a coarser mesh ***')
-        return Gb     
-    
+        return Gb
+
+
+    def _problemSize(self, num_meas=None):
+        """Size of the problem passed to the executable (variable names from
+        the executable codes), see `resipy.perfmodel`.
+
+        Parameters
+        ----------
+        num_meas : int, optional
+            Number of measurements. Default is the mean number of
+            measurements written to protocol.dat for each survey.
+        """
+        if num_meas is None: # number of measurements actually put to file
+            num_meas = np.mean([np.sum(s.df['irecip'].values >= 0) for s in self.surveys])
+        kxf = self.mesh.connection.flatten() # flattened connection matrix
+        nsizeA = kxf.shape[0] - self.mesh.numel # an estimate only of NsizeA (connected nodes)
+        if 'param' in self.mesh.df.keys():
+            num_param = len(np.unique(self.mesh.df['param'].values))
+        else:
+            num_param = self.mesh.numel
+        # this refers to the roughness matrix in 2D problems
+        numRterm = 13 if self.param.get('inverse_type', 1) == 2 else 5
+        return {'typ': self.typ,
+                'numnp': int(self.mesh.numnp),
+                'numel': int(self.mesh.numel),
+                'nsizeA': int(nsizeA),
+                'npere': int(self.mesh.type2VertsNo()),
+                'nfaces': int(self.mesh.type2FaceNo()),
+                'num_param': int(num_param),
+                'num_electrodes': int(len(self.elec)),
+                'num_meas': float(num_meas),
+                'numRterm': numRterm}
+
+
+    def _recordRun(self, dirname, runtime, memory):
+        """Add a run of the executable in `dirname` to the history used to
+        calibrate the performance model (see `resipy.perfmodel`). The size of
+        the problem is read from the files of the run, not from `R2.mesh`.
+        """
+        try:
+            size, inverse, nsurveys = perfmodel.runSize(dirname, self.typ)
+            perfmodel.record(size, runtime/nsurveys, memory, inverse=inverse)
+        except Exception: # never fail a run because of the statistics
+            pass
+
+
+    def predictPerformance(self, dump=print):
+        """Predict the runtime and the peak memory of one inversion with the
+        current mesh and surveys. The model is calibrated on this machine by a
+        quick micro-benchmark and by the previous runs of the executable,
+        recorded if `R2.recordRuns` is True (see `resipy.perfmodel`).
+
+        Parameters
+        ----------
+        dump : function, optional
+            stdout direction, ie where to print outputs
+
+        Returns
+        -------
+        prediction : dict
+            'runtime' (s), 'memory' (Gb) and 'nruns', the number of previous
+            runs used to calibrate the model.
+        """
+        if self.mesh is None or len(self.surveys) == 0:
+            raise ValueError('A mesh and a survey are required to predict the performance.')
+        pred = perfmodel.predict(self._problemSize())
+        dump('Predicted runtime per inversion = {:.1f} s, peak memory = {:.3f} Gb'
+             ' (calibrated on {:d} previous runs)'.format(
+                 pred['runtime'], pred['memory'], pred['nruns']))
+        return pred
+
+
+    def recommendSettings(self, timeBudget=None, memBudget=None, ncores=None,
+                          dump=print):
+        """Recommend the number of cores, the characteristic length of the
+        mesh and the grouping of the parameters so that all inversions fit in
+        a time and memory budget, before `Project.invert()` is launched.
+
+        Parameters
+        ----------
+        timeBudget : float, optional
+            Maximum wall time in seconds for all the inversions.
+        memBudget : float, optional
+            Maximum memory in Gb. Default is the available memory.
+        ncores : int, optional
+            Number of cores that can be used. Default is all of them.
+        dump : function, optional
+            stdout direction, ie where to print outputs
+
+        Returns
+        -------
+        rec : dict
+            'runtime' and 'memory' of one inversion, 'ncores' and 'totalTime'
+            with the current mesh. If it does not fit the budget, 'cl' is the
+            characteristic length of a coarser mesh and 'refine' the
+            refinement to pass to `Project.createMesh()` (with `cl` multiplied
+            by 2**refine) to keep the same elements with fewer parameters. See
+            `resipy.perfmodel.recommend()`.
+        """
+        if self.mesh is None or len(self.surveys) == 0:
+            raise ValueError('A mesh and a survey are required to recommend settings.')
+        if ncores is None:
+            ncores = sysinfo['core_count']
+        nsurveys = len(self.surveys) # time-lapse: reference then the others
+        meshTyp = self.meshParams.get('typ', 'default') if hasattr(self, 'meshParams') else None
+        rec = perfmodel.recommend(self._problemSize(), ncores, getSysStat()[2],
+                                  timeBudget=timeBudget, memBudget=memBudget,
+                                  nsurveys=nsurveys,
+                                  groupable=meshTyp in ['default', 'trian', 'tetra'])
+
+        # characteristic length of the current mesh
+        cl = self.meshParams.get('cl', -1) if hasattr(self, 'meshParams') else -1
+        if cl is None or cl <= 0: # default of the mesh generators
+            elec = self.elec.loc[~self.elec['remote'], ['x','y','z']].values
+            dist = np.sqrt(np.sum((elec[:,None,:] - elec[None,:,:])**2, axis=2))
+            cl = np.min(dist[dist > 0])/2 if np.sum(dist > 0) > 0 else np.nan
+        rec['cl'] = cl if rec['clFactor'] is None else cl*rec['clFactor']
+
+        dump('Predicted runtime per inversion = {:.1f} s, peak memory = {:.3f} Gb'
+             ' (calibrated on {:d} previous runs)'.format(rec['runtime'], rec['memory'], rec['nruns']))
+        dump('{:d} inversion(s) on {:d} core(s) in {:.1f} s'.format(
+            nsurveys, rec['ncores'], rec['totalTime']))
+        if rec['fits'] is False:
+            if rec['clFactor'] is not None:
+                dump('Budget met with a coarser mesh: createMesh(cl={:.3f}) '
+                     '({:.1f} s in total, {:.3f} Gb per inversion)'.format(
+                         rec['cl'], rec['clRuntime'], rec['clMemory']))
+            if rec['refine'] is not None:
+                dump('Budget met by grouping the parameters: createMesh(cl={:.3f}, refine={:d}) '
+                     '({:.1f} s in total, {:.3f} Gb per inversion)'.format(
+                         cl*2**rec['refine'], rec['refine'], rec['groupRuntime'], rec['groupMemory']))
+            if rec['clFactor'] is None and rec['refine'] is None:
+                dump('*** No coarser mesh fits the budget ***')
+        return rec
+
+
     @staticmethod
     def setNcores(ncores):
         """Set the number of cores to use for big calculations, for now 
@@ -6199,39 +7879,6 @@ class R2(Project):
         
 #%% Resolution matrix calculation
 # compute covariance matrix on Nvidia GPU / multi core processor 
-def __readSize(fname):
-    fh = open(fname)
-    line1 = fh.readline().split()
-    fh.close()
-    return [int(k) for k in line1]
-
-def __readJacob(fname):
-    array = []
-    fh = open(fname)
-    header = fh.readline()
-    size = [int(k) for k in header.split()]
-    lines = fh.readlines()
-    fh.close()
-    for line in lines:
-        array += [float(x) for x in line.split()]
-    return tuple(size), array
-
-def __readRm(fname, jsize, rsize):
-    Rmap = np.genfromtxt(fname.replace('R','Rindex'),
-                         skip_header=1,dtype=int)-1
-    
-    Rvals = np.genfromtxt(fname,
-                          skip_header=1)
-    
-    Rn = np.zeros((jsize[1],jsize[1]))
-    for i in range(rsize[0]):
-        for j in range(rsize[1]):
-            k = Rmap[i,j]
-            if k!=-1:
-                Rn[i,k] = Rvals[i,j]
-    
-    return Rn 
-
 def __getAlpha(fname):
     #return final reported alpha value, file should be the .out file from andy's code
     fh = open(fname,'r')
@@ -6251,6 +7898,20 @@ def __getAlpha(fname):
     return alpha
 
 
+def __readRmInputs(invdir, index=1, mmap=False):
+    # Jacobian, data weights, roughness matrix and final alpha of a survey
+    prefix = os.path.join(invdir, 'f{:03d}'.format(index))
+    J = readJacobian(prefix + '_J.dat', mmapFile=prefix + '_J.npy' if mmap else None)
+    weights = readWeights(prefix + '_err.dat')
+    R = readRoughness(prefix + '_R.dat', J.shape[1])
+    files = os.listdir(invdir)
+    for f in files:
+        if f.endswith('.out'):
+            alpha = __getAlpha(os.path.join(invdir,f))
+            break
+    return J, weights, R, alpha
+
+
 def cudaRm(invdir):
     """Compute Resolution and Covariance matrix for 2D problems using nVIDIA GPU. 
 
@@ -6272,62 +7933,65 @@ def cudaRm(invdir):
     mempool = cp.get_default_memory_pool()
     pinned_mempool = cp.get_default_pinned_memory_pool()
     # read in jacobian
-    jsize, jdata = __readJacob(os.path.join(invdir,'f001_J.dat'))
-    Jn = np.array(jdata,dtype=np.float32).reshape(jsize) # numpy equivalent 
+    Jn = readJacobian(os.path.join(invdir,'f001_J.dat'), dtype=np.float32)
     J = cp.array(Jn,dtype=np.float32)
     
-    # read in data Weighting matrix
-    protocol = np.genfromtxt(os.path.join(invdir,'f001_err.dat'),
-                             skip_header=1)
-    
-    Wd = cp.array(np.diag(protocol[:,8]),dtype=np.float32)
+    # read in data weights and apply them by scaling the rows of J
+    weights = readWeights(os.path.join(invdir,'f001_err.dat'))
+    J = J*cp.array(weights[:,None], dtype=np.float32)
     
     # read in model roughness matrix 
-    rsize = __readSize(os.path.join(invdir,'f001_R.dat'))
-    
-    Rn = __readRm(os.path.join(invdir,'f001_R.dat'), jsize, rsize)
-    R = cp.array(Rn,dtype=np.float32)
+    Rn = readRoughness(os.path.join(invdir,'f001_R.dat'), Jn.shape[1])
+    R = cp.array(Rn.toarray(),dtype=np.float32)
     #construct A and b on GPU 
     files = os.listdir(invdir)
     for f in files:
         if f.endswith('.out'):
             alpha = __getAlpha(os.path.join(invdir,f))
             break
-    S = cp.matmul(cp.matmul(J.T,Wd.T), cp.matmul(Wd,J))
+    S = cp.matmul(J.T, J)
     A = S + alpha*R #Form A (Menke et al, 2015)
     
     #get rid of parameters we dont need anymore to free up memory 
     J = None
-    Wd = None
     R = None 
     mempool.free_all_blocks()
     
     Cm = cp.linalg.inv(A) # solve inverse of A to get covariance matrix 
-    ResM = Cm*S
     A = None
     mempool.free_all_blocks()
     
     # retrieve outputs as numpy arrays 
-    covar = np.diagonal(Cm.get())
-    remat = np.diagonal(ResM.get())
+    covar = cp.diagonal(Cm).get()
+    remat = cp.sum(Cm*S.T, axis=1).get() # diagonal of Cm.S
     
     #finally clear memory once again 
     Cm = None
     S = None
-    ResM = None
     mempool.free_all_blocks()
     pinned_mempool.free_all_blocks()
     
     return covar, remat
 
-def parallelRm(invdir):
-    """Compute Resolution and Covariance matrix for 2D problems using multicore CPU. 
-    Behaves the same as cudaRm but uses numpy / openBlas. 
+def parallelRm(invdir, index=1, mmap=False, blockSize=256):
+    """Compute Resolution and Covariance matrix using multicore CPU. 
+    Behaves the same as cudaRm but uses numpy / scipy. The Jacobian is read
+    in bulk, the data weights are applied by scaling its rows, the roughness
+    matrix is sparse and only the diagonals are computed by blocks (see
+    `resipy.resolution.diagonals()`).
 
     Parameters
     ----------
     invdir : string 
         Inversion directory used by R2.
+    index : int, optional
+        Number of the survey (1 for the f001_* files).
+    mmap : bool, optional
+        If True, the Jacobian is converted once to a memory-mapped .npy file
+        next to the text file instead of being kept in memory (as well as
+        the temporary n_param x n_meas matrix when n_meas < n_param).
+    blockSize : int, optional
+        Number of rows or columns processed at once.
 
     Returns
     -------
@@ -6337,49 +8001,43 @@ def parallelRm(invdir):
         Values along the diagonal of the Resolution matrix..
 
     """
-    # read in jacobian
-    jsize, jdata = __readJacob(os.path.join(invdir,'f001_J.dat'))
-    Jn = np.array(jdata,dtype=np.float32).reshape(jsize) # numpy equivalent 
-    
-    # read in data Weighting matrix
-    protocol = np.genfromtxt(os.path.join(invdir,'f001_err.dat'),
-                             skip_header=1)
-    
-    Wd = np.diag(protocol[:,8])
-    
-    # read in model roughness matrix 
-    rsize = __readSize(os.path.join(invdir,'f001_R.dat'))
-    
-    Rn = __readRm(os.path.join(invdir,'f001_R.dat'), jsize, rsize)
-    #construct A and b on GPU 
-    files = os.listdir(invdir)
-    for f in files:
-        if f.endswith('.out'):
-            alpha = __getAlpha(os.path.join(invdir,f))
-            break
-    S = np.matmul(np.matmul(Jn.T,Wd.T), np.matmul(Wd,Jn))
-    A = S + alpha*Rn #Form A (Menke et al, 2015)
-    
-    #get rid of parameters we dont need anymore to free up memory 
-    Jn = None
-    Wd = None
-    Rn = None 
-    
-    Cm = np.linalg.inv(A) # solve inverse of A to get covariance matrix (should use multiple cores)
-    ResM = Cm*S
-    A = None
-    
-    # retrieve outputs as numpy arrays 
-    covar = np.diagonal(Cm)
-    remat = np.diagonal(ResM)
-    
-    #finally clear memory once again 
-    Cm = None
-    S = None
-    ResM = None
-    
+    J, weights, R, alpha = __readRmInputs(invdir, index, mmap)
+    zFile = os.path.join(invdir, 'f{:03d}_Z.npy'.format(index)) if mmap else None
+    covar, remat = diagonals(J, weights, R, alpha, blockSize=blockSize, mmapFile=zFile)
+    if zFile is not None and os.path.exists(zFile):
+        os.remove(zFile)
     return covar, remat
 
+def stochasticRm(invdir, index=1, nprobe=32, tol=1e-4, mmap=True, seed=None):
+    """Estimate the diagonals of the Resolution and Covariance matrices with
+    random probe vectors, without factorizing any matrix (for 3D problems
+    too large for `parallelRm`). See `resipy.resolution.estimateDiagonals()`.
+
+    Parameters
+    ----------
+    invdir : string 
+        Inversion directory used by R2/R3t.
+    index : int, optional
+        Number of the survey (1 for the f001_* files).
+    nprobe : int, optional
+        Number of probe vectors (more is more accurate but slower).
+    tol : float, optional
+        Relative tolerance of the iterative solves.
+    mmap : bool, optional
+        If True (default), the Jacobian is memory-mapped.
+    seed : int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    covar : nd array 
+        Estimated values along the diagonal of the coviarance matrix.
+    remat : nd array 
+        Estimated values along the diagonal of the Resolution matrix.
+    """
+    J, weights, R, alpha = __readRmInputs(invdir, index, mmap)
+    return estimateDiagonals(J, weights, R, alpha, nprobe=nprobe, tol=tol, seed=seed)
+
 #%% deprecated funcions
 
     def pseudoIP(self, index=0, vmin=None, vmax=None, ax=None, **kwargs): # pragma: no cover
@@ -9,10 +9,11 @@ Shows how one can select indices of a polygon interactively.
 import numpy as np
 
 #from matplotlib.widgets import PolygonSelector
-from matplotlib.path import Path
-from matplotlib.patches import Rectangle
-from matplotlib.widgets import Button
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+from resipy.lazy import lazyObject
+Path = lazyObject('matplotlib.path', 'Path')
+Rectangle = lazyObject('matplotlib.patches', 'Rectangle')
+Button = lazyObject('matplotlib.widgets', 'Button')
+make_axes_locatable = lazyObject('mpl_toolkits.axes_grid1', 'make_axes_locatable')
 
 class SelectPoints(object):
     """Select indices from a matplotlib collection using `PolygonSelector`.
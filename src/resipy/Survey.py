@@ -10,33 +10,29 @@ import os
 import platform
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.mlab as mlab
 import pandas as pd
-from scipy.stats import norm, linregress
-from scipy.stats.kde import gaussian_kde
-from scipy.linalg import lstsq
+
+from resipy.lazy import lazyModule, lazyObject, isInstalled
+plt = lazyModule('matplotlib.pyplot')
+norm = lazyObject('scipy.stats', 'norm')
+linregress = lazyObject('scipy.stats', 'linregress')
+gaussian_kde = lazyObject('scipy.stats', 'gaussian_kde')
+lstsq = lazyObject('scipy.linalg', 'lstsq')
 
 from resipy.parsers import (syscalParser, protocolParserLME, resInvParser,
                      primeParserTab, protocolParser,
                      stingParser, ericParser, lippmannParser, aresParser,
                      srvParser, bertParser, dasParser)
 from resipy.DCA import DCA
+from resipy.tracing import traced, annotate
 
 # show the deprecation warnings
 import warnings
 warnings.simplefilter('default', category=DeprecationWarning)
 
-try:#import pyvista if avaiable
-    import pyvista as pv
-    try:
-        from pyvistaqt import BackgroundPlotter # newer version
-    except:
-        from pyvista import BackgroundPlotter # older version
-    pyvista_installed = True
-except ModuleNotFoundError:
-    pyvista_installed = False
-    # warnings.warn('pyvista not installed, 3D meshing viewing options will be limited')
+# pyvista is imported when first used
+pv = lazyModule('pyvista')
+pyvista_installed = isInstalled('pyvista')
     
 #replacement for numpy polyfit function which works on open blas 
 def polyfit(x,y,deg=1):
@@ -166,10 +162,14 @@ class Survey(object):
         they will all be kept anyway.
     compRecip: bool, optional 
         Compute reciprocal errors, default is True. 
+    filtDefault: bool, optional
+        Apply the default filtering (see `filterDefault()`), default is True.
+        Set it to False when `df` was already filtered (e.g. project file).
     """
+    @traced
     def __init__(self, fname=None, ftype='', df=None, elec=None, name='',
                  spacing=None, parser=None, keepAll=True, debug=True,
-                 compRecip=True):
+                 compRecip=True, filtDefault=True):
         
         # set default attributes
         self.iBorehole = False # True is it's a borehole
@@ -298,7 +298,8 @@ class Survey(object):
             return
         
         # apply basic filtering
-        self.filterDefault()
+        if filtDefault:
+            self.filterDefault()
         if compRecip:
             self.computeReciprocal() # compute reciprocals
         
@@ -306,6 +307,7 @@ class Survey(object):
         self.dfReset = self.df.copy()
         self.dfPhaseReset = self.df.copy()
         self.dfOrigin = self.df.copy()
+        annotate(rows=self.df.shape[0])
        
      
 #     @classmethod
@@ -397,6 +399,7 @@ class Survey(object):
         print('WARNING: change sign of ', np.sum(ie), ' Tx resistance.')
         
 
+    @traced
     def filterDefault(self):
         """Remove NaN, Inf and duplicates values in the data frame.
         """
@@ -548,6 +551,7 @@ class Survey(object):
 
     
     
+    @traced
     def filterUnpaired(self):
         """Remove quadrupoles that don't have a reciprocals. This might
         remove dummy measurements added for sequence optimization.
@@ -815,6 +819,7 @@ class Survey(object):
         
         return Ri
     
+    @traced
     def computeReciprocal(self): # fast vectorize version
         """Compute reciprocal measurements.
         
@@ -823,6 +828,7 @@ class Survey(object):
         The method first sorts the dipole AB and MN. Then efficiently searches
         for reciprocal pairs with a bisection search. 
         """
+        annotate(rows=self.df.shape[0])
         resist = self.df['resist'].values
         phase = -self.kFactor*self.df['ip'].values #converting chargeability to phase shift
         ndata = self.ndata
@@ -980,6 +986,7 @@ class Survey(object):
         self.filterData(AB == MN)
         
     
+    @traced
     def filterRecip(self, percent=20, debug=True):
         """Filter measurements based on the level reciprocal error. 
         
@@ -1338,6 +1345,7 @@ class Survey(object):
             return fig   
 
 
+    @traced
     def fitErrorPwl(self, ax=None):
         """Fit an power law to the resistivity data.
         
@@ -1405,6 +1413,7 @@ class Survey(object):
             return fig
         
         
+    @traced
     def fitErrorLin(self, ax=None):
         """Fit a linear relationship to the resistivity data.
         
@@ -1743,6 +1752,7 @@ class Survey(object):
             ax.set_ylabel('Phase [mrad]')
     
         
+    @traced
     def computeK(self):
         """Compute geomatrix factor (assuming flat 2D surface) and store it
         in self.df['K'].
@@ -2244,6 +2254,7 @@ class Survey(object):
             return fig
     
     
+    @traced
     def write2protocol(self, outputname='', err=False, errTot=False,
                        ip=False, res0=False, isubset=None, threed=False,
                        fm0=None):
@@ -2358,6 +2369,7 @@ class Survey(object):
         return protocol
         
         
+    @traced
     def filterDCA(self, dump=None):
         """Execute DCA filtering. Decay Curve Analysis (DCA) based on.
         Flores Orozco, A., Gallistl, J., Bücker, M., & Williams, K. H. (2017)., 
@@ -1,5 +1,5 @@
-name = "resipy"
-from resipy.Project import ResIPy_version, sysinfo
-from resipy.Project import Project, R2
-from resipy.Survey import Survey
-from resipy.meshTools import Mesh
+name = "resipy"
+from resipy.Project import ResIPy_version, sysinfo
+from resipy.Project import Project, R2, checkExe
+from resipy.Survey import Survey
+from resipy.meshTools import Mesh
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface of ResIPy:
+    python -m resipy run pipeline.yaml --workers 4
+    python -m resipy watch site.resipy incoming/ --pattern '*.csv'
+    python -m resipy bench --scale medium --compare last
+    python -m resipy check
+"""
+import sys
+import argparse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m resipy',
+                                     description='ResIPy command line interface')
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('run', help='run a batch pipeline (JSON/YAML configuration)')
+    run.add_argument('config', help='path of the pipeline configuration file')
+    run.add_argument('--workers', type=int, default=None, help='number of sites processed concurrently')
+    run.add_argument('--sites', nargs='+', default=None, help='only process these sites')
+    run.add_argument('--report', default=None, help='path of the JSON run report')
+    watch = sub.add_parser('watch', help='invert the new files of a folder as time-lapse steps of a project')
+    watch.add_argument('project', help='inverted time-lapse project (.resipy), new steps are appended to it')
+    watch.add_argument('folder', help='folder where the new files are dropped')
+    watch.add_argument('--ftype', default='Syscal', help='type of the files (see Project.createSurvey)')
+    watch.add_argument('--pattern', default='*', help='only import the files matching this pattern')
+    watch.add_argument('--poll', type=float, default=5, help='time between two scans of the folder (s)')
+    watch.add_argument('--ncores', type=int, default=1, help='maximum number of files inverted at the same time')
+    watch.add_argument('--timeout', type=float, default=None, help='stop after this time (s)')
+    watch.add_argument('--max-files', type=int, default=None, help='stop after this number of files')
+    bench = sub.add_parser('bench', help='run the benchmarks on synthetic surveys and meshes')
+    bench.add_argument('--scale', default='small', choices=['tiny', 'small', 'medium', 'large'],
+                       help='sizes of the synthetic surveys and meshes')
+    bench.add_argument('--only', nargs='+', default=None, help='only run the benchmarks containing these names')
+    bench.add_argument('--repeat', type=int, default=3, help='number of timings of each benchmark')
+    bench.add_argument('--output', default='benchmarks', help='directory where the results are saved')
+    bench.add_argument('--compare', default=None, help="results to compare with ('last' for the previous run)")
+    check = sub.add_parser('check', help='check the executables and download the missing or outdated ones')
+    check.add_argument('--no-download', action='store_true', help='only report the missing or outdated executables')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        from resipy.pipeline import runPipeline
+        report = runPipeline(args.config, workers=args.workers, sites=args.sites,
+                             reportFile=args.report)
+        return 0 if report['nfailed'] == 0 else 1
+    if args.command == 'watch':
+        import tempfile
+        from resipy.Project import Project
+        k = Project(tempfile.mkdtemp(prefix='resipy-watch-')) # working directory
+        k.loadProject(args.project)
+        log = k.watchFolder(args.folder, ftype=args.ftype, pattern=args.pattern,
+                            poll=args.poll, ncores=args.ncores, timeout=args.timeout,
+                            maxFiles=args.max_files, projectFile=args.project)
+        return 0 if all([info['status'] == 'ok' for info in log]) else 1
+    if args.command == 'bench':
+        from resipy.benchmark import runBenchmarks, compareBenchmarks, lastBenchmarks
+        results = runBenchmarks(args.scale, names=args.only, repeat=args.repeat,
+                                outputDir=args.output)
+        old = args.compare
+        if old == 'last':
+            old = lastBenchmarks(args.output, exclude=results['fname'])
+        if old is not None:
+            df = compareBenchmarks(old, results)
+            return 0 if all(df['status'] != 'regression') else 1
+        return 0
+    if args.command == 'check':
+        from resipy.Project import checkExe
+        status = checkExe(download=not args.no_download)
+        return 0 if all(status.values()) else 1
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
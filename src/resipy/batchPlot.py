@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Offscreen rendering of many 2D sections sharing the same mesh (time-lapse or
+batch results, see `Project.saveInvPlots()`). The figure, the `PolyCollection`
+of the mesh, the colorbar and the clipping patch are built once per process
+with the Agg canvas (no GUI, no pyplot) and only the colour array, the colour
+scale, the sensitivity shading and the title change from one frame to the
+next. Frames can be rendered by a pool of processes; the number of frames
+waiting to be rendered is bounded so that the memory used does not grow with
+the number of steps. The frames can then be assembled into a movie with an
+installed ffmpeg (`makeMovie()`).
+"""
+import os, shutil, subprocess
+import numpy as np
+
+
+def sensitivityAlpha(weights):
+    """RGBA colours of the white shade drawn over the cells of low
+    sensitivity (same mapping as `Mesh.show(sens=True)`).
+
+    Parameters
+    ----------
+    weights : array of float
+        Log10 of the sensitivity of each cell.
+    """
+    from matplotlib.colors import ListedColormap, Normalize
+    weights = np.asarray(weights, dtype=float)
+    thresh = np.log10(0.001*(10**np.nanmax(weights)))
+    i = np.where(np.sort(weights) > thresh)[0][0]
+    alphas = np.zeros(len(weights))
+    alphas[:i] = np.linspace(1, 0, i)
+    rawAlpha = np.ones((len(weights), 4), dtype=float)
+    rawAlpha[:,-1] = alphas
+    norm = Normalize(vmin=np.nanmin(weights), vmax=np.nanmax(weights))
+    return ListedColormap(rawAlpha)(norm(weights))
+
+
+class FrameRenderer(object):
+    """Figure of a 2D mesh which colours are updated for each frame.
+
+    Parameters
+    ----------
+    coordinates : array of float
+        Vertices (x, z) of each cell, shape (numel, npere, 2).
+    xlim, zlim : tuple of float
+        Limits of the axis.
+    color_map : str, optional
+        Colormap.
+    edge_color : str, optional
+        Color of the edges of the cells ('face' for none).
+    clabel : str, optional
+        Label of the colorbar.
+    clip : array of float, optional
+        Vertices (x, z) of the polygon outside of which the cells are hidden.
+    sens : bool, optional
+        If True, a white shade is drawn over the cells of low sensitivity
+        (see `render()`).
+    figsize : tuple of float, optional
+        Size of the figure in inches.
+    dpi : int, optional
+        Resolution of the frames.
+    aspect : str, optional
+        Aspect ratio of the axis.
+    darkMode : bool, optional
+        If True, electrodes are plotted in white.
+    """
+    def __init__(self, coordinates, xlim, zlim, color_map='viridis',
+                 edge_color='face', clabel='', clip=None, sens=False,
+                 figsize=None, dpi=100, aspect='equal', darkMode=False):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import PolyCollection
+        from matplotlib.path import Path
+        from matplotlib.patches import PathPatch
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = ax = self.fig.add_subplot(111)
+        self.coll = PolyCollection(coordinates, cmap=color_map,
+                                   edgecolors=edge_color, linewidth=0.5)
+        self.coll.set_array(np.zeros(len(coordinates)))
+        ax.add_collection(self.coll)
+        self.sensColl = None
+        if sens:
+            self.sensColl = PolyCollection(coordinates, facecolors='none',
+                                           edgecolors='none', linewidths=0)
+            ax.add_collection(self.sensColl)
+        self.elec, = ax.plot([], [], 'wo' if darkMode else 'ko', markersize=4)
+        ax.set_xlim(xlim)
+        ax.set_ylim(zlim)
+        ax.set_xlabel('Distance [m]')
+        ax.set_ylabel('Elevation [m]')
+        ax.set_aspect(aspect)
+        self.cbar = self.fig.colorbar(self.coll, ax=ax, format='%.1f',
+                                      fraction=0.046, pad=0.04)
+        self.cbar.set_label(clabel)
+        if clip is not None:
+            codes = [Path.MOVETO] + (len(clip) - 2)*[Path.LINETO] + [Path.CLOSEPOLY]
+            patch = PathPatch(Path(clip, codes), facecolor='none', edgecolor='none')
+            ax.add_patch(patch) # need to add so it knows the transform
+            for coll in [self.coll, self.sensColl]:
+                if coll is not None:
+                    coll.set_clip_path(patch)
+
+
+    def render(self, fname, values, vmin=None, vmax=None, weights=None,
+               elec=None, title=None):
+        """Update the figure and save it.
+
+        Parameters
+        ----------
+        fname : str
+            Path of the frame (.png, .svg, ... as supported by matplotlib).
+        values : array of float
+            Value of each cell.
+        vmin, vmax : float, optional
+            Colour scale. Default is the range of `values`.
+        weights : array of float, optional
+            Log10 of the sensitivity of each cell for the shade.
+        elec : array of float, optional
+            Electrodes (x, z) to plot.
+        title : str, optional
+            Title of the frame.
+        """
+        from matplotlib.transforms import nonsingular
+        values = np.asarray(values)
+        self.coll.set_array(values)
+        vmin, vmax = nonsingular(np.nanmin(values) if vmin is None else vmin,
+                                 np.nanmax(values) if vmax is None else vmax,
+                                 expander=0.1) # uniform values
+        self.coll.set_clim(vmin=vmin, vmax=vmax)
+        if self.sensColl is not None:
+            if weights is None:
+                self.sensColl.set_facecolor('none')
+            else:
+                self.sensColl.set_facecolor(sensitivityAlpha(weights))
+        if elec is not None:
+            self.elec.set_data(elec[:,0], elec[:,1])
+        self.ax.set_title('' if title is None else title)
+        self.fig.savefig(fname)
+        return fname
+
+
+_renderer = None # renderer of a worker process
+
+def _initWorker(geometry):
+    global _renderer
+    _renderer = FrameRenderer(**geometry)
+
+
+def _renderTask(task):
+    return _renderer.render(**task)
+
+
+def renderFrames(geometry, tasks, ncores=1, maxPending=None, dump=None):
+    """Render frames sharing the same mesh.
+
+    Parameters
+    ----------
+    geometry : dict
+        Keyword arguments of `FrameRenderer`.
+    tasks : iterable of dict
+        Keyword arguments of `FrameRenderer.render()` for each frame. It can
+        be a generator so that the values are only read when needed.
+    ncores : int, optional
+        Number of processes rendering the frames.
+    maxPending : int, optional
+        Maximum number of frames submitted but not rendered yet. Default is
+        twice `ncores`.
+    dump : function, optional
+        Called with the number of frames rendered.
+
+    Returns
+    -------
+    fnames : list of str
+        Path of the frames in the order of `tasks`.
+    """
+    if dump is None:
+        def dump(x):
+            pass
+    fnames = []
+    if ncores is None or ncores < 2:
+        renderer = FrameRenderer(**geometry)
+        for task in tasks:
+            fnames.append(renderer.render(**task))
+            dump(len(fnames))
+        return fnames
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    if maxPending is None:
+        maxPending = 2*ncores
+    ndone = 0
+    with ProcessPoolExecutor(max_workers=ncores, initializer=_initWorker,
+                             initargs=(geometry,)) as executor:
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(_renderTask, task))
+            fnames.append(task['fname'])
+            if len(pending) >= maxPending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result() # raise errors of the workers
+                ndone += len(done)
+                dump(ndone)
+        for future in pending:
+            future.result()
+        dump(len(fnames))
+    return fnames
+
+
+def makeMovie(fnames, fname, fps=5, ffmpeg=None):
+    """Assemble frames into a movie with ffmpeg.
+
+    Parameters
+    ----------
+    fnames : list of str
+        Path of the frames (raster images of the same size).
+    fname : str
+        Path of the movie (e.g. 'timelapse.mp4').
+    fps : float, optional
+        Frames per second.
+    ffmpeg : str, optional
+        Path of the ffmpeg executable. Default is the one found in the PATH.
+    """
+    if ffmpeg is None:
+        ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise OSError('ffmpeg was not found, install it or specify its path.')
+    listFile = fname + '.txt' # input of the concat demuxer
+    with open(listFile, 'w') as f:
+        for frame in fnames + fnames[-1:]: # last frame repeated for its duration
+            f.write("file '{:s}'\nduration {:f}\n".format(
+                os.path.abspath(frame).replace("'", "'\\''"), 1/fps))
+    cmd = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+           '-i', listFile, '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', # even size for yuv420p
+           '-pix_fmt', 'yuv420p', '-r', str(fps), fname]
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        os.remove(listFile)
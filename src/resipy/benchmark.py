@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Benchmarks of the hot paths of ResIPy (parsers, reciprocal errors, mesh
+input/output, mesh computations, interpolation and rendering) on synthetic
+surveys and meshes of increasing size:
+
+    python -m resipy bench --scale medium --compare last
+
+Each run is saved as a JSON file (one per version and date) in the output
+directory so that regressions between versions can be spotted with
+`compareBenchmarks()`.
+"""
+import os, sys, io, time, json, platform, tempfile, shutil, traceback, contextlib
+import numpy as np
+import pandas as pd
+
+# number of quadrupoles (survey) and of cells (mesh) of each scale
+SCALES = {'tiny': {'survey': [1000], 'mesh': [1000]},
+          'small': {'survey': [10000], 'mesh': [10000]},
+          'medium': {'survey': [10000, 100000], 'mesh': [10000, 100000, 1000000]},
+          'large': {'survey': [10000, 100000, 1000000],
+                    'mesh': [10000, 100000, 1000000, 10000000]}}
+
+BENCHMARKS = [] # dict with name, kind, maxSize and setup function
+
+
+def benchmark(name, kind, maxSize=None):
+    """Register a benchmark. The decorated function takes the size and a
+    temporary directory and returns the function without argument which is
+    timed (the setup is not timed).
+
+    Parameters
+    ----------
+    name : str
+        Name of the benchmark (e.g. 'Survey.computeReciprocal').
+    kind : str
+        'survey' (size is a number of quadrupoles) or 'mesh' (number of
+        cells).
+    maxSize : int, optional
+        Larger sizes are skipped (e.g. pure Python loops).
+    """
+    def decorator(func):
+        BENCHMARKS.append({'name': name, 'kind': kind, 'maxSize': maxSize,
+                           'setup': func})
+        return func
+    return decorator
+
+
+#%% synthetic data
+def syntheticData(nquad, nelec=96, recip=0.5, seed=0):
+    """Generate a survey with random quadrupoles along a line.
+
+    Parameters
+    ----------
+    nquad : int
+        Number of quadrupoles (normal and reciprocal).
+    nelec : int, optional
+        Number of electrodes (1 m spacing).
+    recip : float, optional
+        Fraction of the normal quadrupoles which are also measured as
+        reciprocal.
+    seed : int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    elec : pandas.DataFrame
+        Electrodes (x, y, z, label).
+    df : pandas.DataFrame
+        Measurements with the a, b, m, n, resist, vp, i, ip and dev columns.
+    """
+    rng = np.random.default_rng(seed)
+    nnormal = int(np.ceil(nquad/(1 + recip)))
+    # unique quadrupoles made of two dipoles without common electrodes
+    quads = np.zeros((0, 4), dtype=int)
+    while quads.shape[0] < nnormal:
+        q = np.sort(rng.integers(1, nelec + 1, size=(2*nnormal, 4)), axis=1)
+        q = q[(q[:,0] < q[:,1]) & (q[:,1] < q[:,2]) & (q[:,2] < q[:,3])]
+        quads = np.unique(np.r_[quads, q[:,[0,3,1,2]]], axis=0) # outer current dipole
+    quads = quads[rng.permutation(quads.shape[0])[:nnormal]]
+    irecip = rng.permutation(nnormal)[:nquad - nnormal]
+    quads = np.r_[quads, quads[irecip][:,[2,3,0,1]]]
+    resist = np.r_[rng.lognormal(0, 1, nnormal), np.zeros(nquad - nnormal)]
+    resist[nnormal:] = resist[irecip]*(1 + rng.normal(0, 0.02, nquad - nnormal))
+    current = rng.uniform(50, 500, nquad)
+    df = pd.DataFrame({'a': quads[:,0].astype(str), 'b': quads[:,1].astype(str),
+                       'm': quads[:,2].astype(str), 'n': quads[:,3].astype(str),
+                       'resist': resist, 'vp': resist*current, 'i': current,
+                       'ip': rng.uniform(0, 20, nquad), 'dev': rng.uniform(0, 1, nquad)})
+    elec = pd.DataFrame({'x': np.arange(nelec, dtype=float), 'y': 0., 'z': 0.,
+                         'label': (1 + np.arange(nelec)).astype(str)})
+    return elec, df
+
+
+def syntheticSurvey(nquad, **kwargs):
+    """Return a `Survey` made with `syntheticData()` (no filtering nor
+    reciprocal computation).
+    """
+    from resipy.Survey import Survey
+    elec, df = syntheticData(nquad, **kwargs)
+    return Survey(df=df, elec=elec, filtDefault=False, compRecip=False)
+
+
+def writeSyscal(fname, elec, df):
+    """Write a survey as a Syscal Prosys II csv file."""
+    x = elec.set_index('label')['x']
+    out = pd.DataFrame({'El-array': 'Mixed / non conventional'}, index=df.index)
+    for i, c in enumerate(['a','b','m','n']):
+        out['Spa.{:d}'.format(i+1)] = x.reindex(df[c]).values
+    out['Rho'] = df['resist'].values # (not an apparent resistivity but not checked)
+    out['Dev.'] = df['dev'].values
+    out['M'] = df['ip'].values
+    out['Sp'] = 0.
+    out['Vp'] = df['vp'].values
+    out['In'] = df['i'].values
+    out.insert(0, '', '')
+    out.to_csv(fname, index=False, float_format='%.4f')
+
+
+def writeProtocol(fname, df):
+    """Write a survey as a protocol.dat (DC) file."""
+    with open(fname, 'w') as f:
+        f.write('{:d}\n'.format(df.shape[0]))
+        out = df[['a','b','m','n','resist']].copy()
+        out.insert(0, 'index', 1 + np.arange(df.shape[0]))
+        out.to_csv(f, sep='\t', header=False, index=False)
+
+
+_meshes = {} # synthetic meshes of the current run (expensive at large sizes)
+
+def syntheticMesh(ncells, ndims=3):
+    """Generate a regular mesh of triangles (2D) or tetrahedra (3D) with
+    about `ncells` cells and a 'Resistivity' attribute.
+    """
+    import resipy.meshTools as mt
+    key = (ncells, ndims)
+    if key in _meshes:
+        return _meshes[key]
+    if ndims == 2: # 2 triangles per rectangle
+        nx = max(2, int(np.sqrt(ncells/2*4))) # 4 times wider than deep
+        nz = max(2, int(ncells/2/nx))
+        x, z = np.meshgrid(np.arange(nx + 1, dtype=float), -np.arange(nz + 1, dtype=float))
+        inode = np.arange((nx + 1)*(nz + 1)).reshape(nz + 1, nx + 1)
+        n0, n1 = inode[:-1,:-1].ravel(), inode[:-1,1:].ravel()
+        n2, n3 = inode[1:,1:].ravel(), inode[1:,:-1].ravel()
+        connection = np.r_[np.c_[n0, n1, n2], np.c_[n0, n2, n3]]
+        mesh = mt.Mesh(x.ravel(), np.zeros(x.size), z.ravel(), connection, [5],
+                       order_nodes=False, check2D=False)
+    else: # 6 tetrahedra per cube
+        n = max(1, int(round((ncells/6)**(1/3))))
+        nx, ny, nz = n, n, max(1, int(ncells/6/n/n))
+        x, y, z = np.meshgrid(np.arange(nx + 1, dtype=float), np.arange(ny + 1, dtype=float),
+                              -np.arange(nz + 1, dtype=float), indexing='ij')
+        inode = np.arange(x.size).reshape(x.shape)
+        c = [inode[i:i+nx, j:j+ny, k:k+nz].ravel() for k in range(2)
+             for j in range(2) for i in range(2)] # 8 corners of the cubes
+        tetra = [[0,1,3,7], [0,1,5,7], [0,2,3,7], [0,2,6,7], [0,4,5,7], [0,4,6,7]]
+        connection = np.concatenate([np.stack([c[i] for i in t], axis=1) for t in tetra])
+        mesh = mt.Mesh(x.ravel(), y.ravel(), z.ravel(), connection, [10],
+                       order_nodes=False, check2D=False)
+    rng = np.random.default_rng(0)
+    mesh.df['Resistivity'] = rng.lognormal(4, 1, mesh.numel)
+    _meshes.clear() # keep only one mesh in memory
+    _meshes[key] = mesh
+    return mesh
+
+
+def writeMsh(fname, mesh):
+    """Write a mesh as a gmsh 2.2 ASCII file."""
+    gmshType = {3: 2, 4: 4}[mesh.connection.shape[1]] # triangle, tetrahedron
+    with open(fname, 'w') as f:
+        f.write('$MeshFormat\n2.2 0 8\n$EndMeshFormat\n$Nodes\n{:d}\n'.format(mesh.numnp))
+        nodes = np.c_[1 + np.arange(mesh.numnp), mesh.node]
+        np.savetxt(f, nodes, fmt=['%d', '%.6f', '%.6f', '%.6f'])
+        f.write('$EndNodes\n$Elements\n{:d}\n'.format(mesh.numel))
+        ones = np.ones(mesh.numel, dtype=int)
+        elms = np.c_[1 + np.arange(mesh.numel), gmshType*ones, 2*ones, ones, ones,
+                     mesh.connection + 1]
+        np.savetxt(f, elms, fmt='%d')
+        f.write('$EndElements\n')
+
+
+#%% benchmarks
+@benchmark('parsers.syscalParser', 'survey')
+def benchSyscalParser(n, tmpdir):
+    from resipy.parsers import syscalParser
+    fname = os.path.join(tmpdir, 'syscal.csv')
+    writeSyscal(fname, *syntheticData(n))
+    return lambda: syscalParser(fname)
+
+
+@benchmark('parsers.protocolParser', 'survey')
+def benchProtocolParser(n, tmpdir):
+    from resipy.parsers import protocolParser
+    fname = os.path.join(tmpdir, 'protocol.dat')
+    writeProtocol(fname, syntheticData(n)[1])
+    return lambda: protocolParser(fname)
+
+
+@benchmark('Survey.computeReciprocal', 'survey')
+def benchComputeReciprocal(n, tmpdir):
+    s = syntheticSurvey(n)
+    return s.computeReciprocal
+
+
+@benchmark('Survey.computeK', 'survey')
+def benchComputeK(n, tmpdir):
+    s = syntheticSurvey(n)
+    return s.computeK
+
+
+@benchmark('Project.matchSurveys', 'survey')
+def benchMatchSurveys(n, tmpdir):
+    from resipy.Project import Project
+    k = Project(os.path.join(tmpdir, 'proj'))
+    k.surveys = [syntheticSurvey(n, seed=0)]
+    for seed in [1, 2]: # 90% of the quadrupoles in common
+        s = syntheticSurvey(n, seed=0)
+        s.df = s.df.sample(frac=0.9, random_state=seed)
+        k.surveys.append(s)
+    return k.matchSurveys
+
+
+@benchmark('meshTools.vtk_import', 'mesh')
+def benchVtkImport(n, tmpdir):
+    import resipy.meshTools as mt
+    fname = os.path.join(tmpdir, 'mesh.vtk')
+    syntheticMesh(n).vtk(fname)
+    return lambda: mt.vtk_import(fname, order_nodes=False)
+
+
+@benchmark('Mesh.vtk', 'mesh')
+def benchVtk(n, tmpdir):
+    mesh = syntheticMesh(n)
+    return lambda: mesh.vtk(os.path.join(tmpdir, 'mesh.vtk'))
+
+
+@benchmark('Mesh.dat', 'mesh')
+def benchDat(n, tmpdir):
+    mesh = syntheticMesh(n, ndims=2)
+    return lambda: mesh.dat(os.path.join(tmpdir, 'mesh.dat'))
+
+
+@benchmark('gmshWrap.mshParse', 'mesh', maxSize=1000000)
+def benchMshParse(n, tmpdir):
+    from resipy.gmshWrap import mshParse
+    fname = os.path.join(tmpdir, 'mesh.msh')
+    writeMsh(fname, syntheticMesh(n))
+    return lambda: mshParse(fname, debug=False)
+
+
+@benchmark('meshCalc.neigh3d', 'mesh')
+def benchNeigh3d(n, tmpdir):
+    from resipy.cext import meshCalc as mc
+    mesh = syntheticMesh(n)
+    return lambda: mc.neigh3d(mesh.connection, 1, 1)
+
+
+@benchmark('meshCalc.orderTetra', 'mesh')
+def benchOrderTetra(n, tmpdir):
+    from resipy.cext import meshCalc as mc
+    mesh = syntheticMesh(n)
+    return lambda: mc.orderTetra(mesh.connection, mesh.node, 1)
+
+
+@benchmark('Mesh.cellArea', 'mesh', maxSize=1000000)
+def benchCellArea(n, tmpdir):
+    mesh = syntheticMesh(n, ndims=2)
+    return mesh.cellArea
+
+
+@benchmark('Mesh.extractSurface', 'mesh')
+def benchExtractSurface(n, tmpdir):
+    mesh = syntheticMesh(n)
+    return mesh.extractSurface
+
+
+@benchmark('interpolation.idw', 'mesh', maxSize=100000)
+def benchIdw(n, tmpdir):
+    import resipy.interpolation as interp
+    x, y, xk, yk, zk = topography(n)
+    return lambda: interp.idw(x, y, xk, yk, zk)
+
+
+@benchmark('interpolation.nearest', 'mesh')
+def benchNearest(n, tmpdir):
+    import resipy.interpolation as interp
+    x, y, xk, yk, zk = topography(n)
+    return lambda: interp.nearest(x, y, xk, yk, zk)
+
+
+@benchmark('interpolation.triangulate', 'mesh')
+def benchTriangulate(n, tmpdir):
+    import resipy.interpolation as interp
+    x, y, xk, yk, zk = topography(n)
+    return lambda: interp.triangulate(x, y, xk, yk, zk)
+
+
+@benchmark('Mesh.show', 'mesh', maxSize=1000000)
+def benchShow(n, tmpdir):
+    import matplotlib.pyplot as plt
+    mesh = syntheticMesh(n, ndims=2)
+    def show():
+        fig, ax = plt.subplots()
+        mesh.show(ax=ax, attr='Resistivity', color_map='viridis')
+        fig.canvas.draw() # rendering included
+        plt.close(fig)
+    return show
+
+
+def topography(n, nknown=1000):
+    """Return `n` random points where to interpolate `nknown` random
+    topography points.
+    """
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 100, (2, n))
+    xk, yk = rng.uniform(0, 100, (2, nknown))
+    return x, y, xk, yk, np.sin(xk/10) + np.cos(yk/10)
+
+
+#%% running and comparing
+def timeit(func, repeat=3):
+    """Return the times in seconds of `repeat` calls of `func`."""
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def runBenchmarks(scale='small', names=None, repeat=3, outputDir='benchmarks',
+                  dump=print):
+    """Run the benchmarks and save their results.
+
+    Parameters
+    ----------
+    scale : str, optional
+        Sizes of the synthetic surveys and meshes: 'tiny', 'small', 'medium'
+        or 'large' (see `SCALES`).
+    names : list of str, optional
+        Only run the benchmarks which name contains one of these strings.
+    repeat : int, optional
+        Number of times each function is timed (the minimum is kept).
+    outputDir : str, optional
+        Directory where the results are saved. If None, they are not saved.
+    dump : function, optional
+        Function to print the progress.
+
+    Returns
+    -------
+    results : dict
+        Version, date, machine and time of each benchmark ('results'). It is
+        also saved as '<outputDir>/resipy-<version>-<date>.json'.
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from resipy.Project import ResIPy_version
+    benchs = BENCHMARKS
+    if names is not None:
+        benchs = [b for b in benchs if any([n in b['name'] for n in names])]
+    t0 = time.time()
+    out = {'resipyVersion': ResIPy_version,
+           'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                       'numpy': np.__version__, 'pandas': pd.__version__,
+                       'cpuCount': os.cpu_count()},
+           'scale': scale, 'repeat': repeat, 'results': []}
+    tmpdir = tempfile.mkdtemp(prefix='resipy-bench-')
+    try:
+        for kind in ['survey', 'mesh']: # meshes are generated once per size
+            for size in SCALES[scale][kind]:
+                for b in [b for b in benchs if b['kind'] == kind]:
+                    if b['maxSize'] is not None and size > b['maxSize']:
+                        continue
+                    r = {'name': b['name'], 'size': size, 'min': None,
+                         'median': None, 'error': None}
+                    try:
+                        with contextlib.redirect_stdout(io.StringIO()): # progress messages
+                            func = b['setup'](size, tmpdir)
+                            times = timeit(func, repeat)
+                        r['min'] = min(times)
+                        r['median'] = float(np.median(times))
+                        dump('{:30s} {:>9d} {:10.4f}s'.format(b['name'], size, r['min']))
+                    except Exception as e:
+                        r['error'] = '{:s}: {:s}'.format(type(e).__name__, str(e))
+                        dump('{:30s} {:>9d} failed ({:s})'.format(b['name'], size, r['error']))
+                        traceback.print_exc(file=sys.stderr)
+                    out['results'].append(r)
+    finally:
+        _meshes.clear()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    out['time'] = time.time() - t0
+    if outputDir is not None:
+        if os.path.exists(outputDir) is False:
+            os.makedirs(outputDir)
+        fname = os.path.join(outputDir, 'resipy-{:s}-{:s}.json'.format(
+            ResIPy_version, time.strftime('%Y%m%d-%H%M%S')))
+        with open(fname, 'w') as f:
+            json.dump(out, f, indent=2)
+        out['fname'] = fname
+        dump('Results saved in {:s}'.format(fname))
+    return out
+
+
+def loadBenchmarks(fname):
+    """Read the results saved by `runBenchmarks()`."""
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def lastBenchmarks(outputDir='benchmarks', exclude=None):
+    """Return the path of the most recent results in `outputDir` (other
+    than `exclude`) or None.
+    """
+    if os.path.exists(outputDir) is False:
+        return None
+    fnames = [os.path.join(outputDir, f) for f in os.listdir(outputDir)
+              if f.startswith('resipy-') and f.endswith('.json')]
+    fnames = [f for f in fnames if exclude is None or
+              os.path.abspath(f) != os.path.abspath(exclude)]
+    if len(fnames) == 0:
+        return None
+    return max(fnames, key=os.path.getmtime)
+
+
+def compareBenchmarks(old, new, threshold=1.2, dump=print):
+    """Compare two benchmark runs.
+
+    Parameters
+    ----------
+    old, new : dict or str
+        Results (or their file) of `runBenchmarks()`.
+    threshold : float, optional
+        A benchmark is a regression if new/old is larger than `threshold`
+        (and an improvement if it is smaller than 1/threshold).
+    dump : function, optional
+        Function to print the comparison table.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Name, size, old and new time, ratio (new/old) and status of the
+        benchmarks present in both runs.
+    """
+    if isinstance(old, str):
+        old = loadBenchmarks(old)
+    if isinstance(new, str):
+        new = loadBenchmarks(new)
+    cols = ['name', 'size', 'min']
+    dfo = pd.DataFrame(old['results'])[cols].rename(columns={'min': 'old'})
+    dfn = pd.DataFrame(new['results'])[cols].rename(columns={'min': 'new'})
+    df = pd.merge(dfo, dfn, on=['name', 'size']).dropna()
+    df['ratio'] = df['new']/df['old']
+    df['status'] = 'same'
+    df.loc[df['ratio'] > threshold, 'status'] = 'regression'
+    df.loc[df['ratio'] < 1/threshold, 'status'] = 'improvement'
+    dump('{:s} ({:s}) -> {:s} ({:s})'.format(old['resipyVersion'], old['date'],
+                                             new['resipyVersion'], new['date']))
+    for _, row in df.iterrows():
+        dump('{:30s} {:>9d} {:10.4f}s {:10.4f}s {:6.2f}x {:s}'.format(
+            row['name'], int(row['size']), row['old'], row['new'], row['ratio'],
+            row['status'] if row['status'] != 'same' else ''))
+    return df
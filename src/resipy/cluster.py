@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Lightweight job broker to run inversions on several machines. The queue is a
+directory on a filesystem shared by all machines:
+    queue/pending/<job> : job bundles waiting for a worker
+    queue/running/<job> : job bundles claimed by a worker
+    queue/done/<job>    : finished jobs with their outputs
+    queue/failed/<job>  : jobs for which the executable failed
+A job bundle is a self-contained inversion directory (mesh, .in, protocol.dat
+and starting model) plus a 'job.json' file. Jobs move between the states with
+`os.rename()` which is atomic on a given filesystem, so several workers can
+poll the same queue safely. A worker rewrites the '.heartbeat' file of its
+running jobs with its id and an increasing counter; the submitter puts a job
+back in the queue when this file has not changed for a while on its own clock
+(the clocks of the machines don't need to agree).
+
+Start a worker on each machine with:
+    python -m resipy.cluster /path/to/shared/queue --ncores 4
+"""
+import os, sys, shutil, json, time, platform, socket, uuid
+import subprocess
+from subprocess import Popen, DEVNULL
+from resipy.launcher import exeCommand
+
+OS = platform.system()
+states = ['pending', 'running', 'done', 'failed']
+
+
+class JobQueue(object):
+    """Queue of inversion jobs stored in a (shared) directory.
+
+    Parameters
+    ----------
+    dirname : str
+        Path of the queue directory. It is created if it doesn't exist.
+    staleTimeout : float, optional
+        Time in seconds after which a running job without heartbeat from its
+        worker (worker killed or machine down) is put back in the queue.
+    """
+    def __init__(self, dirname, staleTimeout=120):
+        self.dirname = os.path.abspath(dirname)
+        self.staleTimeout = staleTimeout
+        self.workerId = '{:s}-{:d}-{:s}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.beats = {} # jobId: number of heartbeats sent by this worker
+        self.seen = {} # jobId: (last heartbeat read, local time it was first read)
+        for d in states + ['.incoming']:
+            if os.path.exists(os.path.join(self.dirname, d)) is False:
+                os.makedirs(os.path.join(self.dirname, d))
+
+
+    def _path(self, state, jobId=''):
+        return os.path.join(self.dirname, state, jobId)
+
+
+    def submit(self, wd, exeName):
+        """Copy an inversion directory in the queue.
+
+        Parameters
+        ----------
+        wd : str
+            Directory with all input files needed by the executable.
+        exeName : str
+            Name of the executable (e.g. 'R2.exe').
+
+        Returns
+        -------
+        jobId : str
+            Identifier of the job in the queue.
+        """
+        jobId = '{:s}-{:s}'.format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+        tmp = self._path('.incoming', jobId)
+        shutil.copytree(wd, tmp)
+        with open(os.path.join(tmp, 'job.json'), 'w') as f:
+            json.dump({'exeName': exeName, 'submitted': time.time()}, f)
+        os.rename(tmp, self._path('pending', jobId)) # publish only complete bundles
+        return jobId
+
+
+    def status(self, jobId):
+        """Return the state of a job ('pending', 'running', 'done', 'failed')
+        or None if the job is unknown.
+        """
+        for state in states:
+            if os.path.exists(self._path(state, jobId)):
+                return state
+        return None
+
+
+    def claim(self):
+        """Claim the oldest pending job. Returns its id or None if the queue
+        is empty.
+        """
+        for jobId in sorted(os.listdir(self._path('pending'))):
+            try:
+                os.rename(self._path('pending', jobId), self._path('running', jobId))
+                self._writeBeat(jobId, 1)
+                return jobId
+            except OSError: # claimed by another worker in the meantime
+                continue
+        return None
+
+
+    def _owner(self, jobId):
+        """Id of the worker of a running job (None if not running)."""
+        try:
+            with open(os.path.join(self._path('running', jobId), '.heartbeat'), 'r') as f:
+                return f.read().split(' ')[0]
+        except OSError:
+            return None
+
+
+    def _writeBeat(self, jobId, n):
+        with open(os.path.join(self._path('running', jobId), '.heartbeat'), 'w') as f:
+            f.write('{:s} {:d}'.format(self.workerId, n))
+        self.beats[jobId] = n
+
+
+    def heartbeat(self, jobId):
+        """Signal that the worker running the job is alive.
+
+        Returns
+        -------
+        alive : bool
+            False if the job is not running for this worker anymore (put back
+            in the queue by `requeueStale()`, possibly claimed by another
+            worker); the worker must then drop it.
+        """
+        if self._owner(jobId) != self.workerId:
+            self.beats.pop(jobId, None)
+            return False
+        try:
+            self._writeBeat(jobId, self.beats.get(jobId, 0) + 1)
+        except FileNotFoundError: # requeued in the meantime
+            self.beats.pop(jobId, None)
+            return False
+        return True
+
+
+    def complete(self, jobId, success=True):
+        """Move a running job to the 'done' or 'failed' state.
+
+        Returns
+        -------
+        completed : bool
+            False if the job had been put back in the queue in the meantime:
+            its result is dropped as the job runs again elsewhere.
+        """
+        self.beats.pop(jobId, None)
+        if self._owner(jobId) != self.workerId:
+            return False
+        try:
+            os.rename(self._path('running', jobId),
+                      self._path('done' if success else 'failed', jobId))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+    def requeueStale(self):
+        """Put back in the queue the running jobs which worker stopped
+        sending heartbeats. Must be called regularly by the same `JobQueue`
+        instance: the time since the last change of the heartbeat is measured
+        on the clock of this machine.
+        """
+        now = time.monotonic()
+        running = os.listdir(self._path('running'))
+        for jobId in list(self.seen.keys()):
+            if jobId not in running:
+                del self.seen[jobId]
+        for jobId in running:
+            try:
+                with open(os.path.join(self._path('running', jobId), '.heartbeat'), 'r') as f:
+                    beat = f.read()
+            except OSError: # job finished or heartbeat not written yet
+                beat = None
+            if jobId not in self.seen or self.seen[jobId][0] != beat:
+                self.seen[jobId] = (beat, now)
+            elif now - self.seen[jobId][1] > self.staleTimeout:
+                try:
+                    os.rename(self._path('running', jobId), self._path('pending', jobId))
+                except OSError: # finished in the meantime
+                    pass
+                del self.seen[jobId]
+
+
+    def fetch(self, jobId, wd):
+        """Copy the files of a finished job back in `wd` and remove the job
+        from the queue.
+        """
+        state = self.status(jobId)
+        jobDir = self._path(state, jobId)
+        for f in os.listdir(jobDir):
+            if f not in ['job.json', '.heartbeat', 'worker.log']:
+                shutil.copy(os.path.join(jobDir, f), os.path.join(wd, f))
+        shutil.rmtree(jobDir)
+
+
+    def cancel(self, jobId):
+        """Remove a job from the queue if it is still pending.
+        """
+        try:
+            tmp = self._path('.incoming', jobId)
+            os.rename(self._path('pending', jobId), tmp)
+            shutil.rmtree(tmp)
+        except OSError:
+            pass
+
+
+
+def runWorker(dirname, ncores=1, poll=0.5, exeDir=None, maxJobs=None,
+              idleTimeout=None, dump=print):
+    """Process jobs from the queue until interrupted.
+
+    Parameters
+    ----------
+    dirname : str
+        Path of the queue directory.
+    ncores : int, optional
+        Number of jobs run concurrently by this worker.
+    poll : float, optional
+        Time in seconds between two checks of the queue.
+    exeDir : str, optional
+        Directory containing the R* executables. Default is the 'exe'
+        directory of the installed resipy package.
+    maxJobs : int, optional
+        Stop after this number of jobs.
+    idleTimeout : float, optional
+        Stop if no job has been found for this number of seconds.
+    dump : function, optional
+        Function to print information messages.
+    """
+    if exeDir is None:
+        exeDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exe')
+    queue = JobQueue(dirname)
+    hostname = socket.gethostname()
+    procs = {} # jobId: (Popen, log file)
+    njobs = 0
+    lastJob = time.time()
+    dump('Worker {:s} ({:d} cores) polling {:s}'.format(hostname, ncores, queue.dirname))
+    while True:
+        # start new jobs
+        while len(procs) < ncores and (maxJobs is None or njobs < maxJobs):
+            jobId = queue.claim()
+            if jobId is None:
+                break
+            njobs += 1
+            lastJob = time.time()
+            wd = queue._path('running', jobId)
+            with open(os.path.join(wd, 'job.json'), 'r') as f:
+                job = json.load(f)
+            log = open(os.path.join(wd, 'worker.log'), 'w')
+            log.write('worker: {:s}\n'.format(hostname))
+            kwargs = {}
+            if OS == 'Windows':
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                kwargs['startupinfo'] = startupinfo
+            p = Popen(exeCommand(os.path.join(exeDir, job['exeName'])), cwd=wd,
+                      stdout=log, stderr=log, stdin=DEVNULL, shell=False, **kwargs)
+            procs[jobId] = (p, log)
+            dump('{:s} started'.format(jobId))
+
+        # check running jobs
+        for jobId in list(procs.keys()):
+            p, log = procs[jobId]
+            if p.poll() is None:
+                if queue.heartbeat(jobId) is False: # considered dead and requeued
+                    p.kill()
+                    p.wait()
+                    log.close()
+                    del procs[jobId]
+                    dump('{:s} requeued by the submitter, dropped'.format(jobId))
+            else:
+                log.close()
+                del procs[jobId]
+                if queue.complete(jobId, success=p.returncode == 0):
+                    dump('{:s} finished (return code {:d})'.format(jobId, p.returncode))
+                else:
+                    dump('{:s} requeued by the submitter, result dropped'.format(jobId))
+
+        if len(procs) == 0:
+            if maxJobs is not None and njobs >= maxJobs:
+                break
+            if idleTimeout is not None and time.time() - lastJob > idleTimeout:
+                break
+        time.sleep(poll)
+
+
+def startLocalWorkers(dirname, nworkers=2, **kwargs):
+    """Start worker processes on this machine (useful for testing or to use
+    the queue as a local scheduler).
+
+    Parameters
+    ----------
+    dirname : str
+        Path of the queue directory.
+    nworkers : int, optional
+        Number of worker processes.
+    **kwargs : optional
+        Passed as command line options to the worker (ncores, poll,
+        idleTimeout).
+
+    Returns
+    -------
+    procs : list of subprocess.Popen
+        Worker processes (call `terminate()` on them to stop them).
+    """
+    cmd = [sys.executable, '-m', 'resipy.cluster', dirname]
+    for key in kwargs:
+        cmd += ['--' + key, str(kwargs[key])]
+    env = os.environ.copy() # make sure the same resipy is used by the workers
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = path + os.pathsep + env.get('PYTHONPATH', '')
+    return [Popen(cmd, stdout=DEVNULL, stderr=DEVNULL, env=env) for i in range(nworkers)]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='ResIPy inversion worker')
+    parser.add_argument('queue', help='path of the shared queue directory')
+    parser.add_argument('--ncores', type=int, default=1, help='number of concurrent jobs')
+    parser.add_argument('--poll', type=float, default=0.5, help='polling interval in seconds')
+    parser.add_argument('--exeDir', default=None, help='directory of the R* executables')
+    parser.add_argument('--idleTimeout', type=float, default=None, help='stop after idle seconds')
+    args = parser.parse_args()
+    runWorker(args.queue, ncores=args.ncores, poll=args.poll, exeDir=args.exeDir,
+              idleTimeout=args.idleTimeout)
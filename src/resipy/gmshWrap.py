@@ -10,8 +10,10 @@ parsing meshes into a python environment.
 import os, warnings
 #general 3rd party libraries
 import numpy as np
-import matplotlib.path as mpath
-from scipy.spatial import cKDTree
+from resipy.lazy import lazyModule, lazyObject
+from resipy.tracing import traced
+mpath = lazyModule('matplotlib.path')
+cKDTree = lazyObject('scipy.spatial', 'cKDTree')
 
 #%% utility functions 
 def arange(start,incriment,stop,endpoint=0):#create a list with a range without numpy 
@@ -1076,6 +1078,7 @@ def mshParse47(fname,debug=True):
     
     return mesh_dict # return a python dictionary 
 
+@traced
 def mshParse(fname, debug=True):
     """Import a gmsh mesh file into ResIPy. 
     
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Analytic sensitivity of a quadrupole sequence for a homogeneous half-space.
+The Fréchet derivative of the transfer resistance of quadrupole ABMN with
+respect to the log-resistivity of a cell k is, for a homogeneous medium:
+    J_k = int_k grad(G_A - G_B).grad(G_M - G_N) dV
+where G_X is the potential of a unit point source at electrode X (with its
+image across the flat ground surface). The cumulative sensitivity of the
+sequence, sum_q |J_qk/R_q|/V_k, gives a cheap depth of investigation (DOI)
+estimate without running any inversion. In 2D, the kernels of the 3D point
+sources are integrated along the strike (y) direction.
+"""
+import numpy as np
+
+
+def cellVolumes(mesh):
+    """Area (2D) or volume (3D) of the cells of `mesh` (vectorized
+    counterpart of `Mesh.cellArea()`).
+    """
+    node = mesh.node[mesh.connection] # (numel, npere, 3)
+    if mesh.ndims == 2:
+        x, z = node[:,:,0], node[:,:,2] # shoelace formula
+        return 0.5*np.abs(np.sum(x*np.roll(z, -1, axis=1) - np.roll(x, -1, axis=1)*z, axis=1))
+    if node.shape[1] == 4: # tetrahedra
+        a = node[:,1,:] - node[:,0,:]
+        b = node[:,2,:] - node[:,0,:]
+        c = node[:,3,:] - node[:,0,:]
+        return np.abs(np.sum(np.cross(a, b)*c, axis=1))/6
+    if node.shape[1] == 6: # prisms
+        a = node[:,1,:] - node[:,0,:]
+        b = node[:,2,:] - node[:,0,:]
+        area = 0.5*np.abs(a[:,0]*b[:,1] - a[:,1]*b[:,0])
+        return area*np.abs(np.mean(node[:,3:,2], axis=1) - np.mean(node[:,:3,2], axis=1))
+    return np.prod(np.max(node, axis=1) - np.min(node, axis=1), axis=1) # hexahedra
+
+
+def _gradients(elec, pts, surface):
+    """Gradient of the potential of a unit point source at each electrode,
+    evaluated at `pts` (nelec x npts x 3 array).
+    """
+    d = pts[None,:,:] - elec[:,None,:]
+    grad = d/np.sum(d**2, axis=2)[:,:,None]**1.5
+    if surface is not None:
+        image = elec.copy()
+        image[:,2] = 2*surface - image[:,2]
+        d = pts[None,:,:] - image[:,None,:]
+        grad += d/np.sum(d**2, axis=2)[:,:,None]**1.5
+    return -grad/(4*np.pi)
+
+
+def _potentials(elec, surface):
+    """Potential at each electrode of a unit point source at each other
+    electrode (nelec x nelec array, inf on the diagonal).
+    """
+    with np.errstate(divide='ignore'):
+        d = np.sqrt(np.sum((elec[:,None,:] - elec[None,:,:])**2, axis=2))
+        pot = 1/d
+        if surface is not None:
+            image = elec.copy()
+            image[:,2] = 2*surface - image[:,2]
+            d = np.sqrt(np.sum((elec[:,None,:] - image[None,:,:])**2, axis=2))
+            pot += 1/d
+    return pot/(4*np.pi)
+
+
+def cumulativeSensitivity(elec, quads, centres, volumes=None, ndims=2, surface=0,
+                          iremote=None, ny=16, maxMemory=0.25):
+    """Cumulative sensitivity of a sequence of quadrupoles in a homogeneous
+    half-space.
+
+    Parameters
+    ----------
+    elec : array of float
+        Electrode coordinates (nelec x 3: x, y, z). In 2D, y is ignored.
+    quads : array of int
+        Zero-based electrode indices of A, B, M, N (nquad x 4).
+    centres : array of float
+        Cell centres (numel x 3: x, y, z).
+    volumes : array of float, optional
+        Cell areas (2D) or volumes (3D), see `cellVolumes()`. If given, the
+        sensitivity is integrated over the cells, else it is a density.
+    ndims : int, optional
+        2 (2.5D, cells infinite along y) or 3.
+    surface : float, optional
+        Elevation of the flat ground surface. If None, the electrodes are
+        in a full-space.
+    iremote : array of bool, optional
+        Remote electrodes (their contribution is ignored).
+    ny : int, optional
+        Number of Gauss-Legendre points along the y direction (2D only).
+    maxMemory : float, optional
+        Approximate memory (in Gb) used by a chunk of cells.
+
+    Returns
+    -------
+    sens : array of float
+        Cumulative sensitivity of each cell.
+    """
+    elec = np.array(elec, dtype=float)
+    quads = np.asarray(quads, dtype=int)
+    centres = np.asarray(centres, dtype=float)
+    if ndims == 2:
+        elec[:,1] = 0
+    # only keep the electrodes used by the sequence
+    used, inv = np.unique(quads, return_inverse=True)
+    quads = inv.reshape(quads.shape)
+    elec = elec[used]
+    active = np.ones(len(used), dtype=bool) if iremote is None else ~np.asarray(iremote)[used]
+
+    # normalize by the transfer resistance of the homogeneous half-space
+    pot = _potentials(elec, surface)
+    pot[~active,:] = 0
+    pot[:,~active] = 0
+    a, b, m, n = quads.T
+    res = pot[a,m] - pot[a,n] - pot[b,m] + pot[b,n]
+    res[res == 0] = np.nan
+    res = np.abs(res)
+
+    # integration along y: y = c*tan(t) with t in [0, pi/2[
+    if ndims == 2:
+        t, w = np.polynomial.legendre.leggauss(ny)
+        t = (t + 1)*np.pi/4
+        w = w*np.pi/4
+    else:
+        t, w = np.zeros(1), np.ones(1)
+    nelec, npts = len(elec), len(t)
+
+    # chunk of cells such that the nelec x nelec x ncells matrix fits
+    chunk = int(maxMemory*1e9/8/max(nelec**2 + 3*nelec*npts, 1))
+    chunk = max(1, min(chunk, centres.shape[0]))
+    sens = np.zeros(centres.shape[0])
+    for i0 in range(0, centres.shape[0], chunk):
+        c = centres[i0:i0+chunk]
+        nc = c.shape[0]
+        if ndims == 2: # scale of the integral: distance to the closest electrode
+            scale = np.min(np.sqrt((c[None,:,0] - elec[:,None,0])**2 +
+                                   (c[None,:,2] - elec[:,None,2])**2), axis=0)
+            scale = np.maximum(scale, 1e-3*np.max(np.ptp(elec, axis=0)) + 1e-12)
+            y = scale[:,None]*np.tan(t)[None,:] # (nc, npts)
+            wy = 2*w[None,:]*scale[:,None]/np.cos(t)[None,:]**2 # symmetric in y
+            pts = np.repeat(c, npts, axis=0)
+            pts[:,1] = y.ravel()
+        else:
+            wy = np.ones((nc, 1))
+            pts = c
+        grad = _gradients(elec, pts, surface).reshape(nelec, nc, npts, 3)
+        grad[~active] = 0
+        # dot product of the gradients of all pairs of electrodes
+        dots = np.einsum('ickd,jckd,ck->ijc', grad, grad, wy, optimize=True)
+        jac = dots[a,m] - dots[a,n] - dots[b,m] + dots[b,n] # (nquad, nc)
+        sens[i0:i0+chunk] = np.nansum(np.abs(jac)/res[:,None], axis=0)
+    if volumes is not None:
+        sens *= np.asarray(volumes, dtype=float)
+    return sens
+
+
+def doiLine(centres, values, level, xbins=None):
+    """Deepest elevation along x where `values` are above `level`.
+
+    Parameters
+    ----------
+    centres : array of float
+        Cell centres (numel x 3: x, y, z).
+    values : array of float
+        Attribute of the cells (e.g. log10 of the sensitivity).
+    level : float
+        Cells with values below `level` are considered not resolved.
+    xbins : array of float, optional
+        Edges of the bins along x. Default is 100 bins between the
+        extreme cell centres.
+
+    Returns
+    -------
+    x, z : array of float
+        Centre of the bins and elevation of the DOI. Bins without resolved
+        cells are removed.
+    """
+    xc, zc = centres[:,0], centres[:,2]
+    if xbins is None:
+        xbins = np.linspace(np.min(xc), np.max(xc), 101)
+    ibin = np.clip(np.searchsorted(xbins, xc) - 1, 0, len(xbins) - 2)
+    ok = np.asarray(values) >= level
+    z = np.full(len(xbins) - 1, np.inf)
+    np.minimum.at(z, ibin[ok], zc[ok])
+    x = 0.5*(xbins[1:] + xbins[:-1])
+    return x[np.isfinite(z)], z[np.isfinite(z)]
@@ -2,9 +2,12 @@
 #author: jimmy boyd 
 import sys
 import numpy as np
-from scipy.spatial import Delaunay, ConvexHull, cKDTree
-from scipy.interpolate import LinearNDInterpolator
-import matplotlib.path as mpltPath 
+from resipy.lazy import lazyModule, lazyObject
+Delaunay = lazyObject('scipy.spatial', 'Delaunay')
+ConvexHull = lazyObject('scipy.spatial', 'ConvexHull')
+cKDTree = lazyObject('scipy.spatial', 'cKDTree')
+LinearNDInterpolator = lazyObject('scipy.interpolate', 'LinearNDInterpolator')
+mpltPath = lazyModule('matplotlib.path')
 
 #%% compute thin plate spline /bilinear models  for irregular grid
 # see solution @ https://math.stackexchange.com/questions/828392/spatial-interpolation-for-irregular-grid
@@ -750,7 +753,7 @@ def nearest(xnew, ynew, xknown, yknown, zknown, return_idx=False,
     pnew = np.array([xnew,ynew]).T # new points 
 
     tree = cKDTree(pknown)#tree object 
-    dist,idx = tree.query(pnew,n_jobs=num_threads)# map known points to new points 
+    dist,idx = tree.query(pnew,workers=num_threads)# map known points to new points 
     
     if return_idx:
         return zknown[idx], idx
@@ -803,7 +806,7 @@ def nearest3d(xnew,ynew,znew,xknown, yknown, zknown, iknown, return_idx=False,
     pknown = np.array([xknown,yknown,zknown]).T # known points 
     pnew = np.array([xnew,ynew,znew]).T # new points 
     tree = cKDTree(pknown)#tree object 
-    dist,idx = tree.query(pnew,n_jobs=num_threads)# map known points to new points 
+    dist,idx = tree.query(pnew,workers=num_threads)# map known points to new points 
     
     if return_idx:
         return iknown[idx], idx
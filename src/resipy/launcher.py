@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Resolve the command used to launch the Windows executables (R2.exe, gmsh.exe,
+...) once per session. On Linux and macOS the executables run through wine;
+looking wine up for every run and cold-starting its server each time adds
+noticeable overhead when many small inversions are run. If a native Linux
+build is present next to the .exe (e.g. 'R2_linux', 'gmsh_linux') it is used
+instead of wine.
+"""
+import os, shutil, platform, time
+from subprocess import Popen, DEVNULL
+
+OS = platform.system()
+
+_launcher = None # resolved once per session
+_wineServer = None # persistent wineserver process
+
+
+def getMacOSVersion():
+    if OS == 'Darwin':
+        versionList = platform.mac_ver()[0].split('.')
+        macVersion = float(versionList[0] + '.' + versionList[1]) # not getting patch version so xx.xx only
+        if macVersion >= 10.15:
+            return True
+    return False
+
+
+def getLauncher():
+    """Return the command prefix needed to run a Windows executable (empty
+    on Windows, path of wine otherwise). The lookup is done on the first call
+    only.
+    """
+    global _launcher
+    if _launcher is None:
+        if OS == 'Windows':
+            _launcher = []
+        else:
+            winetxt = 'wine64' if getMacOSVersion() else 'wine'
+            winePath = shutil.which(winetxt)
+            if winePath is None and OS == 'Darwin': # not in the PATH of GUI apps
+                for wPath in ['/usr/local/bin/', '/opt/homebrew/bin/']: # /opt/homebrew for M1 Macs
+                    if os.path.exists(wPath + winetxt):
+                        winePath = wPath + winetxt
+                        break
+            _launcher = [winePath if winePath is not None else winetxt]
+    return list(_launcher)
+
+
+def resetLauncher():
+    """Force the launcher to be resolved again at the next call (e.g. after
+    installing wine).
+    """
+    global _launcher
+    _launcher = None
+
+
+def nativeExe(exePath):
+    """Return the path of the native build of `exePath` if available on this
+    system (only Linux builds named '<name>_linux' for now), else None.
+    """
+    if OS == 'Linux':
+        nativePath = exePath.replace('.exe', '') + '_linux'
+        if os.path.isfile(nativePath) and os.access(nativePath, os.X_OK):
+            return nativePath
+    return None
+
+
+def exeCommand(exePath):
+    """Return the command to launch the executable at `exePath`.
+
+    Parameters
+    ----------
+    exePath : str
+        Path of the Windows executable.
+
+    Returns
+    -------
+    cmd : list of str
+        Command to pass to `subprocess.Popen`.
+    """
+    nativePath = nativeExe(exePath)
+    if nativePath is not None:
+        return [nativePath]
+    return getLauncher() + [exePath]
+
+
+def startWineServer(delay=600):
+    """Start a persistent wineserver so that wine processes launched after
+    it don't have to start their own server (saves about 1 s per run). Does
+    nothing on Windows or if the server has already been started.
+
+    Parameters
+    ----------
+    delay : int, optional
+        Number of seconds the wineserver stays alive after the last wine
+        process exited. If None, it stays alive until `stopWineServer()` is
+        called or the session is closed.
+
+    Returns
+    -------
+    success : bool
+        True if a persistent wineserver is running.
+    """
+    global _wineServer
+    if OS == 'Windows':
+        return False
+    if _wineServer is not None:
+        return True
+    wine = getLauncher()[0]
+    serverPath = os.path.join(os.path.dirname(wine), 'wineserver')
+    if os.path.exists(serverPath) is False:
+        serverPath = shutil.which('wineserver')
+    if serverPath is None:
+        return False
+    opt = '-p' if delay is None else '-p{:d}'.format(int(delay))
+    # -f keeps the server in the foreground: otherwise it forks to the
+    # background and _wineServer would be the parent that already exited
+    _wineServer = Popen([serverPath, '-f', opt], stdout=DEVNULL, stderr=DEVNULL)
+    return True
+
+
+def stopWineServer():
+    """Stop the persistent wineserver started with `startWineServer()`.
+    The server exits once the wine processes still running are finished.
+    """
+    global _wineServer
+    if _wineServer is not None:
+        if _wineServer.poll() is None:
+            _wineServer.terminate()
+            _wineServer.wait()
+        _wineServer = None
+
+
+def launchOverhead(nruns=3):
+    """Measure the time needed to start and stop a trivial Windows process
+    with the current launcher. Useful to compare before and after starting
+    a persistent wineserver.
+
+    Parameters
+    ----------
+    nruns : int, optional
+        Number of launches.
+
+    Returns
+    -------
+    times : list of float
+        Time in seconds for each launch, empty if the launcher (wine) is not
+        installed.
+    """
+    cmd = getLauncher() + ['cmd', '/c', 'exit']
+    times = []
+    for i in range(nruns):
+        t0 = time.time()
+        try:
+            Popen(cmd, stdout=DEVNULL, stderr=DEVNULL).wait()
+        except FileNotFoundError: # wine not installed
+            return []
+        times.append(time.time() - t0)
+    return times
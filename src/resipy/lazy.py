@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Deferred imports. Plotting (matplotlib, pyvista), scipy and requests are
+only needed by some functions, so they are imported the first time one of
+their attributes is used. This keeps `import resipy` fast for headless use
+(e.g. batch workers).
+"""
+import importlib
+import importlib.util
+
+
+class LazyModule(object):
+    """Proxy of a module imported on first attribute access.
+
+    Parameters
+    ----------
+    name : str
+        Full name of the module (e.g. 'matplotlib.pyplot').
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+    def __repr__(self):
+        return '<lazy module {:s} ({:s})>'.format(
+            self._name, 'loaded' if self._module is not None else 'not loaded')
+
+
+
+class LazyObject(object):
+    """Proxy of a function or class of a module imported on first use
+    (call or attribute access).
+
+    Parameters
+    ----------
+    module : str
+        Full name of the module.
+    name : str
+        Name of the object in the module.
+    """
+    def __init__(self, module, name):
+        self._moduleName = module
+        self._objName = name
+        self._obj = None
+
+
+    def _load(self):
+        if self._obj is None:
+            self._obj = getattr(importlib.import_module(self._moduleName), self._objName)
+        return self._obj
+
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'): # no recursion before _load()
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+
+    def __repr__(self):
+        return '<lazy {:s}.{:s}>'.format(self._moduleName, self._objName)
+
+
+
+def lazyModule(name):
+    """Return a proxy importing module `name` on first attribute access."""
+    return LazyModule(name)
+
+
+def lazyObject(module, name):
+    """Return a proxy importing `name` from `module` on first use."""
+    return LazyObject(module, name)
+
+
+def isInstalled(name):
+    """Return True if the top-level package `name` can be imported (without
+    importing it).
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Raster display of large 2D meshes (see `Mesh.show(raster=True)`). Instead of
+drawing one polygon per cell, the cells are rasterized once on a grid of the
+resolution of the axis: each pixel gets the index of the cell containing its
+centre (barycentric test on the pixels of the bounding box of each
+triangle). The cell values are then shown as an image by indexing them with
+this grid. The index only depends on the limits and size of the axis, so it
+is recomputed on zoom, pan or resize only; changing the attribute, the
+colour scale or the time step is a simple indexing of the values.
+"""
+import numpy as np
+from matplotlib.image import AxesImage
+
+
+class CellFinder(object):
+    """Index of the cell at the pixels of a grid over a 2D mesh.
+
+    Parameters
+    ----------
+    nodes : array of float
+        Coordinates (x, z) of the nodes, shape (numnp, 2).
+    connection : array of int
+        Nodes of each cell, shape (numel, npere). Cells with more than three
+        nodes are split into triangles.
+    chunk : int, optional
+        Number of triangles rasterized at once (bounds the memory used).
+    """
+    def __init__(self, nodes, connection, chunk=200000):
+        npere = connection.shape[1]
+        self.x = np.asarray(nodes[:,0], dtype=float)
+        self.z = np.asarray(nodes[:,1], dtype=float)
+        self.triangles = np.vstack([connection[:,[0, i, i+1]] for i in range(1, npere-1)])
+        self.cellOfTri = np.tile(np.arange(connection.shape[0]), npere-2)
+        self.chunk = chunk
+        self.view = None # (xlim, zlim, shape) of the last pixel index
+        self.icell = None
+
+
+    def pixelIndex(self, xlim, zlim, shape):
+        """Index of the cell at the centre of each pixel of a grid.
+
+        Parameters
+        ----------
+        xlim, zlim : tuple of float
+            Limits of the grid.
+        shape : tuple of int
+            Number of pixels (nz, nx).
+
+        Returns
+        -------
+        icell : array of int
+            Index of the cells, shape (nz, nx), first row at zlim[0] and -1
+            outside of the mesh.
+        """
+        view = (tuple(xlim), tuple(zlim), tuple(shape))
+        if view == self.view: # last grid is shared by the images of an axis
+            return self.icell
+        nz, nx = shape
+        icell = np.full(nz*nx, -1, dtype=int)
+        # node coordinates in pixels, the centre of pixel (j, i) is at (i, j)
+        u = (self.x - xlim[0])/(xlim[1] - xlim[0])*nx - 0.5
+        v = (self.z - zlim[0])/(zlim[1] - zlim[0])*nz - 0.5
+        for start in range(0, len(self.triangles), self.chunk):
+            tri = self.triangles[start:start + self.chunk]
+            tu, tv = u[tri], v[tri]
+            # pixel centres in the bounding box of each triangle
+            i0 = np.maximum(np.ceil(tu.min(axis=1)), 0).astype(int)
+            i1 = np.minimum(np.floor(tu.max(axis=1)), nx - 1).astype(int)
+            j0 = np.maximum(np.ceil(tv.min(axis=1)), 0).astype(int)
+            j1 = np.minimum(np.floor(tv.max(axis=1)), nz - 1).astype(int)
+            ni, nj = i1 - i0 + 1, j1 - j0 + 1
+            count = np.where((ni > 0) & (nj > 0), ni*nj, 0)
+            itri = np.repeat(np.arange(len(tri)), count)
+            if len(itri) == 0:
+                continue
+            k = np.arange(len(itri)) - np.repeat(np.cumsum(count) - count, count)
+            pi = i0[itri] + k % ni[itri]
+            pj = j0[itri] + k // ni[itri]
+            # barycentric coordinates of the pixel centres
+            u0, u1, u2 = tu[itri,0], tu[itri,1], tu[itri,2]
+            v0, v1, v2 = tv[itri,0], tv[itri,1], tv[itri,2]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d = (v1 - v2)*(u0 - u2) + (u2 - u1)*(v0 - v2)
+                l0 = ((v1 - v2)*(pi - u2) + (u2 - u1)*(pj - v2))/d
+                l1 = ((v2 - v0)*(pi - u2) + (u0 - u2)*(pj - v2))/d
+            eps = -1e-9 # pixels on the edges are in both triangles
+            inside = (l0 >= eps) & (l1 >= eps) & (1 - l0 - l1 >= eps)
+            icell[pj[inside]*nx + pi[inside]] = self.cellOfTri[start + itri[inside]]
+        self.icell = icell.reshape(nz, nx)
+        self.view = view
+        return self.icell
+
+
+
+_finders = [] # (node, connection, ikeep, finder) of the last meshes
+
+def cellFinder(node, connection, ikeep=None, maxSize=2):
+    """`CellFinder` of a mesh, reused between calls with the same node and
+    connection arrays (e.g. time steps of `MeshResults`).
+
+    Parameters
+    ----------
+    node : array of float
+        Nodes of the mesh, shape (numnp, 3), (x, z) are columns 0 and 2.
+    connection : array of int
+        Connection matrix.
+    ikeep : array of bool, optional
+        Cells displayed. The index of the finder refers to them only.
+    maxSize : int, optional
+        Number of finders kept in memory.
+    """
+    for entry in _finders:
+        if entry[0] is node and entry[1] is connection and (
+            (ikeep is None and entry[2] is None) or (ikeep is not None and entry[2] is not None
+                                                     and np.array_equal(ikeep, entry[2]))):
+            _finders.remove(entry)
+            _finders.insert(0, entry)
+            return entry[3]
+    conn = connection if ikeep is None else connection[ikeep,:]
+    finder = CellFinder(node[:,[0,2]], conn)
+    _finders.insert(0, (node, connection, ikeep, finder))
+    del _finders[maxSize:]
+    return finder
+
+
+
+class CellRaster(AxesImage):
+    """Image of cell values (or colours) resampled at the resolution of the
+    axis. `set_array()` takes one value per cell; the image is resampled
+    when the axis is drawn with other limits or size.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axis of the image (add it with `ax.add_image()`).
+    finder : CellFinder
+        Finder of the cells displayed.
+    resolution : float, optional
+        Size of the pixels of the image in pixels of the screen.
+    **kwargs : optional
+        Passed to `matplotlib.image.AxesImage` (cmap, norm, ...).
+    """
+    def __init__(self, ax, finder, resolution=1, **kwargs):
+        kwargs.setdefault('interpolation', 'nearest')
+        super().__init__(ax, origin='lower', **kwargs)
+        self.finder = finder
+        self.resolution = resolution
+        self.cellValues = None # one value per cell, mapped by the colormap
+        self.cellColors = None # or one RGBA colour per cell
+        self.view = None
+        x, z = finder.x, finder.z
+        self._extent = (np.min(x), np.max(x), np.min(z), np.max(z))
+        super().set_data(np.ma.masked_all((1, 1)))
+
+
+    def set_array(self, A):
+        """Set the value of each cell."""
+        self.cellValues = np.asarray(A, dtype=float)
+        self.cellColors = None
+        self._refresh()
+
+
+    def setCellColors(self, rgba):
+        """Set the RGBA colour of each cell, shape (ncells, 4)."""
+        self.cellColors = np.asarray(rgba, dtype=float)
+        self.cellValues = None
+        self._refresh()
+
+
+    def _refresh(self):
+        if self.view is None:
+            return # done when first drawn
+        icell = self.finder.pixelIndex(*self.view)
+        outside = icell < 0
+        if self.cellColors is not None:
+            img = self.cellColors[icell]
+            img[outside,:] = 0 # transparent
+            super().set_data(img)
+        elif self.cellValues is not None:
+            img = np.ma.masked_invalid(self.cellValues[icell])
+            img[outside] = np.ma.masked
+            super().set_data(img)
+
+
+    def draw(self, renderer, *args, **kwargs):
+        ax = self.axes
+        xlim, zlim = ax.get_xlim(), ax.get_ylim()
+        nx = max(1, int(np.ceil(abs(ax.bbox.width)/self.resolution)))
+        nz = max(1, int(np.ceil(abs(ax.bbox.height)/self.resolution)))
+        view = (tuple(xlim), tuple(zlim), (nz, nx))
+        if view != self.view: # zoom, pan or resize
+            self.view = view
+            self._extent = (xlim[0], xlim[1], zlim[0], zlim[1])
+            self._refresh()
+        super().draw(renderer, *args, **kwargs)
+
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Lazy container for the inverted meshes (`Project.meshResults`). Long
+time-lapse series can't all be kept in memory as full `Mesh` objects. Here all
+steps share the topology (nodes, connection, cell centres) of a template mesh
+and only the cell attributes of a step are read from its f###_res.vtk when the
+step is accessed. A small least recently used (LRU) cache keeps the last
+decoded steps. When the columnar f###_res.dat (and f###_sen.dat) files hold
+the same values as the vtk, only their numeric columns are read. The column of
+each attribute is found by comparing the values of the first two steps; any
+ambiguity falls back to reading the vtk files.
+"""
+import os, copy
+from collections import OrderedDict
+from collections.abc import MutableSequence
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import resipy.meshTools as mt
+
+
+def readDat(fname):
+    """Read a columnar file of floats (e.g. f001_res.dat) in bulk.
+
+    Returns
+    -------
+    values : numpy.array
+        2D array (one row per line of the file).
+    """
+    with open(fname, 'r') as f:
+        first = f.readline()
+        text = f.read()
+    ncol = len(first.split())
+    return np.fromstring(first + ' ' + text, sep=' ').reshape(-1, ncol)
+
+
+def datMapping(fname, attrs):
+    """Find in which column of the .dat files next to `fname` (a
+    f###_res.vtk file) each attribute of the vtk is stored.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the vtk file.
+    attrs : dict
+        Cell attributes of the vtk file (see `vtk_import_cell_data()`).
+
+    Returns
+    -------
+    datMap : dict or None
+        Attribute name: (file suffix, column index). None if some attributes
+        can't be found in the .dat files or if the match is ambiguous (an
+        attribute matching several columns, several attributes matching the
+        same column or a constant attribute).
+    """
+    candidates = dict([(name, []) for name in attrs])
+    for suffix in ['_res.dat', '_sen.dat']:
+        datFile = fname.replace('_res.vtk', suffix)
+        if os.path.exists(datFile) is False:
+            continue
+        try:
+            values = readDat(datFile)
+        except Exception:
+            continue
+        for name in attrs:
+            if values.shape[0] != len(attrs[name]):
+                continue
+            for col in range(values.shape[1]):
+                if np.allclose(values[:,col], attrs[name], rtol=1e-3):
+                    candidates[name].append((suffix, col))
+    if len(attrs) == 0:
+        return None
+    for name in attrs: # a constant matches any constant column of later steps
+        if len(candidates[name]) != 1 or np.ptp(attrs[name]) == 0:
+            return None
+    datMap = dict([(name, candidates[name][0]) for name in attrs])
+    if len(set(datMap.values())) != len(datMap):
+        return None
+    return datMap
+
+
+def readStep(fname, datMap=None):
+    """Read the cell attributes of a step from the .dat files if `datMap`
+    is given and they exist, else from the vtk file.
+    """
+    if datMap is None or os.path.exists(fname.replace('_res.vtk', '_res.dat')) is False:
+        return mt.vtk_import_cell_data(fname)
+    arrays = {}
+    attrs = {}
+    for name, (suffix, col) in datMap.items():
+        if suffix not in arrays:
+            arrays[suffix] = readDat(fname.replace('_res.vtk', suffix))
+        attrs[name] = arrays[suffix][:,col]
+    return attrs
+
+
+def checkStep(fname, numel=None):
+    """Check that a result vtk file is complete without decoding it: the
+    CELL_DATA header must be present, give `numel` cells (if specified) and
+    the last attribute (the first one to be cut if the file is truncated)
+    must have one value per cell.
+
+    Raises
+    ------
+    ImportError
+        If the file is empty, truncated or doesn't match `numel`.
+    """
+    if os.path.getsize(fname) == 0:
+        raise ImportError('empty result file ' + fname)
+    with open(fname, 'r') as f:
+        text = f.read()
+    i = text.find('\nCELL_DATA')
+    if i == -1:
+        raise ImportError('No CELL_DATA section in ' + fname)
+    header, text = text[i+1:].split('\n', 1)
+    ncells = int(header.split()[1])
+    if numel is not None and ncells != numel:
+        raise ImportError('{:s} has {:d} cells instead of {:d}'.format(fname, ncells, numel))
+    j = text.find('\nPOINT_DATA')
+    if j > -1:
+        text = text[:j]
+    blocks = text.split('SCALARS ')
+    if len(blocks) < 2:
+        raise ImportError('No cell attribute in ' + fname)
+    values = blocks[-1].split('\n', 2)[-1]
+    if np.fromstring(values, sep=' ').size != ncells:
+        raise ImportError('{:s} is truncated'.format(fname))
+
+
+class MeshResults(MutableSequence):
+    """List-like container of `Mesh` objects loaded on access.
+
+    Parameters
+    ----------
+    maxCache : int, optional
+        Maximum number of decoded steps kept in memory.
+
+    Notes
+    -----
+    Meshes added with `append()` (or `insert()`, `[i] = mesh`) are kept in
+    memory as in a list. Meshes added with `appendLazy()` (or `appendLoader()`)
+    are decoded when accessed and dropped when they are the least recently
+    used. Attributes added to a decoded mesh (e.g. `mesh.df['new'] = ...`) are saved when the
+    mesh is dropped and restored at the next access, but changes to its
+    existing attributes are lost. Use `addTransform()` for attributes that
+    can be computed from the others.
+    """
+    def __init__(self, maxCache=20):
+        self.maxCache = maxCache
+        self._entries = [] # Mesh object or dict describing a lazy step
+        self._cache = OrderedDict() # id of lazy entry: decoded Mesh
+        self._extra = {} # id of lazy entry: attributes added after decoding
+        self._cols = {} # id of lazy entry: columns of the decoded mesh
+        self._template = None # mesh which topology is shared
+        self._baseCols = [] # columns of the template not read from the vtk
+        self._transforms = []
+        self._datMap = None # where to read the attributes in the .dat files
+        self._datChecked = False # mapping confirmed on a second step
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        entry = self._entries[i]
+        if isinstance(entry, dict):
+            return self._load(entry)
+        return entry
+
+
+    def __setitem__(self, i, mesh):
+        self._drop(self._entries[i])
+        self._entries[i] = mesh
+
+
+    def __delitem__(self, i):
+        self._drop(self._entries[i])
+        del self._entries[i]
+
+
+    def insert(self, i, mesh):
+        self._entries.insert(i, mesh)
+
+
+    def __add__(self, other):
+        out = copy.copy(self)
+        out._entries = self._entries + list(other._entries if
+                                            isinstance(other, MeshResults) else other)
+        return out
+
+
+    def __radd__(self, other):
+        out = copy.copy(self)
+        out._entries = list(other) + self._entries
+        return out
+
+
+    def __repr__(self):
+        return 'MeshResults({:d} meshes, {:d} decoded)'.format(
+            len(self), len(self._cache))
+
+
+    def appendLazy(self, fname, title=None, elec=None, iremote=None):
+        """Add a step which cell attributes are read from `fname` on access.
+
+        Parameters
+        ----------
+        fname : str
+            Path of the vtk file (e.g. 'f001_res.vtk').
+        title : str, optional
+            Title of the mesh (name of the survey).
+        elec : array of float, optional
+            Electrode coordinates (x, y, z columns).
+        iremote : array of bool, optional
+            Which electrodes are remote.
+
+        Raises
+        ------
+        ImportError
+            If the file is empty, truncated or doesn't have the number of
+            cells of the first lazy step (see `checkStep()`).
+        """
+        # cheap check as the step is decoded later
+        checkStep(fname, None if self._template is None else self._template.numel)
+        if self._template is None: # full import of the first step only
+            self._template = mt.vtk_import(fname, order_nodes=False)
+            attrs = mt.vtk_import_cell_data(fname)
+            self._baseCols = [c for c in self._template.df.columns if c not in attrs]
+            self._datMap = datMapping(fname, attrs)
+        elif self._datMap is not None and self._datChecked is False: # same mapping on a second step
+            if datMapping(fname, mt.vtk_import_cell_data(fname)) != self._datMap:
+                self._datMap = None
+            self._datChecked = True
+        self._entries.append({'fname': fname, 'title': title,
+                              'elec': elec, 'iremote': iremote})
+
+
+    def appendLoader(self, loader, template, title=None, elec=None, iremote=None):
+        """Add a step which cell attributes are returned by `loader` on
+        access (e.g. arrays memory-mapped from a project file).
+
+        Parameters
+        ----------
+        loader : callable
+            Function without argument returning a dictionary of attribute
+            name: array.
+        template : Mesh
+            Mesh which topology (and columns not returned by `loader`) is
+            shared by the step.
+        title : str, optional
+            Title of the mesh (name of the survey).
+        elec : array of float, optional
+            Electrode coordinates (x, y, z columns).
+        iremote : array of bool, optional
+            Which electrodes are remote.
+        """
+        self._entries.append({'loader': loader, 'template': template, 'title': title,
+                              'elec': elec, 'iremote': iremote})
+
+
+    def addTransform(self, func):
+        """Add a function called with (mesh, index) each time a step is
+        decoded, typically to compute derived attributes. It is also applied
+        directly to the meshes already in memory.
+        """
+        self._transforms.append(func)
+        for i, entry in enumerate(self._entries):
+            if isinstance(entry, dict):
+                if id(entry) in self._cache:
+                    func(self._cache[id(entry)], i)
+            else:
+                func(entry, i)
+
+
+    def titles(self):
+        """Return the title of each mesh without decoding the steps.
+        """
+        return [e['title'] if isinstance(e, dict) else e.mesh_title
+                for e in self._entries]
+
+
+    def getAttribute(self, i, name):
+        """Return the values of attribute `name` for step `i`. If the step is
+        not in memory and the attribute is in its vtk file, it is read
+        without building the mesh.
+        """
+        entry = self._entries[i]
+        if isinstance(entry, dict) and id(entry) not in self._cache:
+            if name in self._extra.get(id(entry), {}):
+                return self._extra[id(entry)][name]
+            attrs = self._read(entry)
+            if name in attrs:
+                return attrs[name]
+        return np.array(self[i].df[name])
+
+
+    def clearCache(self):
+        """Drop all decoded steps from memory.
+        """
+        for key in list(self._cache.keys()):
+            self._evict(key)
+
+
+    def readAttributes(self, indices, ncores=None):
+        """Read the cell attributes of several steps without decoding the
+        meshes. The files of the steps not in memory are read in parallel
+        threads if `ncores` > 1 (mostly file reading and numpy parsing, so
+        no process pool is needed and no `if __name__ == '__main__'` guard
+        either).
+
+        Parameters
+        ----------
+        indices : list of int
+            Index of the steps to read.
+        ncores : int, optional
+            Number of threads used to read the files.
+
+        Returns
+        -------
+        attrs : list of dict
+            For each step, dictionary of attribute name: array.
+        """
+        out = [None]*len(indices)
+        toRead = [] # (position in out, file name)
+        for j, i in enumerate(indices):
+            entry = self._entries[i]
+            if isinstance(entry, dict) and id(entry) not in self._cache:
+                if 'loader' in entry:
+                    out[j] = self._read(entry)
+                else:
+                    toRead.append((j, entry['fname']))
+                continue
+            mesh = self[i]
+            out[j] = dict([(c, mesh.df[c].values) for c in mesh.df.columns])
+        fnames = [f for _, f in toRead]
+        if ncores is None or ncores < 2 or len(fnames) < 2:
+            attrs = [readStep(f, self._datMap) for f in fnames]
+        else:
+            with ThreadPoolExecutor(max_workers=ncores) as executor:
+                attrs = list(executor.map(readStep, fnames, [self._datMap]*len(fnames)))
+        for (j, _), a in zip(toRead, attrs):
+            out[j] = a
+        return out
+
+
+    def prefetch(self, indices=None, ncores=None):
+        """Decode steps in advance (up to `maxCache` steps), parsing their
+        files in parallel.
+
+        Parameters
+        ----------
+        indices : list of int, optional
+            Index of the steps. Default is the first `maxCache` steps.
+        ncores : int, optional
+            Number of threads used to read the files.
+        """
+        if indices is None:
+            indices = range(len(self))
+        indices = [i for i in indices if isinstance(self._entries[i], dict)
+                   and id(self._entries[i]) not in self._cache][:self.maxCache]
+        for i, attrs in zip(indices, self.readAttributes(indices, ncores)):
+            self._load(self._entries[i], attrs)
+
+
+    def _read(self, entry):
+        if 'loader' in entry:
+            return entry['loader']()
+        return readStep(entry['fname'], self._datMap)
+
+
+    def _load(self, entry, attrs=None):
+        key = id(entry)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        try:
+            if attrs is None:
+                attrs = self._read(entry)
+            template = entry.get('template', self._template)
+            if 'template' in entry:
+                baseCols = [c for c in template.df.columns if c not in attrs]
+            else:
+                baseCols = self._baseCols
+            mesh = copy.copy(template) # share nodes and connection
+            if len(attrs) == 0 or len(list(attrs.values())[0]) != mesh.numel:
+                raise ValueError('mesh topology differs from the template')
+            df = template.df[baseCols].copy()
+            for name in attrs:
+                df[name] = attrs[name]
+                if name in ['Sensitivity_map(log10)', 'Sensitivity(log10)']:
+                    mesh.sensitivities = attrs[name]
+            mesh.df = df
+            mesh.cax = None
+        except Exception: # different topology or vtk flavour
+            if 'fname' not in entry:
+                raise
+            mesh = mt.vtk_import(entry['fname'], order_nodes=False)
+        if entry['title'] is not None:
+            mesh.mesh_title = entry['title']
+        if entry['elec'] is not None:
+            elec = entry['elec']
+            mesh.setElec(elec[:,0], elec[:,1], elec[:,2])
+            mesh.iremote = entry['iremote']
+        index = [id(e) for e in self._entries].index(key)
+        for func in self._transforms:
+            func(mesh, index)
+        self._cols[key] = list(mesh.df.columns) # can be recomputed
+        for name, values in self._extra.pop(key, {}).items():
+            mesh.df[name] = values
+        self._cache[key] = mesh
+        while len(self._cache) > max(self.maxCache, 1):
+            self._evict(next(iter(self._cache)))
+        return mesh
+
+
+    def _evict(self, key):
+        mesh = self._cache.pop(key)
+        cols = self._cols.pop(key)
+        extra = {}
+        for name in mesh.df.columns: # keep attributes added by the user
+            if name not in cols:
+                extra[name] = np.array(mesh.df[name])
+        if len(extra) > 0:
+            self._extra[key] = extra
+
+
+    def _drop(self, entry):
+        if isinstance(entry, dict):
+            self._cache.pop(id(entry), None)
+            self._cols.pop(id(entry), None)
+            self._extra.pop(id(entry), None)
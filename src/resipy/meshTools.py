@@ -12,27 +12,33 @@ Dependencies:
     python3 standard libaries
 """
 #import standard python packages
-import os, platform, warnings, psutil
+import os, platform, warnings, psutil, weakref
 from subprocess import PIPE, Popen
 import tempfile
 import time, ntpath
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.collections import PolyCollection
-from matplotlib.colors import ListedColormap
-import matplotlib.tri as tri
-import matplotlib.patches as mpatches
-import matplotlib.path as mpath
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-from scipy.spatial import cKDTree
+from resipy.lazy import lazyModule, lazyObject, isInstalled
+# plotting and scipy are imported when first used (fast headless import)
+plt = lazyModule('matplotlib.pyplot')
+PolyCollection = lazyObject('matplotlib.collections', 'PolyCollection')
+ListedColormap = lazyObject('matplotlib.colors', 'ListedColormap')
+Normalize = lazyObject('matplotlib.colors', 'Normalize')
+BoundaryNorm = lazyObject('matplotlib.colors', 'BoundaryNorm')
+tri = lazyModule('matplotlib.tri')
+mpatches = lazyModule('matplotlib.patches')
+mpath = lazyModule('matplotlib.path')
+Poly3DCollection = lazyObject('mpl_toolkits.mplot3d.art3d', 'Poly3DCollection')
+cKDTree = lazyObject('scipy.spatial', 'cKDTree')
 from copy import deepcopy
 
 #import R2gui API packages 
 import resipy.gmshWrap as gw
 from resipy.sliceMesh import sliceMesh # mesh slicing function
 import resipy.interpolation as interp
+meshRaster = lazyModule('resipy.meshRaster') # raster display of large 2D meshes
+from resipy.launcher import exeCommand, getMacOSVersion
+from resipy.tracing import traced, annotate
 
 try: 
     from resipy.cext import meshCalc as mc 
@@ -42,16 +48,10 @@ except Exception as e:
     raise Exception('Could not import meshCalc extension to fix the problem try, '\
                     'updating ResIPy, updating Numpy or recompiling the extension.')
 
-# import pyvista if available
-try:
-    import pyvista as pv
-    try:
-        from pyvistaqt import BackgroundPlotter # newer version
-    except:
-        from pyvista import BackgroundPlotter # older version
-    pyvista_installed = True
-except:
-    pyvista_installed = False
+# pyvista is imported when first used
+pv = lazyModule('pyvista')
+pyvista_installed = isInstalled('pyvista')
+if not pyvista_installed:
     warnings.warn('pyvista not installed, 3D meshing viewing options will be limited')
     
 #%% system status 
@@ -199,17 +199,59 @@ def points2vtk (x,y,z,file_name="points.vtk",title='points'):
     [fh.write('{:<10} {:<10} {:<10}\n'.format(x[i],y[i],z[i])) for i in range(len(x))]
     fh.close()
 
-#%% check mac version for wine
-def getMacOSVersion():
-    OpSys=platform.system()    
-    if OpSys=='Darwin':
-        versionList = platform.mac_ver()[0].split('.')
-        macVersion = float(versionList[0] + '.' + versionList[1]) # not getting patch version so xx.xx only
-        if macVersion >= 10.15:
-            return True
-        else:
-            return False
-        
+#%% artists reused between successive 2D plots
+# per axis: artists of the last Mesh.show() call (collection, colorbar,
+# sensitivity shade, electrodes) so that the next call on the same axis with
+# the same mesh only updates the colours instead of rebuilding everything
+_axArtists = weakref.WeakKeyDictionary()
+
+def axisArtists(ax):
+    """Artists of the last 2D `Mesh.show()` on `ax` (dict, empty if none)."""
+    if ax not in _axArtists:
+        _axArtists[ax] = {}
+    return _axArtists[ax]
+
+
+def redrawArtists(ax, full=False):
+    """Redraw the figure of `ax` after `Mesh.show()` updated its artists.
+    
+    If only the colours of the cells changed (same colour scale, limits and
+    visible artists), the cached background is restored and only the axis is
+    redrawn and blitted (interactive backends). Otherwise the whole canvas is
+    redrawn.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axis given to `Mesh.show()`.
+    full : bool, optional
+        If True, always redraw the whole canvas.
+    """
+    canvas = ax.figure.canvas
+    artists = axisArtists(ax)
+    cells = [artists[name] for name in ['coll', 'sens', 'elec'] 
+             if artists.get(name) is not None and artists[name].get_visible()]
+    if getattr(canvas, 'supports_blit', False) is False or 'coll' not in artists:
+        canvas.draw()
+        return
+    if (full or artists.get('blit', False) is False or artists.get('background') is None
+        or artists.get('view') != (ax.bbox.bounds, ax.get_title())): # e.g. resized window
+        # draw everything but the cells once and keep it as background
+        for a in cells:
+            a.set_visible(False)
+        try:
+            canvas.draw()
+            artists['background'] = canvas.copy_from_bbox(ax.bbox)
+            artists['view'] = (ax.bbox.bounds, ax.get_title())
+        finally:
+            for a in cells:
+                a.set_visible(True)
+    else:
+        canvas.restore_region(artists['background'])
+    for a in cells:
+        ax.draw_artist(a)
+    canvas.blit(ax.bbox)
+
 #%% create mesh object
 class Mesh:
     """Mesh class.
@@ -527,6 +569,7 @@ class Mesh:
             return out
     
     #%% mesh calculations 
+    @traced
     def orderNodes(self, return_count=False):
         """Order mesh nodes in clockwise fashion 
         
@@ -632,6 +675,7 @@ class Mesh:
         self.addAttribute(param,'param')
         
     
+    @traced
     def cellCentres(self):
         """A numpy-based approximation of cell centres for 2D and 3D elements. 
         It's calculated from the mean of cell x y z node coordinates 
@@ -741,6 +785,7 @@ class Mesh:
             self.df['Volume'] = elm_area
 
             
+    @traced
     def computeNeigh(self): # fix me 
         """Compute element neighbour matrix
         """            
@@ -935,6 +980,7 @@ class Mesh:
         self.addAttribute(dist,'cell_distance')
         return dist
     
+    @traced
     def extractSurface(self, return_idx =False, post_neigh_check=True): 
         """ Extract the surface of a triangle or tetrahedral mesh. Ouput of 
         function will depend on mesh type. 
@@ -1445,6 +1491,7 @@ class Mesh:
         for col in cont.collections:
             col.set_clip_path(patch)        
 
+    @traced
     def show(self,color_map = 'Spectral',#displays the mesh using matplotlib
              color_bar = True,
              xlim = None,
@@ -1463,6 +1510,7 @@ class Mesh:
              maxDepth = None,
              aspect = 'equal',
              darkMode = False,
+             raster = False,
              **kwargs):
         """ Displays a 2d mesh and attribute.
         
@@ -1510,6 +1558,12 @@ class Mesh:
             'auto', aspect ratio is define by plotting area.
         darkMode : bool, optional
             If True, electrodes will be plotted in white, else black
+        raster : bool, optional
+            If True (2D only), the cells are resampled on an image at the
+            resolution of the axis instead of drawn as polygons (much faster
+            for meshes of millions of cells). The image is resampled when the
+            view is zoomed, panned or resized. Edges are not drawn. With
+            `contour=True`, the colours are binned in the contour levels.
         
         Returns
         -------
@@ -1604,18 +1658,28 @@ class Mesh:
             zlim=[zlim[0]-2,zlim[1]+2]
                 
         ##plot mesh! ##
-        #compile mesh coordinates into polygon coordinates  
-        nodes = np.array([self.node[:,0],self.node[:,2]]).T
-        connection = self.connection.copy() # connection matrix 
-        if maxDepth is not None: 
+        # artists of the previous call on this axis are updated in place if
+        # the mesh topology is the same (e.g. other attribute or time step)
+        artists = axisArtists(ax)
+        key = (id(self.node), id(self.connection), self.numel, maxDepth, str(edge_color), raster)
+        reuse = (contour is False and artists.get('key') == key and (
+            artists.get('coll') in ax.collections or artists.get('coll') in ax.images))
+        if reuse: # shown artists, the figure is only blitted if they don't change
+            shown = [artists.get(name) is not None and artists[name].get_visible()
+                     for name in ['sens', 'elec']]
+        else:
+            artists.clear()
+        if reuse:
+            ikeep = artists['ikeep']
+        elif maxDepth is not None: 
             depths = np.array(self.computeElmDepth())
             ikeep = depths < maxDepth
-            #truncate connection matrix and plotted array
-            connection = connection[ikeep,:]
+        else:
+            ikeep = None
+        if ikeep is not None: #truncate plotted array
             X = X[ikeep]
-            
-        #compile polygons patches into a "patch collection"
-        coordinates = nodes[connection]
+        if raster: # cell at each pixel, cached for the mesh
+            finder = artists['finder'] if reuse else meshRaster.cellFinder(self.node, self.connection, ikeep)
         if vmin is None:
             vmin = np.min(X)
         if vmax is None:
@@ -1628,14 +1692,53 @@ class Mesh:
             if attr == 'region': # so the default material
                 cm = plt.get_cmap(color_map, len(np.unique(X))) # this makes a discrete colormap
             else:
-                cm = color_map
-            coll = PolyCollection(coordinates, array=X, cmap=cm, edgecolors=edge_color,linewidth=0.5)
-            coll.set_clim(vmin=vmin, vmax=vmax)
-            ax.add_collection(coll)#blit polygons to axis
+                cm = plt.get_cmap(color_map)
+            if reuse: # only the colours change
+                coll = artists['coll']
+                artists['blit'] = (coll.get_cmap().name == cm.name and coll.get_cmap().N == cm.N
+                                   and coll.get_clim() == (vmin, vmax) and np.all(np.isfinite(X)))
+                coll.set_cmap(cm)
+                coll.set_array(X)
+                coll.set_clim(vmin=vmin, vmax=vmax)
+            elif raster:
+                coll = meshRaster.CellRaster(ax, finder, cmap=cm)
+                coll.set_array(X)
+                coll.set_clim(vmin=vmin, vmax=vmax)
+                ax.add_image(coll)
+                artists.update({'key': key, 'coll': coll, 'ikeep': ikeep,
+                                'finder': finder, 'blit': False})
+            else:
+                #compile mesh coordinates into polygon coordinates  
+                nodes = np.array([self.node[:,0],self.node[:,2]]).T
+                connection = self.connection if ikeep is None else self.connection[ikeep,:]
+                #compile polygons patches into a "patch collection"
+                coordinates = nodes[connection]
+                coll = PolyCollection(coordinates, array=X, cmap=cm, edgecolors=edge_color,linewidth=0.5)
+                coll.set_clim(vmin=vmin, vmax=vmax)
+                ax.add_collection(coll)#blit polygons to axis
+                artists.update({'key': key, 'coll': coll, 'ikeep': ikeep,
+                                'coordinates': coordinates, 'blit': False})
 #            triang = tri.Triangulation(nodes[:,0], nodes[:,1], connection)
 #            coll = ax.tripcolor(triang, X, cmap=color_map, edgecolors=edge_color, linewidth=0.5)
             self.cax = coll
 
+        elif raster: # filled contours on the image: colours binned in the levels
+            zc = np.array(X, dtype=float)
+            if attr == 'Sigma_imag(log10)':
+                zc[zc == 0] = np.nan
+            if vmax > vmin:
+                levels = np.linspace(vmin, vmax, 13) # same levels as tricontourf below
+            else:
+                levels = None
+            cm = plt.get_cmap(color_map)
+            norm = None if levels is None else BoundaryNorm(levels, cm.N, extend='both')
+            self.cax = meshRaster.CellRaster(ax, finder, cmap=cm, norm=norm)
+            self.cax.set_array(zc)
+            if norm is None:
+                self.cax.set_clim(vmin=vmin, vmax=vmax)
+            ax.add_image(self.cax)
+            artists['finder'] = finder
+
         else:#use contour algorithm (only for 2D and y is considered depth here)
             if maxDepth is not None:
                 xc = self.elmCentre[ikeep,0]
@@ -1672,18 +1775,32 @@ class Mesh:
                 self.cax = ax.tricontourf(triang, zc, levels=levels, extend='both', cmap=color_map)
                 self._clipContour(ax, self.cax, maxDepth=maxDepth)
             
-        ax.autoscale()
+        if reuse is False:
+            ax.autoscale()
         #were dealing with patches and matplotlib isnt smart enough to know what the right limits are, hence set axis limits 
+        if reuse and (tuple(ax.get_xlim()) != tuple(xlim) or tuple(ax.get_ylim()) != tuple(zlim)):
+            artists['blit'] = False
         ax.set_ylim(zlim)
         ax.set_xlim(xlim)
         ax.set_xlabel('Distance [m]')
         ax.set_ylabel('Elevation [m]')
 
+        cbar = artists.get('cbar') if reuse else None
+        if cbar is not None and (color_bar is False or cbar.ax not in self.fig.axes):
+            artists['blit'] = False
+            cbar = None
         if color_bar:#add the color bar 
-            cbar_horizontal = 'vertical'
-            if hor_cbar: # change orientation if true 
-                cbar_horizontal = 'horizontal'
-            self.cbar = plt.colorbar(self.cax, ax=ax, format='%.1f',orientation=cbar_horizontal, fraction=0.046, pad=0.04)
+            if cbar is not None: # update the colorbar of the previous call
+                self.cbar = cbar
+                if self.cbar.mappable is not self.cax or artists['blit'] is False:
+                    self.cbar.update_normal(self.cax)
+            else:
+                cbar_horizontal = 'vertical'
+                if hor_cbar: # change orientation if true 
+                    cbar_horizontal = 'horizontal'
+                self.cbar = plt.colorbar(self.cax, ax=ax, format='%.1f',orientation=cbar_horizontal, fraction=0.046, pad=0.04)
+            if contour is False:
+                artists['cbar'] = self.cbar
             if attr == 'region': # default to material
                 val = np.sort(np.unique(X)).astype(int)
                 if len(val) > 1:
@@ -1692,18 +1809,23 @@ class Mesh:
                 else:
                     self.cbar.set_ticks([1])
                 self.cbar.set_ticklabels(val)
+            if self.cbar.ax.get_ylabel() != color_bar_title and self.cbar.ax.get_xlabel() != color_bar_title:
+                artists['blit'] = False
             self.cbar.set_label(color_bar_title) #set colorbar title
 
         ax.set_aspect(aspect)#set aspect ratio equal (stops a funny looking mesh)
 
         #biuld alpha channel if we have sensitivities 
+        alpha_coll = artists.get('sens') if reuse else None
+        if alpha_coll is not None:
+            alpha_coll.set_visible(False) # shown again below if needed
         if sens:
             if 'Sensitivity(log10)' not in self.df.keys():
                 print('ERROR: No sensitivity attribute found')
             else:
                 try:
                     weights = np.array(self.df['Sensitivity(log10)']) #values assigned to alpha channels 
-                    if maxDepth is not None:
+                    if ikeep is not None:
                         weights = weights[ikeep]
                     if sensPrc is None:
                         thresh = np.log10(0.001*(10**np.nanmax(weights)))
@@ -1713,14 +1835,6 @@ class Mesh:
                         x = np.argsort(weights)
                         alphas = np.zeros(self.numel)
                         alphas[:i] = np.linspace(1, 0, len(alphas[:i]))
-                        raw_alpha = np.ones((self.numel,4),dtype=float) #raw alpha values 
-                        raw_alpha[:, -1] = alphas
-                        alpha_map = ListedColormap(raw_alpha) # make a alpha color map which can be called by matplotlib
-                        #make alpha collection
-                        alpha_coll = PolyCollection(coordinates, array=weights, cmap=alpha_map, edgecolors='none', linewidths=0)#'face')
-                        #*** the above line can cuase issues "attribute error" no np.array has not attribute get_transform, 
-                        #*** i still cant figure out why this is because its the same code used to plot the resistivities 
-                        ax.add_collection(alpha_coll)
                     else:
                         #values assigned to alpha channels 
                         a = np.log10(0.000001*(10**np.nanmax(weights)))
@@ -1732,28 +1846,59 @@ class Mesh:
                         x = np.argsort(weights)
                         alphas = np.zeros(self.numel)
                         alphas[:i] = np.linspace(1, 0.2, len(alphas[:i]))
-                        raw_alpha = np.ones((self.numel,4),dtype=float) #raw alpha values 
-                        raw_alpha[:, -1] = alphas
-                        alpha_map = ListedColormap(raw_alpha) # make a alpha color map which can be called by matplotlib
+                    raw_alpha = np.ones((self.numel,4),dtype=float) #raw alpha values 
+                    raw_alpha[:, -1] = alphas
+                    alpha_map = ListedColormap(raw_alpha) # make a alpha color map which can be called by matplotlib
+                    if raster: # shade as an image of RGBA colours
+                        if alpha_coll is None:
+                            alpha_coll = meshRaster.CellRaster(ax, finder)
+                            ax.add_image(alpha_coll)
+                            if contour is False:
+                                artists['sens'] = alpha_coll
+                        alpha_coll.setCellColors(alpha_map(Normalize(np.nanmin(weights), np.nanmax(weights))(weights)))
+                        alpha_coll.set_visible(True)
+                    elif alpha_coll is not None: # update the shade of the previous call
+                        alpha_coll.set_cmap(alpha_map)
+                        alpha_coll.set_array(weights)
+                        alpha_coll.autoscale()
+                        alpha_coll.set_visible(True)
+                    else:
                         #make alpha collection
+                        coordinates = artists['coordinates'] if contour is False else \
+                            np.array([self.node[:,0],self.node[:,2]]).T[self.connection if ikeep is None
+                                                                       else self.connection[ikeep,:]]
                         alpha_coll = PolyCollection(coordinates, array=weights, cmap=alpha_map, edgecolors='none', linewidths=0)#'face')
                         #*** the above line can cuase issues "attribute error" no np.array has not attribute get_transform, 
                         #*** i still cant figure out why this is because its the same code used to plot the resistivities 
                         ax.add_collection(alpha_coll)
+                        if contour is False:
+                            artists['sens'] = alpha_coll
                     
                 except Exception as e:
                     print('Error in the sensitivity overlay:', e)
         
+        elecLine = artists.get('elec') if reuse else None
+        if elecLine is not None:
+            elecLine.set_visible(False)
         if electrodes: #try add electrodes to figure if we have them 
             try: 
                 x = self.elec.copy()
                 if self.iremote is not None: # it's None for quad mesh
                     x = x[~self.iremote, :]
                 elecColor = 'ko' if darkMode is False else 'wo'
-                ax.plot(x[:,0], x[:,2], elecColor, markersize=4)
+                if elecLine is not None:
+                    elecLine.set_data(x[:,0], x[:,2])
+                    elecLine.set_visible(True)
+                else:
+                    elecLine, = ax.plot(x[:,0], x[:,2], elecColor, markersize=4)
+                    if contour is False:
+                        artists['elec'] = elecLine
             except AttributeError:
                 # print("no electrodes in mesh object to plot")
                 pass
+        if reuse and shown != [artists.get(name) is not None and artists[name].get_visible()
+                               for name in ['sens', 'elec']]:
+            artists['blit'] = False
 
         # adding interactive display when mouse-over
         centroids = np.array([self.elmCentre[:,0], self.elmCentre[:,2]]).T
@@ -1839,14 +1984,25 @@ class Mesh:
             self.cbar.set_ticklabels(val) 
         else:
             cm = color_map
+        artists = axisArtists(self.ax)
+        artists['blit'] = (self.cax.get_clim() == (vmin, vmax) and np.all(np.isfinite(X))
+                           and self.cbar.ax.get_ylabel() == color_bar_title)
+        cm = plt.get_cmap(cm)
+        artists['blit'] = artists['blit'] and self.cax.get_cmap().name == cm.name \
+            and self.cax.get_cmap().N == cm.N
         self.cax.set_cmap(cm) # change the color map if the user wants to 
         
         #following block of code redraws figure 
+        if artists.get('ikeep') is not None: # cells cropped by show(maxDepth=...)
+            X = X[artists['ikeep']]
         self.cax.set_array(X) # set the array of the polygon collection to the new attribute 
         self.cax.set_clim(vmin=vmin, vmax=vmax) # reset the maximum limits of the color map 
-        self.ax.add_collection(self.cax)#blit polygons to axis
+        if self.cax not in self.ax.collections:
+            self.ax.add_collection(self.cax)#blit polygons to axis
         self.cbar.set_label(color_bar_title) # change the color bar title 
-        self.fig.canvas.draw() # redraw figure canvas (does not make a new figure it is faster fig.show())
+        if artists['blit'] is False:
+            self.cbar.update_normal(self.cax)
+        redrawArtists(self.ax) # only the cells are redrawn if the colour scale didn't change
 
         if color_bar:#add the color bar 
            print("you should have decided you wanted a color bar when using the mesh.show function")
@@ -2198,6 +2354,7 @@ class Mesh:
         
         #make 3D figure 
         if ax is None:
+            import mpl_toolkits.mplot3d # registers the '3d' projection
             fig = plt.figure()
             ax = fig.add_subplot(111, projection='3d')
         else:
@@ -2398,6 +2555,7 @@ class Mesh:
         
         #make 3D figure 
         if ax is None:
+            import mpl_toolkits.mplot3d # registers the '3d' projection
             fig = plt.figure()
             ax = fig.add_subplot(111, projection='3d')
         else:
@@ -2938,6 +3096,7 @@ class Mesh:
         warnings.warn('write_dat is depreciated, use dat instead')
         self.dat(file_path)
         
+    @traced
     def dat(self, file_path='mesh.dat'):
         """Write a mesh.dat kind of file for mesh input for R2/R3t. 
         
@@ -2946,6 +3105,7 @@ class Mesh:
         file_path : str, optional
             Path to the file. By default 'mesh.dat' is saved in the working directory.
         """
+        annotate(cells=self.numel)
         if not isinstance(file_path,str):
             raise TypeError("expected string argument for file_path")
         ### write data to mesh.dat kind of file ###
@@ -2987,6 +3147,7 @@ class Mesh:
                 [fid.write('{:<16.8f} '.format(self.node[i,k])) for k in nidx] # node coordinates 
                 fid.write('\n')#drop down a line 
                     
+    @traced
     def datAdv(self, file_path='mesh.dat', iadvanced=True):
         """Write a mesh.dat kind of file for mesh input for R2/R3t. Advanced format
         which includes the neighbourhood and conductance matrix. 
@@ -3067,6 +3228,7 @@ class Mesh:
         warnings.warn('write_vtk is depreciated, use vtk instead')
         self.vtk(file_path, title, replace_nan)
         
+    @traced
     def vtk(self, file_path="mesh.vtk", title=None, replace_nan=-9999):
         """Writes a vtk file for the mesh object, everything in the df
         will be written to file as attributes. We suggest using Paraview 
@@ -3080,6 +3242,7 @@ class Mesh:
         title : str, optional
             Header string written at the top of the vtk file .
         """
+        annotate(cells=self.numel)
         #formalities 
         if title == None:
             try:
@@ -3570,6 +3733,7 @@ def moveMesh2D(meshObject, elecLocal, elecGrid):
     return mesh   
 
 #%% import a vtk file 
+@traced
 def vtk_import(file_path='mesh.vtk', order_nodes=True):
     """
     Imports a mesh file into the python workspace, can have triangular, quad or tetraheral shaped elements.
@@ -3748,8 +3912,46 @@ def vtk_import(file_path='mesh.vtk', order_nodes=True):
             mesh.addSensitivity(np.array(attr_dict[key]))
     
     mesh.mesh_title = title
+    annotate(cells=mesh.numel)
     return mesh
 
+def vtk_import_cell_data(file_path):
+    """Read only the cell attributes (CELL_DATA section) of a legacy ASCII
+    vtk file. Much faster than `vtk_import()` when the mesh topology is
+    already known (e.g. for the results of a time-lapse inversion).
+    
+    Parameters
+    ----------
+    file_path : str
+        Path of the vtk file.
+    
+    Returns
+    -------
+    attrs : dict
+        Dictionary with attribute names as keys and arrays (one value per
+        cell) as values.
+    """
+    if os.path.getsize(file_path)==0:
+        raise ImportError("Provided mesh file is empty! Check that (c)R2/3t code has run correctly!")
+    with open(file_path, 'r') as f:
+        text = f.read()
+    i = text.find('\nCELL_DATA')
+    if i == -1:
+        raise ImportError('No CELL_DATA section in ' + file_path)
+    header, text = text[i+1:].split('\n', 1)
+    numel = int(header.split()[1])
+    j = text.find('\nPOINT_DATA') # point data after the cell data
+    if j > -1:
+        text = text[:j]
+    attrs = {}
+    for block in text.split('SCALARS ')[1:]:
+        name, _, values = block.split('\n', 2) # skip LOOKUP_TABLE line
+        values = np.fromstring(values, sep=' ')
+        if len(values) != numel:
+            raise ImportError('Unexpected number of values for ' + name.split()[0])
+        attrs[name.split()[0]] = values
+    return attrs
+
 def vtk_import_fmt4(file_path,order_nodes=True):
     """Vtk importer for newer format (not fully validated)
     """
@@ -3854,6 +4056,7 @@ def vtk_import_fmt4(file_path,order_nodes=True):
     return mesh
 
 #%% import mesh from native .dat format
+@traced
 def dat_import(file_path='mesh.dat', order_nodes=True):
     """ Import R2/cR2/R3t/cR3t .dat kind of mesh. 
     
@@ -4041,6 +4244,7 @@ def tetgen_import(file_path, order_nodes=True):
         
         
 #%% build a quad mesh        
+@traced
 def quadMesh(elec_x, elec_z, elec_type = None, elemx=4, xgf=1.5, zf=1.1, zgf=1.25, fmd=None, pad=2, 
               surface_x=None,surface_z=None,refine_x = None, refine_z=None):
     """Creates a quaderlateral mesh given the electrode x and y positions.
@@ -4301,6 +4505,7 @@ def quad_mesh(*args):
 
 
 #%% handling gmsh
+@traced
 def runGmsh(ewd, file_name, show_output=True, dump=print, threed=False, handle=None):
     """
 
@@ -4327,34 +4532,12 @@ def runGmsh(ewd, file_name, show_output=True, dump=print, threed=False, handle=N
     if threed: # if 3d use 3d option 
         opt = '-3'
 
+    gmshPath = os.path.join(ewd, 'gmsh.exe')
     if platform.system() == "Windows":#command line input will vary slighty by system 
-        cmd_line = [os.path.join(ewd,'gmsh.exe'), file_name+'.geo', opt, 'nt %i'%ncores]
-        
-    elif platform.system() == 'Darwin': # its a macOS 
-        winetxt = 'wine'
-        if getMacOSVersion():
-            winetxt = 'wine64'
-        winePath = []
-        wine_path = Popen(['which', winetxt], stdout=PIPE, shell=False, universal_newlines=True)#.communicate()[0]
-        for stdout_line in iter(wine_path.stdout.readline, ''):
-            winePath.append(stdout_line)
-        if winePath != []:
-            cmd_line = ['%s' % (winePath[0].strip('\n')), ewd+'/gmsh.exe', file_name+'.geo', opt,'-nt','%i'%ncores]
-        else:
-            try:
-                is_wine = Popen(['/usr/local/bin/%s' % winetxt,'--version'], stdout=PIPE, shell = False, universal_newlines=True)
-                wPath = '/usr/local/bin/'
-            except:
-                is_wine = Popen(['/opt/homebrew/bin/%s' % winetxt,'--version'], stdout=PIPE, shell = False, universal_newlines=True) # quick fix for M1 Macs
-                wPath = '/opt/homebrew/bin/'
-            cmd_line = [wPath + winetxt, ewd+'/gmsh.exe', file_name+'.geo', opt,'-nt','%i'%ncores]
-    
-    elif platform.system() == 'Linux':
-        if os.path.isfile(os.path.join(ewd,'gmsh_linux')):
-            cmd_line = [ewd + '/gmsh_linux', file_name + '.geo', opt,'-nt','%i'%ncores] # using linux version if avialable (can be more performant)
-        else: # fall back to wine
-            cmd_line = ['wine',ewd+'/gmsh.exe', file_name+'.geo', opt,'-nt','%i'%ncores]
-    
+        cmd_line = [gmshPath, file_name+'.geo', opt, 'nt %i'%ncores]
+    elif platform.system() in ['Darwin', 'Linux']:
+        # using linux version if avialable (can be more performant), else wine
+        cmd_line = exeCommand(gmshPath) + [file_name+'.geo', opt,'-nt','%i'%ncores]
     else:
         raise Exception('Unsupported operating system') # if this even possible? BSD maybe. 
 
@@ -4443,6 +4626,7 @@ def check4repeatNodes(X,Y,Z,flag=None):
 
 
 #%% build a triangle mesh - using the gmsh wrapper
+@traced
 def triMesh(elec_x, elec_z, elec_type=None, geom_input=None, keep_files=True, 
              show_output=True, path='exe', dump=print, whole_space=False, 
              handle=None, **kwargs):
@@ -4579,6 +4763,7 @@ def tri_mesh(*args):
 
 
 #%% 3D tetrahedral mesh 
+@traced
 def tetraMesh(elec_x,elec_y,elec_z=None, elec_type = None, keep_files=True, interp_method = 'triangulate',
                surface_refinement=None, mesh_refinement=None, show_output=True, 
                path='exe', dump=print, whole_space=False, padding=20,
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Prediction of the runtime and peak memory of an inversion from the size of
+the problem (see `Project.predictPerformance()` and
+`Project.recommendSettings()`).
+
+The runtime of one inversion is modelled as
+
+    t = c0 + c1*forward + c2*jacobian
+
+where `forward` is the cost of the forward solutions (number of electrodes x
+non-zeros of the system matrix x log2(numnp)) and `jacobian` the cost of the
+products with the Jacobian (number of measurements x number of parameters).
+Both are converted to seconds on this machine by a quick micro-benchmark
+(`calibrate()`) and multiplied by 4 for complex inversions (cR2, cR3t). The
+coefficients c are fitted (non-negative least squares) on the previous runs of
+the executable on this machine, recorded by `Project.runR2()` when
+`Project.recordRuns` is True (off by default), separately for 2D and 3D. Until enough runs are recorded, rough default coefficients are used.
+The peak memory is the static estimate of `staticMemory()` scaled by the ratio
+measured on the previous runs.
+
+The calibration and the history of runs are stored in
+`~/.resipy/performance.json` (set `historyFile` to None to disable it). The
+file is shared by all the processes of the machine: it is updated under a
+lock file and replaced atomically so that concurrent runs do not lose or
+corrupt the history.
+"""
+import os, time, json, platform
+from contextlib import contextmanager
+import numpy as np
+
+historyFile = os.path.join(os.path.expanduser('~'), '.resipy', 'performance.json')
+maxRuns = 500 # number of runs kept in the history
+lockTimeout = 30 # s, a lock file older than this was left by a killed process
+
+# default coefficients [c0, c1, c2] (no run recorded yet)
+DEFAULT_COEFS = {2: [1.0, 20., 40.], 3: [2.0, 20., 40.]}
+
+_machine = {} # calibration of this session
+
+
+def _load():
+    if historyFile is None or os.path.exists(historyFile) is False:
+        return {'machines': {}, 'runs': []}
+    try:
+        with open(historyFile, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError): # unreadable, start again
+        return {'machines': {}, 'runs': []}
+    data.setdefault('machines', {})
+    data.setdefault('runs', [])
+    return data
+
+
+def _save(data):
+    if historyFile is None:
+        return
+    tmp = '{:s}.{:d}.tmp'.format(historyFile, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(historyFile), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, historyFile) # readers never see a partial file
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+@contextmanager
+def _lock():
+    """Hold `historyFile`.lock (created exclusively) during an update."""
+    lockFile = historyFile + '.lock'
+    fd = None
+    try:
+        os.makedirs(os.path.dirname(historyFile), exist_ok=True)
+        while fd is None:
+            try:
+                fd = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lockFile) > lockTimeout:
+                        os.remove(lockFile)
+                except OSError: # released in the meantime
+                    pass
+                time.sleep(0.05)
+    except OSError: # directory not writable, _save() will fail silently too
+        pass
+    try:
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+            os.remove(lockFile)
+
+
+def _update(func):
+    """Read the history, modify it in place with `func(data)` and write it
+    back, under the lock so that concurrent updates are not lost."""
+    if historyFile is None:
+        return
+    with _lock():
+        data = _load()
+        func(data)
+        _save(data)
+
+
+def calibrate(force=False):
+    """Time a sparse factorization and a dense matrix-vector product on this
+    machine (about a second). The result is stored in `historyFile` and only
+    measured again if `force` is True.
+
+    Returns
+    -------
+    machine : dict
+        'sparse': seconds per non-zero x log2(n) of a sparse solve,
+        'dense': seconds per element of a dense matrix-vector product,
+        'node', 'ncores' and 'date'.
+    """
+    node = platform.node()
+    if force is False:
+        if _machine.get('node') == node:
+            return _machine
+        stored = _load()['machines'].get(node)
+        if stored is not None:
+            _machine.update(stored)
+            return _machine
+    from scipy import sparse
+    from scipy.sparse.linalg import splu
+
+    # 2D 5-point Laplacian with several right-hand sides (one per electrode)
+    n = 120
+    d = sparse.diags([-1., -1., 4., -1., -1.], [-n, -1, 0, 1, n], shape=(n*n, n*n), format='csc')
+    b = np.ones((n*n, 8))
+    tsparse = []
+    for i in range(3):
+        t0 = time.perf_counter()
+        splu(d).solve(b)
+        tsparse.append(time.perf_counter() - t0)
+    sparseRate = min(tsparse)/(b.shape[1]*d.nnz*np.log2(n*n))
+
+    # dense matrix-vector products (Jacobian)
+    a = np.random.rand(1500, 1500)
+    v = np.random.rand(1500)
+    tdense = []
+    for i in range(3):
+        t0 = time.perf_counter()
+        for j in range(10):
+            a.dot(v)
+        tdense.append(time.perf_counter() - t0)
+    denseRate = min(tdense)/(10*a.size)
+
+    _machine.clear()
+    _machine.update({'node': node, 'ncores': os.cpu_count(),
+                     'sparse': sparseRate, 'dense': denseRate,
+                     'date': time.strftime('%Y-%m-%d %H:%M:%S')})
+    _update(lambda data: data['machines'].update({node: dict(_machine)}))
+    return _machine
+
+
+def ndims(typ):
+    return 3 if typ in ['R3t', 'cR3t'] else 2
+
+
+def staticMemory(size, inverse=True):
+    """Static estimate of the memory (Gb) needed by the executable from the
+    size of the problem (arrays allocated by R2/R3t).
+
+    Parameters
+    ----------
+    size : dict
+        Size of the problem as returned by `Project._problemSize()`.
+    inverse : bool, optional
+        If False, memory of a forward model only.
+
+    Returns
+    -------
+    Gb : float
+        Memory in gigabytes.
+    mem : dict
+        Number of double (memDP), real (memR), integer (memI) and logical
+        (memL) values.
+    """
+    numnp = size['numnp']
+    numel = size['numel']
+    nsizeA = size['nsizeA']
+    npere = size['npere']
+    nfaces = size['nfaces']
+    num_param = size['num_param']
+    num_electrodes = size['num_electrodes']
+    num_ind_meas = size['num_meas']
+    mnum_ind_meas = num_ind_meas # maximum number of measurements
+    numRterm = size.get('numRterm', 5) # roughness terms in 2D
+    if ndims(size['typ']) == 3:
+        memDP = numnp*(8+num_electrodes)+nsizeA+numel+num_ind_meas * 2
+        memR = 0
+        memI = numnp*2+(npere+2)*numel+numnp+1+nsizeA+num_electrodes*3+num_ind_meas*12
+        memL = numel*2
+        if inverse:
+            memDP = memDP+num_param*9+num_ind_meas*(num_param+6)
+            memR = memR+(num_param*nfaces)
+            memI = memI+num_param*nfaces
+    else:
+        memDP = (numnp)*(5+num_electrodes)+nsizeA+numel+mnum_ind_meas*3+num_ind_meas
+        memR = 0
+        memI = nsizeA+numel*6+numnp*4+mnum_ind_meas*8
+        memL = numel+numnp
+        if inverse:
+            memDP = memDP+numel+num_param*10+num_ind_meas*(num_param+7)
+            memR = memR+num_param*numRterm
+            memI = memI+num_param*numRterm
+            memL = memL+num_ind_meas
+    Gb = (memL + memI*4 + memR*4 + memDP*8)/1.0e9
+    return Gb, {'memDP': memDP, 'memR': memR, 'memI': memI, 'memL': memL}
+
+
+def features(size, machine=None):
+    """Regressors [1, forward, jacobian] (seconds on this machine)."""
+    if machine is None:
+        machine = calibrate()
+    cfac = 4 if size['typ'] in ['cR2', 'cR3t'] else 1
+    forward = size['num_electrodes']*size['nsizeA']*np.log2(max(size['numnp'], 2))
+    jacobian = size['num_meas']*size['num_param']
+    return np.array([1., forward*machine['sparse']*cfac, jacobian*machine['dense']*cfac])
+
+
+def protocolSize(fname):
+    """Return the number of measurements of the first dataset of a
+    protocol.dat and the number of datasets it contains.
+    """
+    nsurveys = 0
+    nmeas = 0
+    with open(fname, 'r') as f:
+        for line in f:
+            if len(line.split()) == 1: # header of a dataset
+                if nsurveys == 0:
+                    nmeas = int(line.split()[0])
+                nsurveys += 1
+    return nmeas, max(nsurveys, 1)
+
+
+def runSize(dirname, typ):
+    """Size of the problem of a run directory, read from its mesh.dat (or
+    mesh3d.dat), .in and protocol.dat files (same keys as
+    `Project._problemSize()`).
+
+    Returns
+    -------
+    size : dict
+        Size of the problem.
+    inverse : bool
+        False for a forward model.
+    nsurveys : int
+        Number of datasets in protocol.dat.
+    """
+    with open(os.path.join(dirname, typ + '.in'), 'r') as f:
+        lines = [l for l in f.read().split('\n')[1:] if l.strip() != '']
+    inverse = lines[0].split()[0] == '1' # job_type
+    numRterm = 5
+    num_electrodes = 0
+    for line in lines:
+        if '<< inverse_type' in line and line.split()[0] == '2':
+            numRterm = 13 # roughness terms in 2D
+        if '<< num_electrodes' in line:
+            num_electrodes = int(line.split()[0])
+    meshFile = os.path.join(dirname, 'mesh3d.dat' if ndims(typ) == 3 else 'mesh.dat')
+    with open(meshFile, 'r') as f:
+        numel, numnp = [int(a) for a in f.readline().split()[:2]]
+        elm = np.loadtxt(f, max_rows=numel, ndmin=2) # number, nodes, param, zone
+    npere = elm.shape[1] - 3
+    nfaces = {4: 4, 6: 5, 8: 8}.get(npere, 0) if ndims(typ) == 3 else 1
+    num_meas, nsurveys = protocolSize(os.path.join(dirname, 'protocol.dat'))
+    size = {'typ': typ,
+            'numnp': numnp,
+            'numel': numel,
+            'nsizeA': numel*npere - numel, # same estimate as Project._problemSize()
+            'npere': npere,
+            'nfaces': nfaces,
+            'num_param': int(len(np.unique(elm[:,-2]))),
+            'num_electrodes': num_electrodes,
+            'num_meas': float(num_meas),
+            'numRterm': numRterm}
+    return size, inverse, nsurveys
+
+
+def record(size, runtime, memory, inverse=True):
+    """Add a run of the executable to the history.
+
+    Parameters
+    ----------
+    size : dict
+        Size of the problem (see `Project._problemSize()`).
+    runtime : float
+        Wall time of one inversion in seconds.
+    memory : float
+        Peak resident memory of the executable in Gb (0 if unknown).
+    inverse : bool, optional
+        False for a forward model.
+    """
+    if historyFile is None:
+        return
+    keys = ['typ', 'numnp', 'numel', 'nsizeA', 'npere', 'nfaces', 'num_param',
+            'num_electrodes', 'num_meas', 'numRterm']
+    run = dict([(k, size[k]) for k in keys if k in size])
+    run.update({'node': platform.node(), 'runtime': float(runtime),
+                'memory': float(memory), 'inverse': bool(inverse),
+                'date': time.strftime('%Y-%m-%d %H:%M:%S')})
+    def append(data):
+        data['runs'] = (data['runs'] + [run])[-maxRuns:]
+    _update(append)
+
+
+def history(dim=None, inverse=True):
+    """Runs recorded on this machine.
+
+    Parameters
+    ----------
+    dim : int, optional
+        Only keep the 2D or 3D runs.
+    inverse : bool, optional
+        Keep inversions (True) or forward models (False).
+
+    Returns
+    -------
+    runs : list of dict
+    """
+    node = platform.node()
+    runs = [r for r in _load()['runs'] if r.get('node') == node
+            and r.get('inverse', True) == inverse]
+    if dim is not None:
+        runs = [r for r in runs if ndims(r['typ']) == dim]
+    return runs
+
+
+def fitModel(dim, runs=None):
+    """Fit the runtime coefficients and the memory ratio on the recorded runs.
+
+    Parameters
+    ----------
+    dim : int
+        2 or 3.
+    runs : list of dict, optional
+        Runs to fit, by default the inversions recorded on this machine.
+
+    Returns
+    -------
+    coefs : numpy.array
+        [c0, c1, c2] of the runtime model.
+    memRatio : float
+        Measured / static memory.
+    nruns : int
+        Number of runs used.
+    """
+    if runs is None:
+        runs = history(dim)
+    coefs = np.array(DEFAULT_COEFS[dim])
+    if len(runs) == 0:
+        return coefs, 1., 0
+    machine = calibrate()
+    X = np.array([features(r, machine) for r in runs])
+    y = np.array([r['runtime'] for r in runs])
+    if len(runs) > X.shape[1]:
+        from scipy.optimize import nnls
+        fitted = nnls(X, y)[0]
+        if np.any(fitted > 0):
+            coefs = fitted
+    else: # too few runs, just scale the default model
+        coefs = coefs*np.median(y/X.dot(coefs))
+    ratios = [r['memory']/staticMemory(r)[0] for r in runs
+              if r['memory'] > 0 and staticMemory(r)[0] > 0]
+    memRatio = float(np.clip(np.median(ratios), 0.5, 10)) if len(ratios) > 0 else 1.
+    return coefs, memRatio, len(runs)
+
+
+def predict(size, runs=None):
+    """Predict the runtime and peak memory of one inversion.
+
+    Parameters
+    ----------
+    size : dict
+        Size of the problem (see `Project._problemSize()`).
+    runs : list of dict, optional
+        Runs used to calibrate the model (see `fitModel()`).
+
+    Returns
+    -------
+    prediction : dict
+        'runtime' (s), 'memory' (Gb) and 'nruns' (number of runs used to
+        calibrate the model).
+    """
+    coefs, memRatio, nruns = fitModel(ndims(size['typ']), runs=runs)
+    return {'runtime': float(features(size).dot(coefs)),
+            'memory': staticMemory(size)[0]*memRatio,
+            'nruns': nruns}
+
+
+def coarsen(size, factor=1, group=1):
+    """Size of the problem for a characteristic length multiplied by `factor`
+    and `group` elements per parameter.
+    """
+    d = ndims(size['typ'])
+    out = dict(size)
+    for k in ['numnp', 'numel', 'nsizeA']:
+        out[k] = size[k]/factor**d
+    out['num_param'] = size['num_param']/factor**d/group
+    return out
+
+
+def recommend(size, ncores, availMemory, timeBudget=None, memBudget=None,
+              nsurveys=1, groupable=True, runs=None):
+    """Recommend the number of cores, the characteristic length and the
+    grouping of the parameters so that the inversions fit in a time and
+    memory budget.
+
+    Parameters
+    ----------
+    size : dict
+        Size of the problem (see `Project._problemSize()`).
+    ncores : int
+        Number of cores available.
+    availMemory : float
+        Memory available in Gb.
+    timeBudget : float, optional
+        Maximum wall time in seconds for all the inversions.
+    memBudget : float, optional
+        Maximum memory in Gb. Default is the available memory.
+    nsurveys : int, optional
+        Number of inversions to run.
+    groupable : bool, optional
+        If False (e.g. quadrilateral mesh), the parameters cannot be grouped
+        by refinement.
+    runs : list of dict, optional
+        Runs used to calibrate the model (see `fitModel()`).
+
+    Returns
+    -------
+    rec : dict
+        'runtime' and 'memory' of one inversion, 'ncores', 'totalTime' and
+        'fits' for the current mesh; 'clFactor', 'clRuntime', 'clMemory',
+        'clNcores' for a coarser mesh; 'refine', 'groupRuntime', 'groupMemory'
+        and 'groupNcores' for a mesh with the same elements and grouped parameters (None when no
+        change is needed or possible).
+    """
+    if memBudget is None:
+        memBudget = availMemory
+    memBudget = min(memBudget, availMemory)
+    d = ndims(size['typ'])
+
+    def plan(s):
+        p = predict(s, runs=runs)
+        nc = int(max(1, min(ncores, nsurveys, memBudget//p['memory'] if p['memory'] > 0 else ncores)))
+        total = np.ceil(nsurveys/nc)*p['runtime']
+        fits = p['memory'] <= memBudget and (timeBudget is None or total <= timeBudget)
+        return p, nc, total, fits
+
+    p, nc, total, fits = plan(size)
+    rec = {'runtime': p['runtime'], 'memory': p['memory'], 'nruns': p['nruns'],
+           'ncores': nc, 'totalTime': total, 'fits': fits,
+           'clFactor': None, 'clRuntime': None, 'clMemory': None, 'clNcores': None,
+           'refine': None, 'groupRuntime': None, 'groupMemory': None, 'groupNcores': None}
+    if fits:
+        return rec
+
+    # coarser mesh
+    for factor in np.arange(1.1, 5.01, 0.1):
+        p, nc, total, ok = plan(coarsen(size, factor=factor))
+        if ok:
+            rec.update({'clFactor': float(np.round(factor, 1)), 'clRuntime': total,
+                        'clMemory': p['memory'], 'clNcores': nc})
+            break
+
+    # same elements (cl*2**refine then refined) but 2**d elements per parameter per level
+    if groupable:
+        for refine in range(1, 4):
+            p, nc, total, ok = plan(coarsen(size, group=(2**d)**refine))
+            if ok:
+                rec.update({'refine': refine, 'groupRuntime': total,
+                            'groupMemory': p['memory'], 'groupNcores': nc})
+                break
+    return rec
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Declarative batch processing. A pipeline configuration (JSON, or YAML if
+PyYAML is installed) lists sites and the stages applied to each of them.
+A stage is a `Project` method with its keyword arguments:
+
+    typ: R2
+    workers: 2               # sites processed concurrently
+    outputDir: results       # one sub-directory per site
+    sites:
+      - name: line1
+        data: data/line1.csv
+      - name: line2
+        data: data/line2.csv
+        ftype: ProtocolDC    # site variables can be used in the stages
+    stages:
+      - createSurvey: {fname: '{data}', ftype: Syscal}
+      - filterUnpaired
+      - fitErrorPwl
+      - set: {err: true}     # attributes of the Project
+      - param: {reg_mode: 0} # inversion parameters (Project.param)
+      - createMesh: {typ: trian}
+      - invert
+      - saveVtks: {dirname: '{outdir}'}
+      - saveInvPlots: {outputdir: '{outdir}', movie: results.mp4}
+
+Strings of the stage arguments are formatted with the site variables (plus
+'name', 'outdir' and 'configDir'). Relative paths are relative to the
+configuration file. Each site runs in its own process with a non-interactive
+matplotlib backend, its output is written to '<outdir>/pipeline.log' and a
+JSON report with the time of each stage is written at the end.
+"""
+import os, sys, json, time, traceback, contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+
+def loadConfig(fname):
+    """Read a pipeline configuration file (.json, .yaml or .yml).
+
+    Returns
+    -------
+    config : dict
+        Configuration with the 'configDir' key added.
+    """
+    with open(fname, 'r') as f:
+        if fname.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('PyYAML is needed to read {:s}, '
+                                  'use a JSON configuration instead.'.format(fname))
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    config['configDir'] = os.path.dirname(os.path.abspath(fname))
+    return config
+
+
+def parseStage(stage):
+    """Return the (name, keyword arguments) of a stage given as a string or a
+    dictionary with a single key.
+    """
+    if isinstance(stage, str):
+        return stage, {}
+    if isinstance(stage, dict) and len(stage) == 1:
+        name = list(stage.keys())[0]
+        return name, stage[name] if stage[name] is not None else {}
+    raise ValueError('A stage must be a method name or a single key '
+                     'dictionary, got {:s}'.format(str(stage)))
+
+
+def formatArgs(value, variables):
+    """Format the strings of `value` (nested lists and dicts) with the site
+    variables. A string which is just '{var}' is replaced by the value of var
+    (whatever its type).
+    """
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}') and value[1:-1] in variables:
+            return variables[value[1:-1]]
+        return value.format(**variables)
+    if isinstance(value, list):
+        return [formatArgs(v, variables) for v in value]
+    if isinstance(value, dict):
+        return dict([(k, formatArgs(v, variables)) for k, v in value.items()])
+    return value
+
+
+def checkStage(name):
+    """Raise a ValueError if stage `name` is not a public, non-interactive
+    method of `Project` (or one of the 'set' and 'param' stages).
+    """
+    from resipy.Project import Project
+    if name in ['set', 'param']:
+        return
+    if name.startswith('_') or callable(getattr(Project, name, None)) is False:
+        raise ValueError('Unknown stage: {:s}'.format(name))
+    if name.startswith('show') or name in ['pseudo', 'pseudoIP']:
+        raise ValueError('Interactive stage not allowed in a pipeline: {:s}'.format(name))
+
+
+def runSite(site, stages, typ='R2', outputDir='.', configDir='.'):
+    """Run the stages of one site (called in a worker process).
+
+    Parameters
+    ----------
+    site : dict
+        Site variables, at least 'name'.
+    stages : list
+        Stages to apply (see `parseStage()`).
+    typ : str, optional
+        Type of Project (R2, cR2, R3t, cR3t).
+    outputDir : str, optional
+        The site is processed in '<outputDir>/<name>'.
+    configDir : str, optional
+        Directory to which relative paths are relative.
+
+    Returns
+    -------
+    report : dict
+        Status, time and time of each stage of the site.
+    """
+    os.environ['MPLBACKEND'] = 'Agg' # no GUI backend in the workers
+    os.chdir(configDir)
+    t0 = time.time()
+    name = str(site['name'])
+    outdir = os.path.abspath(os.path.join(outputDir, name))
+    if os.path.exists(outdir) is False:
+        os.makedirs(outdir)
+    variables = dict(site)
+    variables.update({'name': name, 'outdir': outdir, 'configDir': configDir})
+    report = {'name': name, 'outdir': outdir, 'status': 'ok', 'stages': [],
+              'error': None}
+    with open(os.path.join(outdir, 'pipeline.log'), 'w') as log, \
+            contextlib.redirect_stdout(log):
+        try:
+            if 'matplotlib' in sys.modules: # already imported by the parent process
+                sys.modules['matplotlib'].use('Agg')
+            from resipy.Project import Project
+            t1 = time.time()
+            k = Project(dirname=outdir, typ=site.get('typ', typ))
+            report['stages'].append({'name': 'Project', 'time': time.time() - t1})
+            for stage in stages:
+                sname, kwargs = parseStage(stage)
+                kwargs = formatArgs(kwargs, variables)
+                t1 = time.time()
+                print('---- stage {:s} ----'.format(sname), flush=True)
+                if sname == 'set':
+                    for key, value in kwargs.items():
+                        if hasattr(k, key) is False:
+                            raise AttributeError('Project has no attribute ' + key)
+                        setattr(k, key, value)
+                elif sname == 'param':
+                    k.param.update(kwargs)
+                else:
+                    checkStage(sname)
+                    getattr(k, sname)(**kwargs)
+                if 'matplotlib.pyplot' in sys.modules: # figures made by some stages (e.g. error fits)
+                    sys.modules['matplotlib.pyplot'].close('all')
+                report['stages'].append({'name': sname, 'time': time.time() - t1})
+        except Exception as e:
+            traceback.print_exc(file=log)
+            report['status'] = 'failed'
+            report['error'] = '{:s}: {:s}'.format(type(e).__name__, str(e))
+            if 'sname' in locals():
+                report['failedStage'] = sname
+    report['time'] = time.time() - t0
+    return report
+
+
+def runPipeline(config, workers=None, sites=None, reportFile=None, dump=print):
+    """Run a pipeline on all sites with a bounded pool of worker processes.
+
+    Parameters
+    ----------
+    config : dict or str
+        Configuration or path of the configuration file.
+    workers : int, optional
+        Number of sites processed concurrently. Default is the 'workers'
+        key of the configuration or 1.
+    sites : list of str, optional
+        Only process the sites with these names.
+    reportFile : str, optional
+        Path of the JSON report. Default is '<outputDir>/report.json'.
+    dump : function, optional
+        Function to print the progress.
+
+    Returns
+    -------
+    report : dict
+        Run report (also written to `reportFile`).
+    """
+    from resipy.Project import ResIPy_version
+    if isinstance(config, str):
+        config = loadConfig(config)
+    configDir = config.get('configDir', os.getcwd())
+    outputDir = os.path.abspath(os.path.join(configDir, config.get('outputDir', 'pipeline')))
+    if os.path.exists(outputDir) is False:
+        os.makedirs(outputDir)
+    allSites = config['sites']
+    if sites is not None:
+        allSites = [s for s in allSites if str(s['name']) in sites]
+    names = [str(s['name']) for s in allSites]
+    if len(set(names)) != len(names):
+        raise ValueError('Site names must be unique.')
+    for site in allSites: # fail early on unknown or interactive stages
+        for stage in site.get('stages', config.get('stages', [])):
+            name, _ = parseStage(stage)
+            checkStage(name)
+    if workers is None:
+        workers = config.get('workers', 1)
+    workers = max(1, min(int(workers), len(allSites)))
+
+    t0 = time.time()
+    dump('Processing {:d} sites with {:d} workers'.format(len(allSites), workers))
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runSite, site, site.get('stages', config.get('stages', [])),
+                                   config.get('typ', 'R2'), outputDir, configDir)
+                   for site in allSites]
+        for site, future in zip(allSites, futures):
+            try:
+                r = future.result()
+            except Exception as e: # worker process died
+                r = {'name': str(site['name']), 'status': 'failed', 'stages': [],
+                     'error': '{:s}: {:s}'.format(type(e).__name__, str(e))}
+            reports.append(r)
+            dump('{:s}: {:s}{:s}'.format(r['name'], r['status'],
+                 ' ({:s})'.format(r['error']) if r['error'] else ''))
+
+    report = {'resipyVersion': ResIPy_version,
+              'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t0)),
+              'time': time.time() - t0,
+              'workers': workers,
+              'outputDir': outputDir,
+              'nok': len([r for r in reports if r['status'] == 'ok']),
+              'nfailed': len([r for r in reports if r['status'] != 'ok']),
+              'sites': reports}
+    if reportFile is None:
+        reportFile = os.path.join(outputDir, 'report.json')
+    with open(reportFile, 'w') as f:
+        json.dump(report, f, indent=2)
+    dump('{:d}/{:d} sites processed in {:.1f}s, report in {:s}'.format(
+        report['nok'], len(reports), report['time'], reportFile))
+    return report
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Version 2 of the .resipy project file. The project is a zip archive without
+compression holding:
+    manifest.json : settings, parameters, names of the surveys and
+                    description of the arrays
+    *.npy         : typed arrays (columns of the survey dataframes, mesh
+                    topology, attributes of the result meshes)
+    updates/*.json: surveys and results appended after the project was
+                    saved (see `Project.appendProject()`), applied in order
+The columns of all survey dataframes are concatenated so that a project with
+many surveys only has a few members. As members are stored uncompressed, they
+are memory-mapped directly from the archive when opened (nothing is extracted
+to disk).
+"""
+import os, json, zipfile
+import numpy as np
+import pandas as pd
+import resipy.meshTools as mt
+from resipy.meshResults import MeshResults
+
+formatVersion = 2
+
+
+def framesToArrays(dfs):
+    """Concatenate the columns of several dataframes.
+
+    Parameters
+    ----------
+    dfs : list of pandas.DataFrame
+        Dataframes (they can have different columns).
+
+    Returns
+    -------
+    arrays : list of numpy.array
+        One array per column of the union of the columns.
+    meta : dict
+        Name of the columns ('columns'), number of rows of each dataframe
+        ('nrows'), columns of each dataframe ('frameColumns') and their
+        types ('frameDtypes').
+    """
+    columns = []
+    for df in dfs:
+        columns += [c for c in df.columns if c not in columns]
+    arrays = []
+    for c in columns:
+        parts = [df[c].values if c in df.columns else None for df in dfs]
+        if any([p.dtype == object or p.dtype.kind in 'US' for p in parts if p is not None]):
+            # labels or mixed values stored as text
+            parts = [np.full(df.shape[0], '') if p is None else p.astype(str)
+                     for p, df in zip(parts, dfs)]
+        elif any([p is None for p in parts]): # missing values as NaN
+            parts = [np.full(df.shape[0], np.nan) if p is None else p.astype(float)
+                     for p, df in zip(parts, dfs)]
+        arrays.append(np.concatenate(parts))
+    meta = {'columns': [str(c) for c in columns],
+            'nrows': [int(df.shape[0]) for df in dfs],
+            'frameColumns': [[columns.index(c) for c in df.columns] for df in dfs],
+            'frameDtypes': [[df[c].dtype.str for c in df.columns] for df in dfs]}
+    return arrays, meta
+
+
+class ProjectArchive(object):
+    """Write a version 2 project archive.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the .resipy file.
+    append : bool, optional
+        If True, members are added to an existing archive (the members
+        already written are not moved, so they can stay memory-mapped).
+    """
+    def __init__(self, fname, append=False):
+        self.zf = zipfile.ZipFile(fname, 'a' if append else 'w',
+                                  compression=zipfile.ZIP_STORED, allowZip64=True)
+        names = self.zf.namelist()
+        self.narrays = len([n for n in names if n.startswith('arrays/')])
+        self.nupdates = len([n for n in names if n.startswith('updates/')])
+
+
+    def addArray(self, array):
+        """Add an array and return the name of its member.
+        """
+        name = 'arrays/{:d}.npy'.format(self.narrays)
+        self.narrays += 1
+        array = np.ascontiguousarray(array)
+        with self.zf.open(name, 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, array, allow_pickle=False)
+        return name
+
+
+    def addFrames(self, dfs):
+        """Add the columns of several dataframes and return their description
+        (see `framesToArrays()`) with the names of the members.
+        """
+        arrays, meta = framesToArrays(dfs)
+        meta['members'] = [self.addArray(a) for a in arrays]
+        return meta
+
+
+    def addMesh(self, mesh, attributes=True):
+        """Add `mesh` and return its description. If `attributes` is False,
+        only its topology is stored (no cell attributes nor electrode nodes).
+        """
+        meta = {'node': self.addArray(mesh.node),
+                'connection': self.addArray(mesh.connection),
+                'cellType': [int(a) for a in np.atleast_1d(mesh.cell_type)],
+                'elmCentre': None, 'eNodes': None, 'df': None}
+        if mesh.elmCentre is not None:
+            meta['elmCentre'] = self.addArray(mesh.elmCentre)
+        if attributes and mesh.eNodes is not None:
+            meta['eNodes'] = self.addArray(np.asarray(mesh.eNodes, dtype=int))
+        if attributes:
+            meta['df'] = self.addFrames([mesh.df])
+        return meta
+
+
+    def addResults(self, meshes):
+        """Add a list of result meshes. The steps sharing the same topology
+        are grouped: their topology is stored once and each attribute is
+        stored as a (n_steps x n_cells) array.
+
+        Returns
+        -------
+        meta : dict
+            'groups': topology, columns and members of each group,
+            'steps': group, row and columns of each step, 'titles' and
+            'elec' (electrodes of all steps).
+        """
+        groups = [] # [template mesh, {column: list of arrays}]
+        steps = []
+        elecs = []
+        titles = []
+        for mesh in meshes:
+            igroup = None
+            for i, (ref, _) in enumerate(groups):
+                if ref.numel == mesh.numel and ref.numnp == mesh.numnp and (
+                        ref.connection is mesh.connection or (
+                        np.array_equal(ref.connection, mesh.connection) and
+                        np.array_equal(ref.node, mesh.node))):
+                    igroup = i
+                    break
+            if igroup is None:
+                groups.append([mesh, {}])
+                igroup = len(groups) - 1
+            columns = groups[igroup][1]
+            row = len([s for s in steps if s['group'] == igroup])
+            for c in mesh.df.columns:
+                if c not in columns: # missing in the previous steps
+                    columns[c] = [np.full(mesh.numel, np.nan)]*row
+            for c in columns:
+                values = mesh.df[c].values if c in mesh.df.columns else np.full(mesh.numel, np.nan)
+                columns[c].append(values.astype(str) if values.dtype == object else values)
+            steps.append({'group': igroup, 'row': row, 'columns': list(mesh.df.columns)})
+            titles.append(mesh.mesh_title)
+            elec = pd.DataFrame(np.zeros((0, 3)) if mesh.elec is None else mesh.elec,
+                                columns=['x','y','z'])
+            elec['remote'] = False if mesh.iremote is None else np.asarray(mesh.iremote, dtype=bool)
+            elecs.append(elec)
+        meta = {'groups': [], 'steps': steps, 'titles': titles,
+                'elec': self.addFrames(elecs) if len(elecs) > 0 else None}
+        for ref, columns in groups:
+            meta['groups'].append({'mesh': self.addMesh(ref, attributes=False),
+                                   'columns': list(columns.keys()),
+                                   'members': [self.addArray(np.stack(a)) for a in columns.values()]})
+        return meta
+
+
+    def close(self, manifest):
+        manifest['version'] = formatVersion
+        self.zf.writestr('manifest.json', json.dumps(manifest))
+        self.zf.close()
+
+
+    def closeUpdate(self, update):
+        """Write the description of appended members and close."""
+        self.zf.writestr('updates/{:06d}.json'.format(self.nupdates), json.dumps(update))
+        self.zf.close()
+
+
+
+class ProjectFile(object):
+    """Read a version 2 project file. Arrays are memory-mapped from the
+    archive.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the .resipy file.
+    """
+    def __init__(self, fname):
+        self.fname = os.path.abspath(fname)
+        self.zf = zipfile.ZipFile(self.fname, 'r')
+        self.manifest = json.loads(self.zf.read('manifest.json'))
+        self.updates = [json.loads(self.zf.read(n)) for n in
+                        sorted([n for n in self.zf.namelist() if n.startswith('updates/')])]
+
+
+    def array(self, name):
+        """Return the array stored in member `name` (memory-mapped)."""
+        info = self.zf.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            with self.zf.open(name) as f:
+                return np.lib.format.read_array(f, allow_pickle=False)
+        with open(self.fname, 'rb') as f:
+            f.seek(info.header_offset)
+            header = f.read(30) # local file header
+            nameLen = int.from_bytes(header[26:28], 'little')
+            extraLen = int.from_bytes(header[28:30], 'little')
+            f.seek(info.header_offset + 30 + nameLen + extraLen)
+            version = np.lib.format.read_magic(f)
+            shape, fortran, dtype = np.lib.format._read_array_header(f, version)
+            offset = f.tell()
+        if np.prod(shape) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.fname, dtype=dtype, mode='r', offset=offset,
+                         shape=shape, order='F' if fortran else 'C')
+
+
+    def frames(self, meta):
+        """Rebuild the dataframes written with `ProjectArchive.addFrames()`.
+        """
+        arrays = [self.array(m) for m in meta['members']]
+        offsets = np.r_[0, np.cumsum(meta['nrows'])].astype(int)
+        dfs = []
+        for i, (icols, dtypes) in enumerate(zip(meta['frameColumns'], meta['frameDtypes'])):
+            dfs.append(pd.DataFrame(dict([(meta['columns'][j],
+                arrays[j][offsets[i]:offsets[i+1]].astype(dtype))
+                for j, dtype in zip(icols, dtypes)])))
+        return dfs
+
+
+    def mesh(self, meta):
+        """Rebuild a mesh written with `ProjectArchive.addMesh()`. Without
+        stored attributes, the mesh has an empty dataframe.
+        """
+        node = np.array(self.array(meta['node']))
+        mesh = mt.Mesh(node[:,0], node[:,1], node[:,2],
+                       np.array(self.array(meta['connection'])), meta['cellType'],
+                       order_nodes=False, compute_centre=False, check2D=False)
+        if meta['elmCentre'] is not None:
+            mesh.elmCentre = np.array(self.array(meta['elmCentre']))
+        if meta['eNodes'] is not None:
+            mesh.setElecNode(np.array(self.array(meta['eNodes'])))
+        if meta['df'] is not None:
+            mesh.df = self.frames(meta['df'])[0]
+        else:
+            mesh.df = pd.DataFrame(index=np.arange(mesh.numel))
+        return mesh
+
+
+    def results(self, meta, maxCache=20, out=None):
+        """Return a `MeshResults` which steps are read on access from the
+        arrays written with `ProjectArchive.addResults()`. If `out` is given,
+        the steps are appended to it.
+        """
+        if out is None:
+            out = MeshResults(maxCache=maxCache)
+        templates = [self.mesh(g['mesh']) for g in meta['groups']]
+        arrays = [dict(zip(g['columns'], [self.array(m) for m in g['members']]))
+                  for g in meta['groups']]
+        elecs = self.frames(meta['elec']) if meta['elec'] is not None else []
+        def loader(igroup, row, columns):
+            return lambda: dict([(c, arrays[igroup][c][row]) for c in columns])
+        for i, step in enumerate(meta['steps']):
+            elec, iremote = None, None
+            if len(elecs) > 0 and elecs[i].shape[0] > 0:
+                elec = elecs[i][['x','y','z']].values
+                iremote = elecs[i]['remote'].values
+            out.appendLoader(loader(step['group'], step['row'], step['columns']),
+                             templates[step['group']], title=meta['titles'][i],
+                             elec=elec, iremote=iremote)
+        return out
+
+
+    def close(self):
+        self.zf.close()
+
+
+def isProjectV2(fname):
+    """Return True if `fname` is a version 2 project file."""
+    try:
+        with zipfile.ZipFile(fname, 'r') as zf:
+            return 'manifest.json' in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
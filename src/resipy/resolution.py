@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Diagonals of the model covariance and resolution matrices from the files
+written by the R* codes when `res_matrix` is set:
+    f###_J.dat      : Jacobian (n_meas x n_param)
+    f###_R.dat      : values of the roughness matrix (sparse rows)
+    f###_Rindex.dat : column index (1-based) of each value of f###_R.dat
+    f###_err.dat    : data weights (last column)
+With A = J^T Wd^2 J + alpha*R (Menke et al, 2015), Cm = A^-1 and the
+resolution matrix is Cm J^T Wd^2 J. Only the diagonals are computed, by
+blocks: a single dense n_param x n_param matrix is built when
+n_meas >= n_param and none otherwise.
+"""
+import os, itertools
+import numpy as np
+import pandas as pd
+from resipy.lazy import lazyModule, lazyObject
+sparse = lazyModule('scipy.sparse')
+splu = lazyObject('scipy.sparse.linalg', 'splu')
+spilu = lazyObject('scipy.sparse.linalg', 'spilu')
+cho_factor = lazyObject('scipy.linalg', 'cho_factor')
+cho_solve = lazyObject('scipy.linalg', 'cho_solve')
+dsyrk = lazyObject('scipy.linalg.blas', 'dsyrk')
+
+
+def _readValues(f, dtype, out=None, chunkLines=10000):
+    """Parse the remaining lines of the open text file `f` in chunks of
+    lines (into `out` if given, a flat array).
+    """
+    chunks = []
+    i = 0
+    while True:
+        lines = list(itertools.islice(f, chunkLines))
+        if len(lines) == 0:
+            break
+        vals = np.fromstring(' '.join(lines), sep=' ', dtype=dtype)
+        if out is None:
+            chunks.append(vals)
+        else:
+            out[i:i+len(vals)] = vals
+        i += len(vals)
+    return out if out is not None else np.concatenate(chunks)
+
+
+def readJacobian(fname, dtype=np.float64, mmapFile=None):
+    """Read a f###_J.dat file in bulk.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the file.
+    dtype : numpy.dtype, optional
+        Type of the returned array.
+    mmapFile : str, optional
+        If specified, the Jacobian is stored in this .npy file and returned
+        as a memory-mapped array. If the .npy file is more recent than
+        `fname` it is reused without parsing the text file again.
+
+    Returns
+    -------
+    J : numpy.array
+        Jacobian matrix (n_meas x n_param).
+    """
+    if mmapFile is not None and os.path.exists(mmapFile) \
+            and os.path.getmtime(mmapFile) >= os.path.getmtime(fname):
+        return np.load(mmapFile, mmap_mode='r')
+    with open(fname, 'r') as f:
+        shape = tuple(int(k) for k in f.readline().split()[:2])
+        if mmapFile is None:
+            J = np.empty(shape, dtype=dtype)
+        else:
+            J = np.lib.format.open_memmap(mmapFile, mode='w+', dtype=dtype, shape=shape)
+        _readValues(f, dtype, out=J.reshape(-1))
+    if mmapFile is not None:
+        J.flush()
+    return J
+
+
+def readRoughness(fname, nparam):
+    """Read a f###_R.dat file and its f###_Rindex.dat file as a sparse
+    matrix.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the f###_R.dat file.
+    nparam : int
+        Number of parameters.
+
+    Returns
+    -------
+    R : scipy.sparse.csr_matrix
+        Roughness matrix (n_param x n_param).
+    """
+    dirname, name = os.path.split(fname)
+    with open(fname, 'r') as f:
+        ncol = int(f.readline().split()[1])
+        vals = _readValues(f, np.float64)
+    with open(os.path.join(dirname, name.replace('_R.dat', '_Rindex.dat')), 'r') as f:
+        f.readline()
+        index = _readValues(f, np.float64).astype(np.int64) - 1
+    vals = vals.reshape(-1, ncol)
+    index = index.reshape(-1, ncol)
+    rows = np.repeat(np.arange(vals.shape[0]), ncol).reshape(vals.shape)
+    ie = index >= 0
+    return sparse.csr_matrix((vals[ie], (rows[ie], index[ie])), shape=(nparam, nparam))
+
+
+def readWeights(fname):
+    """Return the final data weights of a f###_err.dat file (last column
+    which name contains 'weight', else last column).
+    """
+    df = pd.read_csv(fname, sep=r'\s+')
+    cols = [c for c in df.columns if 'weight' in c.lower()]
+    return (df[cols[-1]] if len(cols) > 0 else df.iloc[:,-1]).values.astype(float)
+
+
+def _diagInverse(solve, n, blockSize):
+    """Diagonal of the inverse of a matrix given a function solving for
+    blocks of right-hand side columns.
+    """
+    diag = np.zeros(n)
+    for i0 in range(0, n, blockSize):
+        i1 = min(i0 + blockSize, n)
+        E = np.zeros((n, i1 - i0))
+        E[np.arange(i0, i1), np.arange(i1 - i0)] = 1
+        X = solve(E)
+        diag[i0:i1] = X[np.arange(i0, i1), np.arange(i1 - i0)]
+    return diag
+
+
+def diagonals(J, weights, R, alpha, blockSize=256, damping=1e-8, mmapFile=None):
+    """Diagonals of the covariance and resolution matrices.
+
+    Parameters
+    ----------
+    J : numpy.array
+        Jacobian (n_meas x n_param), can be memory-mapped.
+    weights : numpy.array
+        Data weights (n_meas).
+    R : scipy.sparse matrix
+        Roughness matrix (n_param x n_param).
+    alpha : float
+        Regularization parameter.
+    blockSize : int, optional
+        Number of rows (of J) or right-hand sides processed at once.
+    damping : float, optional
+        Relative damping added to the diagonal of alpha*R so it can be
+        factorized when there are fewer measurements than parameters.
+    mmapFile : str, optional
+        If n_meas < n_param, the n_param x n_meas matrix Z (see Notes) is
+        stored in this .npy file (memory-mapped) instead of in memory.
+
+    Returns
+    -------
+    covar, remat : numpy.array
+        Diagonals of the covariance and resolution matrices.
+
+    Notes
+    -----
+    If n_meas >= n_param, A is built densely (the only n_param x n_param
+    matrix, alpha*R is added through its sparse indices) and
+    Cholesky-factorized in place. As Cm S = I - alpha Cm R, the resolution
+    is diag(Cm S) = 1 - alpha*diag(Cm R).
+    Else the Woodbury identity is used with B = alpha*R (sparse LU) so that
+    only the n_meas x n_meas matrix M and Z are needed:
+        Z = B^-1 Jw^T, M = I + Jw Z (Cholesky)
+        diag(Cm) = diag(B^-1) - sum((Z M^-1) * Z, axis=1)
+        diag(Cm Jw^T Jw) = sum((Z M^-1) * Jw^T, axis=1)
+    where Jw = Wd J. Z is computed by blocks of measurements and then
+    used by blocks of parameters.
+    """
+    nmeas, nparam = J.shape
+    weights = np.asarray(weights, dtype=float)
+    R = sparse.csr_matrix(R)
+    def rowBlock(i0): # weighted rows of J (J is read block by block)
+        return np.asarray(J[i0:i0+blockSize], dtype=float)*weights[i0:i0+blockSize,None]
+    def colBlock(p0): # weighted columns of J
+        return np.asarray(J[:,p0:p0+blockSize], dtype=float)*weights[:,None]
+
+    if nmeas >= nparam: # small number of parameters
+        # A = Jw^T Jw + alpha*R, upper triangle accumulated in place (Fortran
+        # order so that LAPACK doesn't copy it)
+        A = np.zeros((nparam, nparam), order='F')
+        for i0 in range(0, nmeas, blockSize):
+            A = dsyrk(1.0, rowBlock(i0), beta=1.0, c=A, trans=1, lower=0, overwrite_c=1)
+        coo = R.tocoo()
+        np.add.at(A, (coo.row, coo.col), alpha*coo.data)
+        c = cho_factor(A, lower=False, overwrite_a=True, check_finite=False)
+        covar = np.zeros(nparam)
+        remat = np.zeros(nparam)
+        for i0 in range(0, nparam, blockSize):
+            i1 = min(i0 + blockSize, nparam)
+            E = np.zeros((nparam, i1 - i0))
+            E[np.arange(i0, i1), np.arange(i1 - i0)] = 1
+            X = cho_solve(c, E, check_finite=False).T # rows i0:i1 of Cm (A is symmetric)
+            covar[i0:i1] = X[np.arange(i1 - i0), np.arange(i0, i1)]
+            CmR = np.asarray(R[:,i0:i1].T.multiply(X).sum(axis=1)).ravel() # diag(Cm R)[i0:i1]
+            remat[i0:i1] = 1 - alpha*CmR
+        return covar, remat
+
+    B = sparse.csc_matrix(alpha*R)
+    d = B.diagonal()
+    B = B + damping*np.mean(np.abs(d[d != 0]) if np.any(d != 0) else 1)*sparse.identity(nparam, format='csc')
+    lu = splu(B, permc_spec='MMD_AT_PLUS_A', options=dict(SymmetricMode=True)) # B is symmetric
+    if mmapFile is None:
+        Z = np.zeros((nparam, nmeas))
+    else:
+        Z = np.lib.format.open_memmap(mmapFile, mode='w+', dtype=np.float64, shape=(nparam, nmeas))
+    for i0 in range(0, nmeas, blockSize): # Z = B^-1 Jw^T by blocks of measurements
+        Z[:,i0:i0+blockSize] = lu.solve(rowBlock(i0).T)
+    M = np.eye(nmeas)
+    for p0 in range(0, nparam, blockSize): # M = I + Jw Z by blocks of parameters
+        M += colBlock(p0).dot(Z[p0:p0+blockSize])
+    c = cho_factor(M, overwrite_a=True)
+    covar = _diagInverse(lu.solve, nparam, blockSize)
+    remat = np.zeros(nparam)
+    for p0 in range(0, nparam, blockSize):
+        Zp = np.asarray(Z[p0:p0+blockSize])
+        ZMp = cho_solve(c, Zp.T).T # rows of Z M^-1 (M is symmetric)
+        covar[p0:p0+blockSize] -= np.sum(ZMp*Zp, axis=1)
+        remat[p0:p0+blockSize] = np.sum(ZMp*colBlock(p0).T, axis=1)
+    del Z
+    return covar, remat
+
+
+def _blockCG(matvec, B, precond, tol=1e-4, maxiter=500):
+    """Solve A X = B for several right-hand sides at once with a
+    preconditioned conjugate gradient (each column has its own step).
+    `precond` applies the inverse of the preconditioner to a block.
+    """
+    X = np.zeros_like(B)
+    Rs = B.copy()
+    Zs = precond(Rs)
+    P = Zs.copy()
+    rz = np.sum(Rs*Zs, axis=0)
+    bnorm = np.linalg.norm(B, axis=0)
+    bnorm[bnorm == 0] = 1
+    for it in range(maxiter):
+        AP = matvec(P)
+        a = rz/np.sum(P*AP, axis=0)
+        X += a[None,:]*P
+        Rs -= a[None,:]*AP
+        if np.max(np.linalg.norm(Rs, axis=0)/bnorm) < tol:
+            break
+        Zs = precond(Rs)
+        rzNew = np.sum(Rs*Zs, axis=0)
+        P = Zs + (rzNew/rz)[None,:]*P
+        rz = rzNew
+    return X, it + 1
+
+
+def estimateDiagonals(J, weights, R, alpha, nprobe=32, tol=1e-4, maxiter=500,
+                      blockSize=2048, seed=None):
+    """Stochastic (Hutchinson) estimate of the diagonals of the covariance
+    and resolution matrices. The method is matrix-free: J is only used
+    through products computed by blocks of rows (it can be memory-mapped)
+    and R stays sparse, so it scales to models with millions of parameters.
+
+    Parameters
+    ----------
+    J : numpy.array
+        Jacobian (n_meas x n_param), can be memory-mapped.
+    weights : numpy.array
+        Data weights (n_meas).
+    R : scipy.sparse matrix
+        Roughness matrix (n_param x n_param).
+    alpha : float
+        Regularization parameter.
+    nprobe : int, optional
+        Number of random probe vectors. The error of the estimate decreases
+        as 1/sqrt(nprobe) while the time increases linearly.
+    tol : float, optional
+        Relative tolerance of the iterative solves.
+    maxiter : int, optional
+        Maximum number of conjugate gradient iterations.
+    blockSize : int, optional
+        Number of rows of J read at once.
+    seed : int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    covar, remat : numpy.array
+        Estimated diagonals of the covariance and resolution matrices.
+
+    Notes
+    -----
+    For Rademacher vectors z, diag(M) ~ sum(z * M z)/sum(z * z). With
+    A = S + alpha*R, A^-1 z and A^-1 S z are obtained together by conjugate
+    gradient on A.
+    """
+    nmeas, nparam = J.shape
+    weights = np.asarray(weights, dtype=float)
+    R = sparse.csr_matrix(R)
+    def Smatvec(X): # Jw^T Jw X by blocks of rows
+        out = np.zeros_like(X)
+        for i0 in range(0, nmeas, blockSize):
+            Jw = np.asarray(J[i0:i0+blockSize], dtype=float)*weights[i0:i0+blockSize,None]
+            out += Jw.T.dot(Jw.dot(X))
+        return out
+    def matvec(X):
+        return Smatvec(X) + alpha*R.dot(X)
+    # preconditioner: incomplete LU of the sparse part alpha*R + diag(S)
+    dS = np.zeros(nparam)
+    for i0 in range(0, nmeas, blockSize):
+        Jw = np.asarray(J[i0:i0+blockSize], dtype=float)*weights[i0:i0+blockSize,None]
+        dS += np.sum(Jw**2, axis=0)
+    P = sparse.csc_matrix(alpha*R + sparse.diags(dS))
+    d = P.diagonal()
+    P = P + sparse.diags(np.where(d <= 0, 1.0, 0.0)) # parameters without constraint
+    ilu = spilu(P, drop_tol=1e-4, fill_factor=10)
+    precond = ilu.solve
+
+    rng = np.random.default_rng(seed)
+    Z = rng.choice([-1.0, 1.0], size=(nparam, nprobe))
+    X, niter = _blockCG(matvec, np.c_[Z, Smatvec(Z)], precond, tol=tol, maxiter=maxiter)
+    zz = np.sum(Z*Z, axis=1)
+    covar = np.sum(Z*X[:,:nprobe], axis=1)/zz
+    remat = np.sum(Z*X[:,nprobe:], axis=1)/zz
+    return covar, remat
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Content-addressed cache of the outputs of the R* executables. The inputs
+of a run (mesh, protocol, .in file, starting model and executable) are hashed
+together and the key maps to a directory holding all the files produced by the
+run. Identical runs (same inputs) can then be served from the cache instead of
+calling the executable again.
+"""
+import os, shutil, hashlib, time
+
+# files read by the R* codes and that therefore define the run
+inputFiles = ['mesh.dat', 'mesh3d.dat', 'protocol.dat', 'R2.in', 'cR2.in',
+              'R3t.in', 'cR3t.in', 'res0.dat', 'Start_res.dat', 'resistivity.dat']
+
+cacheVersion = '1' # change if the way the key is computed changes
+
+# SHA1 of the executables is only recomputed when they change on disk
+_exeHashes = {}
+
+
+def fileSHA1(fname, sha1=None):
+    """Return (or update) the SHA1 of a file read in chunks of 64kb.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the file.
+    sha1 : hashlib.sha1, optional
+        If provided, this object is updated and returned instead of a new one.
+    """
+    BUF_SIZE = 65536
+    if sha1 is None:
+        sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while True:
+            data = f.read(BUF_SIZE)
+            if not data:
+                break
+            sha1.update(data)
+    return sha1
+
+
+def exeSHA1(exePath):
+    """Return the SHA1 hex digest of the executable. The value is memoized
+    on the (mtime, size) of the file so hashing is done once per session.
+    """
+    stat = os.stat(exePath)
+    key = (exePath, stat.st_mtime, stat.st_size)
+    if key not in _exeHashes:
+        _exeHashes[key] = fileSHA1(exePath).hexdigest()
+    return _exeHashes[key]
+
+
+class ResultCache(object):
+    """Local cache of inversion/forward outputs with a size cap and least
+    recently used (LRU) eviction.
+
+    Parameters
+    ----------
+    dirname : str, optional
+        Directory of the cache. Default is `~/.resipy/cache`. The same
+        directory can be shared between projects.
+    maxSize : float, optional
+        Maximum size of the cache in Mb. When exceeded, the least recently
+        used entries are removed.
+    """
+    def __init__(self, dirname=None, maxSize=1000):
+        if dirname is None:
+            dirname = os.path.join(os.path.expanduser('~'), '.resipy', 'cache')
+        self.dirname = os.path.abspath(dirname)
+        self.maxSize = maxSize
+        if os.path.exists(self.dirname) is False:
+            os.makedirs(self.dirname)
+
+
+    def key(self, wd, exePath):
+        """Compute the key of the run from the input files present in `wd`
+        and the executable.
+
+        Parameters
+        ----------
+        wd : str
+            Directory in which the executable will be run.
+        exePath : str
+            Path of the executable.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal SHA1 digest.
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(cacheVersion.encode())
+        sha1.update(os.path.basename(exePath).encode())
+        sha1.update(exeSHA1(exePath).encode())
+        for f in inputFiles:
+            fname = os.path.join(wd, f)
+            if os.path.exists(fname):
+                sha1.update(f.encode())
+                fileSHA1(fname, sha1)
+        return sha1.hexdigest()
+
+
+    def get(self, key, wd):
+        """Copy the cached outputs of `key` into `wd`.
+
+        Returns
+        -------
+        files : list of str or None
+            Name of the files restored, None if the key is not in the cache.
+        """
+        entry = os.path.join(self.dirname, key)
+        if os.path.exists(os.path.join(entry, '.complete')) is False:
+            return None
+        files = [f for f in os.listdir(entry) if f != '.complete']
+        for f in files:
+            shutil.copy(os.path.join(entry, f), os.path.join(wd, f))
+        os.utime(entry) # mark it as recently used
+        return files
+
+
+    def put(self, key, wd, files):
+        """Store the given output `files` from `wd` under `key` then evict
+        old entries if the cache is too big.
+        """
+        entry = os.path.join(self.dirname, key)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.mkdir(entry)
+        for f in files:
+            shutil.copy(os.path.join(wd, f), os.path.join(entry, f))
+        with open(os.path.join(entry, '.complete'), 'w') as f: # written last
+            f.write(str(time.time())) # so partial entries are never served
+        self.evict()
+
+
+    def entries(self):
+        """Return list of (path, last access time, size in bytes) of the
+        entries sorted from least to most recently used.
+        """
+        out = []
+        for e in os.listdir(self.dirname):
+            entry = os.path.join(self.dirname, e)
+            if os.path.isdir(entry):
+                size = sum([os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)])
+                out.append((entry, os.path.getmtime(entry), size))
+        return sorted(out, key=lambda x: x[1])
+
+
+    def size(self):
+        """Total size of the cache in Mb.
+        """
+        return sum([e[2] for e in self.entries()])/1e6
+
+
+    def evict(self):
+        """Remove the least recently used entries until the cache size is
+        below `maxSize`.
+        """
+        entries = self.entries()
+        total = sum([e[2] for e in entries])
+        while len(entries) > 0 and total > self.maxSize*1e6:
+            entry, _, size = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+    def clear(self):
+        """Remove all entries of the cache.
+        """
+        for entry, _, _ in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
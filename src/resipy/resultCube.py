@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Time-lapse result cube: the values of an attribute for all steps stored in a
+single (n_steps x n_cells) float32 array attached to one reference `Mesh`.
+The arrays can be memory-mapped .npy files so that long series don't need to
+fit in memory. Differences and temporal statistics are computed with
+vectorized operations over the whole cube.
+"""
+import os, json
+import numpy as np
+from resipy.lazy import lazyModule
+mpath = lazyModule('matplotlib.path')
+
+
+class ResultCube(object):
+    """Values of attributes for all time steps on a shared mesh.
+
+    Parameters
+    ----------
+    mesh : Mesh
+        Reference mesh (topology shared by all steps).
+    names : list of str
+        Name of each step (survey name).
+    dirname : str, optional
+        If specified, the cube arrays are memory-mapped .npy files in this
+        directory, otherwise they are kept in memory.
+    """
+    def __init__(self, mesh, names, dirname=None):
+        self.mesh = mesh
+        self.names = list(names)
+        self.dirname = dirname
+        self.data = {} # attribute name: (n_steps x n_cells) array
+        self.roi = np.ones(mesh.numel, dtype=bool) # region of interest
+        if dirname is not None and os.path.exists(dirname) is False:
+            os.makedirs(dirname)
+
+
+    @property
+    def shape(self):
+        return (len(self.names), self.mesh.numel)
+
+
+    def _fname(self, attr):
+        return os.path.join(self.dirname, attr.replace('/', '_') + '.npy')
+
+
+    def allocate(self, attr):
+        """Create an empty (n_steps x n_cells) float32 array for `attr`.
+        """
+        if self.dirname is None:
+            self.data[attr] = np.full(self.shape, np.nan, dtype=np.float32)
+        else:
+            self.data[attr] = np.lib.format.open_memmap(
+                self._fname(attr), mode='w+', dtype=np.float32, shape=self.shape)
+            self.data[attr][:] = np.nan
+        return self.data[attr]
+
+
+    def __getitem__(self, attr):
+        return self.data[attr]
+
+
+    def keys(self):
+        return list(self.data.keys())
+
+
+    def setRoi(self, poly=None, zlim=None):
+        """Define the region of interest (ROI) from a polygon (e.g. the
+        `xz_poly_table` of the inversion parameters).
+
+        Parameters
+        ----------
+        poly : array of float, optional
+            Vertices of the polygon (x, z in 2D; x, y in 3D). If None all
+            cells are in the ROI.
+        zlim : tuple of float, optional
+            For 3D meshes, (zmin, zmax) of the ROI.
+
+        Returns
+        -------
+        roi : array of bool
+            True for cells inside the ROI.
+        """
+        self.roi = roiMask(self.mesh, poly, zlim)
+        return self.roi
+
+
+    def _derived(self, attr, kind, func, ref, roi, chunk):
+        """Apply `func(values, ref)` to the cube by chunks of cells. The result
+        is a memory-mapped .npy file next to the cube if it has a dirname."""
+        cube = self.data[attr]
+        cells = np.where(self.roi)[0] if roi else np.arange(cube.shape[1])
+        shape = (cube.shape[0], len(cells))
+        if self.dirname is None:
+            out = np.empty(shape, dtype=np.float32)
+        else:
+            fname = self._fname(attr)[:-4] + '.' + kind + '.npy'
+            out = np.lib.format.open_memmap(fname, mode='w+', dtype=np.float32, shape=shape)
+        for i0 in range(0, len(cells), chunk):
+            icells = cells[i0:i0+chunk]
+            values = np.asarray(cube[:,icells[0]:icells[-1]+1])[:,icells - icells[0]]
+            out[:,i0:i0+chunk] = func(values, values[ref][None,:])
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+
+    def diff(self, attr, ref=0, roi=False, chunk=100000):
+        """Difference of all steps with the reference step.
+
+        Parameters
+        ----------
+        attr : str
+            Name of the attribute.
+        ref : int, optional
+            Index of the reference step.
+        roi : bool, optional
+            If True, only the cells inside the ROI are returned.
+        chunk : int, optional
+            Number of cells processed at once (bounds the memory used).
+
+        Returns
+        -------
+        diff : array of float
+            (n_steps x n_cells) array, memory-mapped in the directory of the
+            cube ('<attr>.diff.npy') if it has one.
+        """
+        return self._derived(attr, 'diff', lambda v, r: v - r, ref, roi, chunk)
+
+
+    def diffPercent(self, attr, ref=0, roi=False, chunk=100000):
+        """Relative difference (in percent) of all steps with the reference
+        step. See `ResultCube.diff()`.
+        """
+        return self._derived(attr, 'diffPercent', lambda v, r: (v - r)/r*100, ref, roi, chunk)
+
+
+    def stats(self, attr, times=None, chunk=100000):
+        """Temporal statistics of each cell. Missing values (NaN) are
+        ignored.
+
+        Parameters
+        ----------
+        attr : str
+            Name of the attribute.
+        times : array of float, optional
+            Time of each step used to compute the trend. Default is the step
+            index.
+        chunk : int, optional
+            Number of cells processed at once (bounds the memory used).
+
+        Returns
+        -------
+        stats : dict
+            Arrays of length n_cells for 'min', 'max', 'mean', 'std' and
+            'trend' (slope of the least-square linear fit through time of the
+            valid steps of the cell). NaN for cells without valid steps (and
+            without two valid steps for the trend).
+        """
+        cube = self.data[attr]
+        nsteps, ncells = cube.shape
+        if times is None:
+            times = np.arange(nsteps)
+        t = np.asarray(times, dtype=float)[:,None]
+        out = dict([(key, np.full(ncells, np.nan)) for key in ['min', 'max', 'mean', 'std', 'trend']])
+        for i0 in range(0, ncells, chunk):
+            c = np.asarray(cube[:,i0:i0+chunk], dtype=float)
+            valid = ~np.isnan(c)
+            n = valid.sum(axis=0)
+            ok = n > 0
+            cz = np.where(valid, c, 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = cz.sum(axis=0)/n
+                tmean = (t*valid).sum(axis=0)/n
+                dc = np.where(valid, c - mean, 0)
+                dt = np.where(valid, t - tmean, 0)
+                out['std'][i0:i0+chunk] = np.sqrt((dc**2).sum(axis=0)/n)
+                out['trend'][i0:i0+chunk] = (dt*dc).sum(axis=0)/(dt**2).sum(axis=0)
+            out['mean'][i0:i0+chunk] = mean
+            out['min'][i0:i0+chunk] = np.where(ok, np.where(valid, c, np.inf).min(axis=0), np.nan)
+            out['max'][i0:i0+chunk] = np.where(ok, np.where(valid, c, -np.inf).max(axis=0), np.nan)
+        out['trend'][~np.isfinite(out['trend'])] = np.nan # less than two valid steps
+        return out
+
+
+    def roiMean(self, attr):
+        """Mean of the attribute inside the ROI for each step.
+        """
+        return np.nanmean(self.data[attr][:,self.roi], axis=1)
+
+
+    def addToMesh(self, values, name):
+        """Add an array of length n_cells (e.g. a temporal statistic) as an
+        attribute of the reference mesh.
+        """
+        self.mesh.addAttribute(np.asarray(values), name)
+
+
+    def save(self):
+        """Write the index of the cube (step names, attributes and ROI) next
+        to the memory-mapped arrays so it can be reopened with `load()`.
+        """
+        if self.dirname is None:
+            raise ValueError('The cube needs a dirname to be saved.')
+        for attr in self.data:
+            if isinstance(self.data[attr], np.memmap):
+                self.data[attr].flush()
+            else:
+                np.save(self._fname(attr), self.data[attr])
+        np.save(os.path.join(self.dirname, '.roi.npy'), self.roi)
+        with open(os.path.join(self.dirname, 'cube.json'), 'w') as f:
+            json.dump({'names': self.names, 'attributes': self.keys()}, f)
+
+
+    @classmethod
+    def load(cls, mesh, dirname):
+        """Reopen a cube saved with `save()` (arrays are memory-mapped in
+        read-only mode).
+        """
+        with open(os.path.join(dirname, 'cube.json'), 'r') as f:
+            index = json.load(f)
+        cube = cls(mesh, index['names'], dirname)
+        for attr in index['attributes']:
+            cube.data[attr] = np.load(cube._fname(attr), mmap_mode='r')
+        cube.roi = np.load(os.path.join(dirname, '.roi.npy'))
+        return cube
+
+
+
+def roiMask(mesh, poly=None, zlim=None):
+    """Return a boolean array which is True for the cells of `mesh` which
+    centre is inside the polygon `poly` (and between `zlim` in 3D).
+    """
+    inside = np.ones(mesh.numel, dtype=bool)
+    if poly is None:
+        return inside
+    centres = np.asarray(mesh.elmCentre)
+    path = mpath.Path(np.asarray(poly))
+    if mesh.ndims == 3:
+        inside = path.contains_points(centres[:,:2])
+        if zlim is not None:
+            inside = inside & (centres[:,2] > zlim[0]) & (centres[:,2] < zlim[1])
+    else:
+        inside = path.contains_points(centres[:,[0,2]])
+    return inside
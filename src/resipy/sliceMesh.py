@@ -6,10 +6,11 @@ Created on Sun Dec 16 12:50:36 2018
 @author: jkl
 """
 
-import matplotlib.tri as tri
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider
+from resipy.lazy import lazyModule, lazyObject
+tri = lazyModule('matplotlib.tri')
+plt = lazyModule('matplotlib.pyplot')
+Slider = lazyObject('matplotlib.widgets', 'Slider')
 
 
 
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Opt-in tracing of the main stages of a workflow (parsing, filtering, meshing,
+writing the inputs, running the executable, reading the results). Each stage
+is recorded as a span with its duration, sizes (rows, cells, ...) and the
+resident memory of the process. While spans are open, a background thread
+samples the resident memory of the process and of its children (e.g. the
+inversion executable) to give the peak memory of each span. Spans can be exported as a Chrome trace-event
+file (open it in chrome://tracing or https://ui.perfetto.dev) or summarized
+in a table (see `Project.timings`).
+
+Tracing is disabled by default and then costs a single test per call:
+
+    from resipy import tracing
+    tracing.enable()
+    k = Project(...)
+    ...
+    k.invert()
+    print(k.timings)
+    tracing.exportChromeTrace('trace.json')
+
+It can also be enabled with the environment variable RESIPY_TRACE: if it is
+the path of a .json file, the trace is written there when Python exits.
+"""
+import os, time, json, atexit, threading, weakref
+from collections import deque
+from functools import wraps
+import psutil
+
+
+class _State(object):
+    enabled = False
+
+state = _State()
+spans = deque(maxlen=100000) # finished spans (oldest dropped first)
+_local = threading.local() # stack of the open spans of each thread
+_lock = threading.Lock()
+_t0 = time.perf_counter()
+_process = psutil.Process()
+_open = set() # open spans of all threads, updated by the sampler
+_sampler = None
+samplePeriod = 0.05 # s, interval between two memory samples
+
+
+def enable(on=True):
+    """Enable (or disable) the recording of spans."""
+    state.enabled = bool(on)
+
+
+def disable():
+    """Disable the recording of spans."""
+    state.enabled = False
+
+
+def reset():
+    """Discard the recorded spans."""
+    with _lock:
+        spans.clear()
+
+
+def _childrenRSS():
+    """Resident memory (bytes) of the running children of the process."""
+    rss = 0
+    try:
+        children = _process.children(recursive=True)
+    except psutil.Error:
+        return 0
+    for c in children:
+        try:
+            rss += c.memory_info().rss
+        except psutil.Error: # finished in the meantime
+            pass
+    return rss
+
+
+def _sample():
+    """Update the peak memory of the open spans until they are all closed."""
+    global _sampler
+    while True:
+        with _lock:
+            if len(_open) == 0:
+                _sampler = None
+                return
+            current = list(_open)
+        rss, rssChildren = _process.memory_info().rss, _childrenRSS()
+        for s in current:
+            s.peakRSS = max(s.peakRSS, rss)
+            s.peakRSSChildren = max(s.peakRSSChildren, rssChildren)
+        time.sleep(samplePeriod)
+
+
+def _ref(owner):
+    """Weak reference to the owner of a span (None if no owner)."""
+    if owner is None:
+        return None
+    try:
+        return weakref.ref(owner)
+    except TypeError: # object not weak-referenceable
+        return lambda: owner
+
+
+class Span(object):
+    """A traced stage (use `span()` to create one)."""
+    def __init__(self, name, owner=None, attrs=None):
+        self.name = name
+        self.owner = owner
+        self.attrs = {} if attrs is None else dict(attrs)
+
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if len(stack) > 0 else None
+        if self.parent is not None and self.parent.owner is not None:
+            self.owner = self.parent.owner # e.g. surveys of a project
+        self.depth = len(stack)
+        self.tid = threading.get_ident()
+        self.rss0 = _process.memory_info().rss
+        self.peakRSS = self.rss0 # peak while the span is open
+        self.peakRSSChildren = 0
+        stack.append(self)
+        global _sampler
+        with _lock:
+            _open.add(self)
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample, daemon=True)
+                _sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, etype, value, traceback):
+        self.end = time.perf_counter()
+        _local.stack.pop()
+        self.rss = _process.memory_info().rss
+        self.peakRSS = max(self.peakRSS, self.rss)
+        if etype is not None:
+            self.attrs['error'] = '{:s}: {:s}'.format(etype.__name__, str(value))
+        with _lock:
+            _open.discard(self)
+            spans.append(self)
+        return False
+
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+    def annotate(self, **attrs):
+        self.attrs.update(attrs)
+
+
+
+class _NullSpan(object):
+    """Span returned when tracing is disabled (does nothing)."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        return False
+
+    def annotate(self, **attrs):
+        pass
+
+_nullSpan = _NullSpan()
+
+
+def span(name, owner=None, **attrs):
+    """Context manager recording a span named `name` if tracing is enabled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    owner : object, optional
+        Object the stage belongs to (e.g. the `Project`). Inside another
+        span, it is the owner of the enclosing span. Only a weak reference
+        to it is kept.
+    **attrs : optional
+        Sizes or any value to store with the span.
+    """
+    if state.enabled is False:
+        return _nullSpan
+    return Span(name, _ref(owner), attrs)
+
+
+def annotate(**attrs):
+    """Add values (e.g. rows=..., cells=...) to the current span."""
+    if state.enabled is False:
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].annotate(**attrs)
+
+
+def traced(name=None):
+    """Decorator recording a span for each call of the function if tracing
+    is enabled. For methods (first argument named 'self'), the object is the
+    owner of the span (unless it is called inside another span).
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the span. Default is the qualified name of the function.
+    """
+    def decorator(func):
+        spanName = func.__qualname__ if name is None else name
+        method = func.__code__.co_varnames[:1] == ('self',)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if state.enabled is False:
+                return func(*args, **kwargs)
+            owner = _ref(args[0]) if method and len(args) > 0 else None
+            with Span(spanName, owner):
+                return func(*args, **kwargs)
+        return wrapper
+    if callable(name): # used without argument
+        func, name = name, None
+        return decorator(func)
+    return decorator
+
+
+def _select(owner=None):
+    with _lock:
+        out = list(spans)
+    if owner is not None:
+        out = [s for s in out if s.owner is not None and s.owner() is owner]
+    return out
+
+
+def exportChromeTrace(fname, owner=None):
+    """Write the spans as a Chrome trace-event JSON file.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the .json file.
+    owner : object, optional
+        Only export the spans of this object (e.g. a `Project`).
+    """
+    pid = os.getpid()
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+               'args': {'name': 'resipy'}}]
+    for s in sorted(_select(owner), key=lambda s: s.start):
+        args = dict(s.attrs)
+        args.update({'rssMB': s.rss/1e6, 'deltaRssMB': (s.rss - s.rss0)/1e6,
+                     'peakRssMB': s.peakRSS/1e6,
+                     'peakRssChildrenMB': s.peakRSSChildren/1e6})
+        events.append({'name': s.name, 'cat': s.name.split('.')[0], 'ph': 'X',
+                       'ts': (s.start - _t0)*1e6, 'dur': s.duration*1e6,
+                       'pid': pid, 'tid': s.tid, 'args': args})
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+def summary(owner=None):
+    """Summary table of the spans.
+
+    Parameters
+    ----------
+    owner : object, optional
+        Only summarize the spans of this object (e.g. a `Project`).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        One row per span name (sorted by total time) with the number of
+        calls, the total, self (without the traced sub-stages), mean and
+        maximum time in seconds, the peak memory (MB) and the last sizes
+        recorded.
+    """
+    import pandas as pd
+    sel = _select(owner)
+    childTime = {}
+    for s in sel:
+        if s.parent is not None:
+            childTime[id(s.parent)] = childTime.get(id(s.parent), 0) + s.duration
+    rows = {}
+    for s in sel:
+        r = rows.setdefault(s.name, {'name': s.name, 'calls': 0, 'total': 0., 'self': 0.,
+                                     'max': 0., 'peakRSS(MB)': 0., 'sizes': ''})
+        r['calls'] += 1
+        r['total'] += s.duration
+        r['self'] += s.duration - childTime.get(id(s), 0)
+        r['max'] = max(r['max'], s.duration)
+        r['peakRSS(MB)'] = max(r['peakRSS(MB)'], s.peakRSS/1e6, s.peakRSSChildren/1e6)
+        sizes = ', '.join(['{:s}={:s}'.format(k, str(v)) for k, v in s.attrs.items()])
+        if sizes != '':
+            r['sizes'] = sizes
+    df = pd.DataFrame(list(rows.values()), columns=['name', 'calls', 'total', 'self',
+                                                    'max', 'peakRSS(MB)', 'sizes'])
+    df.insert(4, 'mean', df['total']/df['calls'])
+    return df.sort_values('total', ascending=False).reset_index(drop=True)
+
+
+# enabled from the environment
+_envTrace = os.environ.get('RESIPY_TRACE', '')
+if _envTrace not in ['', '0']:
+    enable()
+    if _envTrace.lower().endswith('.json'):
+        atexit.register(lambda: exportChromeTrace(_envTrace))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of the ResIPy project (https://gitlab.com/hkex/resipy).
+@licence: GPLv3
+@author: ResIPy authors and contributors
+
+Detection of the new files dropped in a folder by a monitoring system (see
+`Project.watchFolder()`). The folder is polled with the standard library. If
+the optional `inotify_simple` package is installed (Linux), the watcher wakes
+up as soon as a file is written instead of waiting for the next poll.
+
+A file is only reported once it is complete: either the system reported that
+it was closed after writing (inotify) or its size and modification time did
+not change between two scans.
+"""
+import os, time, fnmatch
+
+try:
+    from inotify_simple import INotify, flags as inotifyFlags
+except ImportError: # optional, polling only
+    INotify = None
+
+
+class FolderWatcher(object):
+    """Report the new complete files of a folder.
+
+    Parameters
+    ----------
+    dirname : str
+        Folder to watch.
+    pattern : str, optional
+        Only files matching this pattern (e.g. '*.csv') are reported.
+    poll : float, optional
+        Time in seconds between two scans of the folder.
+    ignore : function, optional
+        Function taking the path of a file and returning True if it should
+        never be reported (e.g. already imported).
+    """
+    def __init__(self, dirname, pattern='*', poll=5, ignore=None):
+        if os.path.isdir(dirname) is False:
+            raise ValueError('{:s} is not a directory'.format(dirname))
+        self.dirname = os.path.abspath(dirname)
+        self.pattern = pattern
+        self.poll = poll
+        self.ignore = ignore
+        self.done = set() # files already reported or ignored
+        self.pending = {} # path: (size, mtime, time of detection)
+        self.closed = set() # files reported closed after writing by inotify
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(self.dirname, inotifyFlags.CLOSE_WRITE |
+                                       inotifyFlags.MOVED_TO)
+            except OSError: # e.g. limit of watches reached
+                self.inotify = None
+
+
+    def scan(self):
+        """Scan the folder once.
+
+        Returns
+        -------
+        files : list of tuple
+            (path, time of detection) of the new complete files sorted by
+            modification time.
+        """
+        now = time.time()
+        ready = []
+        for f in os.listdir(self.dirname):
+            path = os.path.join(self.dirname, f)
+            if (f[0] == '.' or path in self.done or os.path.isfile(path) is False
+                    or fnmatch.fnmatch(f, self.pattern) is False):
+                continue
+            if self.ignore is not None and self.ignore(path):
+                self.done.add(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError: # removed in between
+                continue
+            state = (stat.st_size, stat.st_mtime)
+            if path in self.pending:
+                tdetect = self.pending[path][2]
+                stable = self.pending[path][:2] == state
+            else:
+                tdetect = now
+                stable = False
+            if stat.st_size > 0 and (stable or path in self.closed):
+                ready.append((stat.st_mtime, path, tdetect))
+                self.done.add(path)
+                self.pending.pop(path, None)
+            else:
+                self.pending[path] = state + (tdetect,)
+        self.closed = self.closed - self.done
+        return [(path, tdetect) for _, path, tdetect in sorted(ready)]
+
+
+    def wait(self, timeout=None):
+        """Wait until the next scan: `poll` seconds or, with inotify, until a
+        file is written (if it is sooner).
+        """
+        delay = self.poll if timeout is None else max(0, min(self.poll, timeout))
+        if self.inotify is None:
+            time.sleep(delay)
+            return
+        for event in self.inotify.read(timeout=int(delay*1000)):
+            self.closed.add(os.path.join(self.dirname, event.name))
+
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
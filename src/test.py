@@ -10,6 +10,8 @@ Created on Thu Jan 10 11:34:56 2019
 import numpy as np
 import os
 import shutil
+import tempfile
+import platform
 import pandas as pd
 import time
 import matplotlib.pyplot as plt
@@ -29,7 +31,19 @@ testdir = 'examples/'
 
 
 print('======================= GENERAL METHOD TESTS =====================')
+#%% import time (headless)
+import sys, subprocess
+out = subprocess.run([sys.executable, '-c', 'import sys, time; t0 = time.time(); import resipy; '
+                      'print(time.time() - t0); print(sorted(set([m.split(".")[0] for m in sys.modules])))'],
+                     stdout=subprocess.PIPE, universal_newlines=True).stdout.split('\n')
+timings['import'] = float(out[-3])
+for m in ['matplotlib', 'scipy', 'requests', 'pyvista']: # imported on first use
+    assert "'{:s}'".format(m) not in out[-2]
+print('import resipy: {:.3f}s'.format(timings['import']))
+
 #%% testing all importing features
+from resipy import checkExe
+checkExe() # not done when creating a Project
 k = Project(typ='R2')
 k.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal')
 k.createSurvey(testdir + 'ip-2d/syscal.csv', ftype='Syscal')
@@ -308,11 +322,140 @@ k.filterInvError(vmin=-3, vmax=3)
 # save and load project
 k.saveProject(testdir + 'project')
 k.loadProject(testdir + 'project.resipy')
+k.saveProject(testdir + 'project1', version=1) # csv/vtk format
+k.loadProject(testdir + 'project1.resipy')
 
 print('elapsed: {:.4}s'.format(time.time() - t0)) # 22.7s
 timings['dc-2d-topo'] = time.time() - t0
 
 
+#%% test analytic half-space DOI
+plt.close('all')
+print('-------------Testing half-space DOI ------------')
+t0 = time.time()
+k = Project(typ='R2')
+k.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal')
+k.createMesh()
+sens = k.computeHalfSpaceSens() # no inversion needed
+assert len(sens) == k.mesh.numel
+iz = np.argsort(k.mesh.elmCentre[:,2])
+assert np.nanmean(sens[iz[:100]]) < np.nanmean(sens[iz[-100:]]) # decreases with depth
+k.invert()
+k.showResults(doiHalfSpace=True, cropAttr='HalfSpaceSens(log10)')
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['dc-2d-halfspace'] = time.time() - t0
+
+
+#%% test tracing of the workflow stages
+print('-------------Testing tracing ------------')
+t0 = time.time()
+from resipy import tracing
+tracing.enable()
+k = Project(tempfile.mkdtemp(prefix='resipy-trace-'), typ='R2') # outside the package
+k.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal')
+k.filterUnpaired()
+k.createMesh('quad')
+k.write2in()
+k.write2protocol()
+tracing.disable()
+df = k.timings
+assert {'Project.createSurvey', 'Survey.__init__', 'Project.createMesh',
+        'Mesh.dat', 'Project.write2protocol'}.issubset(df['name'])
+assert 'rows=344' in df.set_index('name').loc['Project.createSurvey', 'sizes']
+k.saveTrace(os.path.join(k.dirname, 'trace.json'))
+k.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal') # not recorded
+assert k.timings.set_index('name').loc['Project.createSurvey', 'calls'] == 1
+tracing.reset()
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['tracing'] = time.time() - t0
+
+
+#%% test runtime and memory predictor
+print('-------------Testing performance model ------------')
+t0 = time.time()
+from resipy import perfmodel
+historyFile = perfmodel.historyFile
+perfmodel.historyFile = os.path.join(tempfile.mkdtemp(prefix='resipy-perf-'), 'performance.json')
+k._estimateMemory(debug=True)
+pred = k.predictPerformance()
+assert pred['runtime'] > 0 and pred['nruns'] == 0
+size = k._problemSize()
+runs = [] # synthetic runs with known coefficients
+for f in [1, 1.5, 2, 3, 4]:
+    r = perfmodel.coarsen(size, factor=f)
+    r.update(runtime=perfmodel.features(r).dot([2, 5, 30]), memory=perfmodel.staticMemory(r)[0]*1.5)
+    runs.append(r)
+coefs, memRatio, nruns = perfmodel.fitModel(2, runs)
+assert np.allclose(coefs, [2, 5, 30]) and np.isclose(memRatio, 1.5)
+rec = perfmodel.recommend(size, 4, 16, memBudget=perfmodel.predict(size)['memory']/2, runs=runs)
+assert rec['fits'] is False and rec['clFactor'] > 1 and rec['refine'] >= 1
+rec = k.recommendSettings(timeBudget=3600)
+assert rec['fits'] and rec['ncores'] == 1
+k.write2in() # size of a run read from its own files
+k.write2protocol()
+runSize, inverse, nsurveys = perfmodel.runSize(k.dirname, k.typ)
+assert runSize['numel'] == size['numel'] and runSize['num_electrodes'] == size['num_electrodes']
+perfmodel.historyFile = historyFile
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['perfmodel'] = time.time() - t0
+
+
+#%% test resolution and covariance diagonals
+print('-------------Testing resolution matrix ------------')
+t0 = time.time()
+from scipy import sparse
+from resipy.resolution import diagonals
+D = sparse.diags([-1, 2, -1], [-1, 0, 1], shape=(100, 100)).tocsr()
+for nmeas in [50, 200]: # Woodbury (sparse) and dense Cholesky paths
+    J = np.random.normal(size=(nmeas, 100))
+    w = np.random.uniform(0.5, 2, nmeas)
+    covar, remat = diagonals(J, w, D, 2.0, blockSize=32,
+                             mmapFile=os.path.join(tempfile.mkdtemp(), 'Z.npy'))
+    S = (J*w[:,None]).T.dot(J*w[:,None])
+    Cm = np.linalg.inv(S + 2*D.toarray())
+    assert np.allclose(covar, np.diag(Cm), rtol=1e-5)
+    assert np.allclose(remat, np.diag(Cm.dot(S)), atol=1e-6)
+from resipy.resolution import estimateDiagonals
+covarEst, rematEst = estimateDiagonals(J, w, D, 2.0, nprobe=200, seed=0) # stochastic
+assert np.median(np.abs(covarEst - covar)/covar) < 0.3
+assert np.median(np.abs(rematEst - remat)) < 0.1
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['resolution'] = time.time() - t0
+
+
+#%% test cache of inversion outputs
+plt.close('all')
+print('-------------Testing result cache ------------')
+t0 = time.time()
+k = Project(typ='R2')
+k.setCache(os.path.join(apiPath, 'invdir', 'cache'), maxSize=100)
+k.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal')
+k.createMesh()
+k.invert()
+t1 = time.time()
+k.invert() # same inputs so outputs are retrieved from the cache
+print('inversion from cache: {:.4}s'.format(time.time() - t1))
+k.showResults()
+k.clearCache()
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['dc-2d-cache'] = time.time() - t0
+
+
+#%% test persistent wineserver
+print('-------------Testing persistent wineserver ------------')
+t0 = time.time()
+from resipy.launcher import launchOverhead
+k = Project(typ='R2')
+if platform.system() != 'Windows' and len(launchOverhead(1)) > 0: # wine installed
+    before = np.mean(launchOverhead())
+    k.setWineServer(delay=60)
+    after = np.mean(launchOverhead())
+    k.setWineServer(False)
+    print('launch overhead: {:.3f}s (cold) vs {:.3f}s (persistent)'.format(before, after))
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['dc-2d-wineserver'] = time.time() - t0
+
+
 #%% test for borehole
 plt.close('all')
 print('-------------Testing borehole------------')
@@ -382,15 +525,78 @@ k.showMesh()
 k.showParam()
 k.fitErrorPwl(-1)
 k.err = True
+k.computeModelError() # forward run for the union of the quadrupoles
+t1 = time.time()
+k.computeModelError() # same mesh and sequence, read from the cache
+print('modelling error from cache: {:.4}s'.format(time.time() - t1))
+assert 'modErr' in k.surveys[2].df.columns
 k.invert(parallel=True)
 df = k.getR2out()
 k.showRMS()
 k.showIter()
 k.showResults(index=1)
 k.showResults(index=2)
+fig, ax = plt.subplots() # switching steps on the same axis updates the artists in place
+k.showResults(index=1, ax=ax, attr='Resistivity(ohm.m)', sens=True)
+coll, ncoll = k.meshResults[1].cax, len(ax.collections)
+k.showResults(index=2, ax=ax, attr='Resistivity(ohm.m)', sens=False)
+assert k.meshResults[2].cax is coll and len(ax.collections) == ncoll
+assert np.allclose(coll.get_array(), k.meshResults[2].df['Resistivity(ohm.m)'])
+from resipy.meshTools import redrawArtists
+redrawArtists(ax)
+fig, ax = plt.subplots() # cells resampled on an image at the axis resolution
+k.showResults(index=2, ax=ax, attr='Resistivity(ohm.m)', raster=True, sens=True)
+fig.canvas.draw()
+assert np.sum(k.meshResults[2].cax.finder.icell >= 0) > 0
+k.showResults(index=2, ax=ax, attr='Resistivity(ohm.m)', raster=True, contour=True)
 k.showInvError()
 k.showPseudoInvError()
 k.saveInvPlots(attr='difference(percent)')
+fnames = k.saveInvPlots(attr='difference(percent)', ncores=2, dpi=50) # frames rendered by 2 processes
+assert len(fnames) == len(k.meshResults) and all([os.path.exists(f) for f in fnames])
+if shutil.which('ffmpeg') is not None:
+    k.saveInvPlots(attr='difference(percent)', movie='timelapse.mp4')
+    assert os.path.exists(os.path.join(k.dirname, 'timelapse.mp4'))
+k.meshResults.maxCache = 1 # steps reloaded from their vtk on access
+k.meshResults[1].df['test'] = 1
+assert 'difference(percent)' in k.meshResults[2].df.columns
+assert 'test' in k.meshResults[1].df.columns
+assert k.meshResults[1].node is k.meshResults[2].node # shared topology
+cube = k.getResultCube('Resistivity(ohm.m)', dirname=os.path.join(k.dirname, 'cube'))
+diff = cube.diffPercent('Resistivity(ohm.m)')
+stats = cube.stats('Resistivity(ohm.m)')
+cube.addToMesh(stats['trend'], 'trend')
+from resipy.meshResults import readDat, datMapping
+assert readDat(os.path.join(k.dirname, 'f001_res.dat')).shape[0] == k.meshResults[1].numel
+vals = readDat(os.path.join(k.dirname, 'f001_res.dat'))
+fvtk = os.path.join(k.dirname, 'f001_res.vtk')
+assert datMapping(fvtk, {'a': vals[:,2]}) == {'a': ('_res.dat', 2)}
+assert datMapping(fvtk, {'a': vals[:,2], 'b': vals[:,2]}) is None # ambiguous, read the vtk
+from resipy.meshResults import checkStep
+ftrunc = os.path.join(k.dirname, 'truncated_res.vtk')
+with open(fvtk, 'r') as f:
+    text = f.read()
+with open(ftrunc, 'w') as f: # cut in the cell attributes
+    f.write(text[:text.find('\nCELL_DATA') + 2000])
+try:
+    checkStep(ftrunc, k.meshResults[1].numel)
+    raise AssertionError('truncated step not detected')
+except ImportError:
+    os.remove(ftrunc)
+step = k.meshResults[2].df['difference(percent)'].values # cropped to the ROI by R2
+assert np.allclose(diff[2][cube.roi], step[cube.roi] if len(step) == len(cube.roi) else step, atol=1e-3)
+# steps cropped to the xz_poly_table are placed in the ROI of the reference
+ref = k.meshResults[0].copy()
+roi = k._getRoi(ref)
+steps = [ref.filterIdx(roi) for i in range(2)]
+for i, m in enumerate(steps):
+    m.df['Resistivity(ohm.m)'] = np.array(ref.df['Resistivity(ohm.m)'])[roi]*(1.1 + 0.1*i)
+meshResults = k.meshResults
+k.meshResults = [ref] + steps
+cube = k.getResultCube('Resistivity(ohm.m)', dirname=tempfile.mkdtemp(prefix='resipy-cube-'))
+assert np.isnan(cube['Resistivity(ohm.m)'][1, ~roi]).all()
+assert np.allclose(cube.diffPercent('Resistivity(ohm.m)', roi=True, chunk=100)[2], 20, atol=1e-2)
+k.meshResults = meshResults
 
 k2 = Project(apiPath + '/invdir/t/')
 k2.loadResults(k.dirname)
@@ -399,6 +605,27 @@ print('elapsed: {:.4}s'.format(time.time() - t0))
 timings['dc-2d-timelapse'] = time.time() - t0
 
 
+#%% test incremental time-lapse from a watched folder
+print('-------------Testing watch folder ------------')
+t0 = time.time()
+import threading
+dropdir = tempfile.mkdtemp(prefix='resipy-watch-')
+def drop(): # new file from the monitoring system
+    time.sleep(1)
+    shutil.copy(testdir + 'dc-2d-timelapse/data/17051601.csv', os.path.join(dropdir, '17051602.csv'))
+threading.Thread(target=drop).start()
+watchFile = os.path.join(tempfile.mkdtemp(), 'watch.resipy')
+log = k.watchFolder(dropdir, poll=0.5, maxFiles=1, timeout=120, projectFile=watchFile)
+assert log[0]['status'] == 'ok' and log[0]['index'] == 3
+assert len(k.meshResults) == 4 and k.meshResults[3].mesh_title == '17051602'
+assert 'difference(percent)' in k.meshResults[3].df.columns
+k2 = Project(typ='R2') # the new step was appended to the project file
+k2.loadProject(watchFile)
+assert len(k2.surveys) == 4 and len(k2.meshResults) == 4
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['watch-folder'] = time.time() - t0
+
+
 #%% test for batch inversion with moving electrodes
 plt.close('all')
 print('-------------Testing Batch Inversion ------------')
@@ -415,17 +642,101 @@ k.filterUnpaired()
 k.createMesh()
 k.fitErrorPwl()
 k.err = True
+sens = k.modelDOI(allSurveys=True, iMoveElec=True) # DOI of all surveys in parallel
+assert len(sens) == len(k.surveys)
 k.invert(parallel=True, iMoveElec=True)
+assert len(k.parallelReport['peakRSS']) == len(k.surveys) - 1 # reference inverted separately
+k.getInvError(ncores=2)
+k.getResults(ncores=2)
 k.showResults(index=0)
 k.showResults(index=1)
 k.showResults(index=2, attr='difference(percent)', color_map='seismic', vmax=200)
 k.saveVtks()
 k.saveData('td')
 shutil.rmtree('td')
+t1 = time.time()
+projectDir = tempfile.mkdtemp(prefix='resipy-project-') # outside of the working directories
+k.saveProject(os.path.join(projectDir, 'batch')) # columnar format
+k2 = Project(tempfile.mkdtemp(prefix='resipy-load-'), typ='R2')
+k2.loadProject(os.path.join(projectDir, 'batch.resipy')) # results read on access
+assert np.allclose(k2.surveys[1].df['recipError'], k.surveys[1].df['recipError'], equal_nan=True)
+assert np.allclose(k2.meshResults[2].df['Resistivity(log10)'], k.meshResults[2].df['Resistivity(log10)'])
+timings['dc-2d-batch-project'] = time.time() - t1
 print('elapsed: {:.4}s'.format(time.time() - t0))
 timings['dc-2d-batch'] = time.time() - t0
 
 
+#%% test asynchronous inversion of several projects
+plt.close('all')
+print('-------------Testing asynchronous inversion ------------')
+t0 = time.time()
+surveysDone = []
+def progress(event, value):
+    if event == 'survey':
+        surveysDone.append(value)
+k1 = Project(tempfile.mkdtemp(prefix='resipy-async1-'), typ='R2') # one working directory each
+k1.createBatchSurvey(testdir + 'dc-2d-timelapse/data')
+k1.createMesh()
+k2 = Project(tempfile.mkdtemp(prefix='resipy-async2-'), typ='R2')
+k2.createSurvey(testdir + 'dc-2d/syscal.csv', ftype='Syscal')
+k2.createMesh()
+f1 = k1.invertAsync(progress=progress, parallel=True)
+f2 = k2.invertAsync()
+f1.result()
+f2.result()
+assert len(surveysDone) == len(k1.surveys)
+k1.showResults(index=1)
+k2.showResults()
+k2.computeModelErrorAsync().result()
+assert 'modErr' in k2.surveys[0].df.columns
+k = Project(tempfile.mkdtemp(prefix='resipy-async3-'), typ='R2')
+k.setElec(np.c_[np.linspace(0,5.75, 24), np.zeros((24, 2))])
+k.createMesh()
+k.addRegion(np.array([[1,0],[2,0],[2,-0.5],[1,-0.5],[1,0]]), 10, -3)
+k.forwardAsync(noise=5).result()
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['dc-2d-async'] = time.time() - t0
+
+
+#%% test command line batch pipeline
+plt.close('all')
+print('-------------Testing batch pipeline ------------')
+t0 = time.time()
+import json
+from resipy.pipeline import runPipeline
+config = {'typ': 'R2', 'workers': 2, 'outputDir': tempfile.mkdtemp(prefix='resipy-pipeline-'),
+          'sites': [{'name': 'dc', 'data': os.path.abspath(testdir + 'dc-2d/syscal.csv')},
+                    {'name': 'topo', 'data': os.path.abspath(testdir + 'dc-2d-topo/syscal.csv')}],
+          'stages': [{'createSurvey': {'fname': '{data}', 'ftype': 'Syscal'}},
+                     'filterUnpaired', 'fitErrorPwl', {'set': {'err': True}},
+                     {'createMesh': {'typ': 'quad'}}, 'invert',
+                     {'saveProject': {'fname': '{outdir}/{name}'}}]}
+report = runPipeline(config)
+assert report['nok'] == 2
+with open(os.path.join(config['outputDir'], 'report.json')) as f:
+    assert [s['name'] for s in json.load(f)['sites'][0]['stages']][-1] == 'saveProject'
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['pipeline'] = time.time() - t0
+
+
+#%% test batch inversion through the job queue with local workers
+plt.close('all')
+print('-------------Testing cluster batch inversion ------------')
+t0 = time.time()
+from resipy.cluster import startLocalWorkers
+k = Project(typ='R2')
+k.createBatchSurvey(testdir + 'dc-2d-timelapse/data')
+k.createMesh()
+queueDir = os.path.join(k.dirname, 'queue')
+workers = startLocalWorkers(queueDir, nworkers=2)
+k.invert(parallel=True, backend='cluster', queueDir=queueDir)
+[w.terminate() for w in workers]
+assert len(k.meshResults) == len(k.surveys)
+k.showResults(index=1)
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['dc-2d-cluster'] = time.time() - t0
+
+
 
 #%% forward modelling
 plt.close('all')
@@ -466,6 +777,14 @@ k.importSequence(k.dirname + '/seq.csv')
 k.createSequence()
     
 k.forward(iplot=True, noise=5)
+
+# batch of random models on the same mesh and sequence
+models = 10**np.random.uniform(1, 2, (6, k.mesh.numel))
+resist = k.forwardBatch(models, ncores=2, outFile=os.path.join(k.dirname, 'batch.npy'))
+assert resist.shape == (6, len(k.sequence))
+assert np.allclose(np.load(os.path.join(k.dirname, 'batch.npy')), resist, equal_nan=True)
+assert not os.path.exists(os.path.join(k.dirname, 'fwdbatch')) # run directories removed
+
 # k.setRefModel([50]*k.mesh.num_elms)
 k.invert()
 
@@ -720,7 +1039,20 @@ k.invertPseudo3D(runParallel=True)
 print('elapsed: {:.4}s'.format(time.time() - t0))
 timings['dc-2d-pseudo3d'] = time.time() - t0
 
-#%% print final summary information 
+#%% benchmarks on synthetic surveys and meshes (see python -m resipy bench)
+print('-------------Testing benchmarks ------------')
+t0 = time.time()
+from resipy.benchmark import runBenchmarks, compareBenchmarks
+benchDir = tempfile.mkdtemp(prefix='resipy-bench-')
+res = runBenchmarks('tiny', repeat=1, outputDir=benchDir)
+assert all([r['error'] is None for r in res['results']])
+df = compareBenchmarks(res['fname'], res)
+assert all(df['ratio'] == 1)
+print('elapsed: {:.4}s'.format(time.time() - t0))
+timings['benchmarks'] = time.time() - t0
+
+
+#%% print final summary information
 for key in timings.keys():
     print('{:s} : {:.2f}s'.format(key, timings[key]))
 print('total time running the test = {:.4f}s'.format(time.time() - tstart))
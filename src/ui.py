@@ -257,7 +257,22 @@ class MatplotlibWidget(QWidget):
         self.figure.axes[0].set_xlim(self.xlim)
         self.figure.axes[0].set_ylim(self.ylim)
 
-    def replot(self, threed=False, aspect=None, **kwargs):
+    def replot(self, threed=False, aspect=None, reuseKeys=None, **kwargs):
+        ''' if only the arguments in `reuseKeys` changed since the last call
+        (e.g. attribute, colour scale or time step), the axis is kept and the
+        mesh artists are updated in place (see `Mesh.show()`) instead of
+        rebuilding the figure
+        '''
+        fixed = (threed, aspect, self.callback, {k: v for k, v in kwargs.items()
+                                                 if reuseKeys is None or k not in reuseKeys})
+        if (reuseKeys is not None and getattr(self, 'lastReplot', None) == fixed
+            and self.axis in self.figure.axes):
+            self.callback(ax=self.axis, **kwargs)
+            if self.xlim0 is not None:
+                self.restoreZoom()
+            redrawArtists(self.axis)
+            return
+        self.lastReplot = fixed if reuseKeys is not None else None
         self.figure.clear()
         if threed is False:
             ax = self.figure.add_subplot(111)
@@ -6983,7 +6998,10 @@ combination of multiple sequence is accepted as well as importing a custom seque
                                          background_color=(0.8,0.8,0.8), cropMaxDepth=self.cropBelowFmd.isChecked())
             else:
                 self.disableOptionsPseudo3D(False)
-                self.mwInv.replot(threed=False, aspect=aspect,
+                # same mesh, only the colours change: update the artists in place
+                reuseKeys = None if contour or doi or doiSens else ['index', 'attr', 'vmin', 'vmax',
+                                                                     'color_map', 'sens', 'sensPrc']
+                self.mwInv.replot(threed=False, aspect=aspect, reuseKeys=reuseKeys,
                                   index=index, edge_color=edge_color,
                                   contour=contour, sens=sens, clipCorners=clipCorners,
                                   attr=attr, vmin=vmin, vmax=vmax, color_map=cmap, 
@@ -7297,8 +7315,12 @@ if __name__ == '__main__':
         pvfound = False
         print('WARNING: pyvista not found, 3D plotting capabilities will be limited.')
     
-    from resipy import Project
+    from resipy import Project, checkExe
+    from resipy.meshTools import redrawArtists
     from resipy.r2help import r2help
+    splash.showMessage("Checking executables", Qt.AlignBottom | Qt.AlignCenter, Qt.black)
+    app.processEvents()
+    checkExe() # download missing or outdated executables
     splash.showMessage("ResIPy is ready!", Qt.AlignBottom | Qt.AlignCenter, Qt.black)
     progressBar.setValue(10)
     app.processEvents()